@@ -66,3 +66,21 @@ class API(object):
         :type host_id: str
         """
         self.manager_rpcapi.delete_computehost(host_id)
+
+    @policy.authorize('oshosts', 'find_window')
+    def find_earliest_window(self, data):
+        """Find the earliest window where a host reservation fits.
+
+        :param data: Reservation characteristics and duration in minutes.
+        :type data: dict
+        """
+        return self.manager_rpcapi.find_earliest_window(data)
+
+    @policy.authorize('oshosts', 'utilization')
+    def get_utilization_report(self, data):
+        """Get the utilization metrics of hosts during a period.
+
+        :param data: Period and optional list of host IDs.
+        :type data: dict
+        """
+        return self.manager_rpcapi.get_utilization_report(data)
@@ -37,6 +37,23 @@ def computehosts_create(data):
     return api_utils.render(host=_api.create_computehost(data))
 
 
+@rest.post('/earliest_window')
+def computehosts_find_earliest_window(data):
+    """Find the earliest window where a host reservation fits."""
+    return api_utils.render(window=_api.find_earliest_window(data))
+
+
+@rest.get('/utilization')
+def computehosts_utilization_report():
+    """Get the utilization metrics of hosts during a period."""
+    args = api_utils.get_request_args()
+    values = args.to_dict()
+    if 'hosts' in args:
+        values['hosts'] = args.getlist('hosts')
+    return api_utils.render(
+        utilization=_api.get_utilization_report(values))
+
+
 @rest.get('/<host_id>')
 @validation.check_exists(_api.get_computehost, host_id='host_id')
 def computehosts_get(host_id):
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 from oslo_log import log as logging
+from oslo_utils import strutils
 
 from blazar import context
 from blazar import exceptions
@@ -42,10 +43,12 @@ class API(object):
         return self.manager_rpcapi.list_leases(project_id=project_id)
 
     @policy.authorize('leases', 'create')
-    @trusts.use_trust_auth()
     def create_lease(self, data):
         """Create new lease.
 
+        If data has a true dry_run value, the lease is only checked and the
+        resources its reservations would get are returned.
+
         :param data: New lease characteristics.
         :type data: dict
         """
@@ -54,6 +57,15 @@ class API(object):
         # two lines
         ctx = context.current()
         data['user_id'] = ctx.user_id
+        if strutils.bool_from_string(data.pop('dry_run', False)):
+            # NOTE: no trust is created for a dry run, the manager needs the
+            # project of the lease instead.
+            data['project_id'] = ctx.project_id
+            return self.manager_rpcapi.create_lease(data, dry_run=True)
+        return self._create_lease(data)
+
+    @trusts.use_trust_auth()
+    def _create_lease(self, data):
         return self.manager_rpcapi.create_lease(data)
 
     @policy.authorize('leases', 'get')
@@ -74,6 +86,7 @@ class API(object):
         :param data: New lease characteristics.
         :type data: dict
         """
+        dry_run = strutils.bool_from_string(data.pop('dry_run', False))
         new_name = data.pop('name', None)
         end_date = data.pop('end_date', None)
         start_date = data.pop('start_date', None)
@@ -89,7 +102,8 @@ class API(object):
             data['end_date'] = end_date
         if start_date:
             data['start_date'] = start_date
-        return self.manager_rpcapi.update_lease(lease_id, data)
+        return self.manager_rpcapi.update_lease(lease_id, data,
+                                                dry_run=dry_run)
 
     @policy.authorize('leases', 'delete')
     def delete_lease(self, lease_id):
@@ -100,6 +114,15 @@ class API(object):
         """
         self.manager_rpcapi.delete_lease(lease_id)
 
+    @policy.authorize('leases', 'statistics')
+    def get_lease_statistics(self, data):
+        """Get statistics on the durations of leases.
+
+        :param data: Optional period and project of the leases.
+        :type data: dict
+        """
+        return self.manager_rpcapi.get_lease_statistics(data)
+
     # Plugins operations
 
     @policy.authorize('plugins', 'get')
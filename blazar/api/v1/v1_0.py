@@ -40,6 +40,13 @@ def leases_create(data):
     return api_utils.render(lease=_api.create_lease(data))
 
 
+@rest.get('/leases/statistics')
+def leases_statistics():
+    """Get statistics on the durations of leases."""
+    return api_utils.render(statistics=_api.get_lease_statistics(
+        api_utils.get_request_args().to_dict()))
+
+
 @rest.get('/leases/<lease_id>')
 @validation.check_exists(_api.get_lease, lease_id='lease_id')
 def leases_get(lease_id):
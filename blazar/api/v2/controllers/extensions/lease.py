@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import pecan
+import six
 from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
@@ -68,6 +69,12 @@ class Lease(base._Base):
     status_reason = wtypes.text
     "A brief description of the status, if any"
 
+    dry_run = bool
+    "Only check the lease and return the resources it would get"
+
+    cost = float
+    "The SUs the reservations of the lease would cost, for dry runs"
+
     @classmethod
     def sample(cls):
         return cls(id=u'2bb8720a-0873-4d97-babf-0d906851a1eb',
@@ -86,6 +93,25 @@ class Lease(base._Base):
                    status_reason=u'Lease currently running',
                    )
 
+    @classmethod
+    def convert(cls, rpc_obj):
+        # NOTE: the number of attempts is the only integer of the events,
+        # their other values are text or None.
+        for event in rpc_obj.get('events') or []:
+            if event.get('attempts') is not None:
+                event['attempts'] = six.text_type(event['attempts'])
+        return super(Lease, cls).convert(rpc_obj)
+
+
+def _convert_preview(lease):
+    """Convert the result of a dry run, whose reservations list hosts."""
+    lease['reservations'] = [
+        dict((key, ','.join(six.text_type(v) for v in value)
+              if isinstance(value, list) else six.text_type(value))
+             for key, value in reservation.items())
+        for reservation in lease.get('reservations', [])]
+    return Lease.convert(lease)
+
 
 class LeasesController(extensions.BaseController):
     """Manages operations on leases."""
@@ -113,15 +139,28 @@ class LeasesController(extensions.BaseController):
 
     @policy.authorize('leases', 'create')
     @wsme_pecan.wsexpose(Lease, body=Lease, status_code=202)
-    @trusts.use_trust_auth()
     def post(self, lease):
         """Creates a new lease.
 
         :param lease: a lease within the request body.
         """
+        if getattr(lease, 'dry_run', False):
+            # NOTE: no trust is created for a dry run, the manager needs the
+            # project of the lease instead.
+            lease_dct = lease.as_dict()
+            lease_dct.pop('dry_run')
+            lease_dct['user_id'] = pecan.request.context.user_id
+            lease_dct['project_id'] = pecan.request.context.project_id
+            return _convert_preview(
+                pecan.request.rpcapi.create_lease(lease_dct, dry_run=True))
+        return self._create(lease)
+
+    @trusts.use_trust_auth()
+    def _create(self, lease):
         # FIXME(sbauza): DB exceptions are currently catched and return a lease
         #                equal to None instead of being sent to the API
         lease_dct = lease.as_dict()
+        lease_dct.pop('dry_run', None)
         lease = pecan.request.rpcapi.create_lease(lease_dct)
         if lease is not None:
             return Lease.convert(lease)
@@ -137,6 +176,7 @@ class LeasesController(extensions.BaseController):
         :param lease: a subset of a Lease containing values to update.
         """
         sublease_dct = sublease.as_dict()
+        dry_run = sublease_dct.pop('dry_run', False)
         new_name = sublease_dct.pop('name', None)
         end_date = sublease_dct.pop('end_date', None)
         start_date = sublease_dct.pop('start_date', None)
@@ -157,10 +197,13 @@ class LeasesController(extensions.BaseController):
         if before_end_date:
             sublease_dct['before_end_date'] = before_end_date
 
-        lease = pecan.request.rpcapi.update_lease(id, sublease_dct)
+        lease = pecan.request.rpcapi.update_lease(id, sublease_dct,
+                                                  dry_run=dry_run)
 
         if lease is None:
             raise exceptions.NotFound(object={'lease_id': id})
+        if dry_run:
+            return _convert_preview(lease)
         return Lease.convert(lease)
 
     @policy.authorize('leases', 'delete')
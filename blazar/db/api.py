@@ -151,6 +151,22 @@ def lease_create(lease_values):
     return IMPL.lease_create(lease_values)
 
 
+def lease_create_batch(lease_values, reservations_values, events_values,
+                       resources_values=None):
+    """Create a lease with all its rows in a single transaction.
+
+    The values are inserted as they are, with their IDs set, and are not
+    read back. The rows of a table must have the same keys.
+
+    :param resources_values: dict of the rows of the plugins to insert by
+        table name, e.g. 'computehost_allocations'.
+    :raises: BlazarDBHostNotFree if a host is already allocated during the
+        lease.
+    """
+    IMPL.lease_create_batch(lease_values, reservations_values,
+                            events_values, resources_values)
+
+
 @to_dict
 def lease_get_all():
     """Return all leases."""
@@ -191,6 +207,19 @@ def lease_update(lease_id, lease_values):
     IMPL.lease_update(lease_id, lease_values)
 
 
+def lease_transition(lease_id, lease_values=None, reservations_values=None,
+                     event_id=None, event_values=None):
+    """Update a lease, its reservations and an event in one transaction.
+
+    Nothing is read back: the reservations sharing the same values are
+    updated by a single statement. Raise if the lease does not exist.
+
+    :param reservations_values: dict of the values to set by reservation id.
+    """
+    IMPL.lease_transition(lease_id, lease_values, reservations_values,
+                          event_id, event_values)
+
+
 # Events
 
 @to_dict
@@ -219,10 +248,10 @@ def event_get_first_sorted_by_filters(sort_key, sort_dir, filters):
 
 
 @to_dict
-def event_get_all_sorted_by_filters(sort_key, sort_dir, filters):
-    """Return instances sorted by param."""
+def event_get_all_sorted_by_filters(sort_key, sort_dir, filters, limit=None):
+    """Return instances sorted by param, at most limit if given."""
     return IMPL.event_get_all_sorted_by_filters(sort_key, sort_dir,
-                                                filters)
+                                                filters, limit=limit)
 
 
 def event_destroy(event_id):
@@ -230,9 +259,32 @@ def event_destroy(event_id):
     IMPL.event_destroy(event_id)
 
 
+@to_dict
 def event_update(event_id, event_values):
     """Update event or raise if not exists."""
-    IMPL.event_update(event_id, event_values)
+    return IMPL.event_update(event_id, event_values)
+
+
+def event_claim(event_ids, owner, expires_at):
+    """Atomically mark the UNDONE events IN_PROGRESS for an owner.
+
+    Return the IDs of the events claimed, the other ones being claimed by
+    another owner already.
+    """
+    return IMPL.event_claim(event_ids, owner, expires_at)
+
+
+def event_renew_claims(owner, expires_at):
+    """Extend the claims of an owner on its IN_PROGRESS events."""
+    return IMPL.event_renew_claims(owner, expires_at)
+
+
+def event_release_expired_claims(now):
+    """Mark UNDONE again the events whose claim expired before now.
+
+    Return the number of events released.
+    """
+    return IMPL.event_release_expired_claims(now)
 
 
 # Host reservations
@@ -303,6 +355,11 @@ def host_allocation_create(allocation_values):
     return IMPL.host_allocation_create(allocation_values)
 
 
+def host_allocation_claim(allocation_values, start_date, end_date):
+    """Create an allocation if its host is free during a period."""
+    return IMPL.host_allocation_claim(allocation_values, start_date, end_date)
+
+
 @to_dict
 def host_allocation_get_all_by_values(**kwargs):
     """Returns all entries filtered by col=value."""
@@ -353,6 +410,19 @@ def host_get_all_by_queries(queries):
     return IMPL.host_get_all_by_queries(queries)
 
 
+def host_get_all_free_in_window(queries, start_date, end_date,
+                                host_ids=None):
+    """Returns hosts matching the queries and free during a period.
+
+    :param host_ids: if not None, only these hosts are considered.
+    :return: a list of tuples (host, allocated), allocated being True if the
+        host has any allocation.
+    """
+    return [(host.to_dict(), allocated) for host, allocated in
+            IMPL.host_get_all_free_in_window(queries, start_date, end_date,
+                                             host_ids=host_ids)]
+
+
 def host_destroy(host_id):
     """Delete specific Compute host."""
     IMPL.host_destroy(host_id)
@@ -382,6 +452,12 @@ def host_extra_capability_get_all_per_host(host_id):
     return IMPL.host_extra_capability_get_all_per_host(host_id)
 
 
+@to_dict
+def host_extra_capability_list():
+    """Return the extra capabilities of all Compute hosts."""
+    return IMPL.host_extra_capability_list()
+
+
 def host_extra_capability_destroy(host_extra_capability_id):
     """Delete specific host ExtraCapability."""
     IMPL.host_extra_capability_destroy(host_extra_capability_id)
@@ -30,6 +30,10 @@ class BlazarDBDuplicateEntry(BlazarDBException):
     msg_fmt = _('Duplicate entry for %(columns)s in %(model)s model was found')
 
 
+class BlazarDBHostNotFree(BlazarDBException):
+    msg_fmt = _('Host %(host)s is already allocated during the period')
+
+
 class BlazarDBNotFound(BlazarDBException):
     msg_fmt = _('%(id)s %(model)s was not found')
 
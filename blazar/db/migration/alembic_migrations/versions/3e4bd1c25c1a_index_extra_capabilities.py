@@ -0,0 +1,39 @@
+# Copyright 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Index extra capabilities by name and host
+
+Revision ID: 3e4bd1c25c1a
+Revises: 57baa245d5a7
+Create Date: 2026-10-16 10:12:41.201733
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3e4bd1c25c1a'
+down_revision = '57baa245d5a7'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_extra_capabilities_name_host',
+                    'computehost_extra_capabilities',
+                    ['capability_name', 'computehost_id'])
+
+
+def downgrade():
+    op.drop_index('ix_extra_capabilities_name_host',
+                  table_name='computehost_extra_capabilities')
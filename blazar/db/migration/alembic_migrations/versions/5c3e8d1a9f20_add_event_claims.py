@@ -0,0 +1,41 @@
+# Copyright 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Add owner and claim expiry to events
+
+Revision ID: 5c3e8d1a9f20
+Revises: b1f2c6d9e4a7
+Create Date: 2026-10-16 15:41:09.220387
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5c3e8d1a9f20'
+down_revision = 'b1f2c6d9e4a7'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('events', sa.Column('owner', sa.String(length=255),
+                                      nullable=True))
+    op.add_column('events', sa.Column('claim_expires_at', sa.DateTime(),
+                                      nullable=True))
+
+
+def downgrade():
+    op.drop_column('events', 'claim_expires_at')
+    op.drop_column('events', 'owner')
@@ -0,0 +1,37 @@
+# Copyright 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Index events by status and time
+
+Revision ID: b1f2c6d9e4a7
+Revises: 3e4bd1c25c1a
+Create Date: 2026-10-16 14:03:27.518204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b1f2c6d9e4a7'
+down_revision = '3e4bd1c25c1a'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_events_status_deleted_time', 'events',
+                    ['status', 'deleted', 'time'])
+
+
+def downgrade():
+    op.drop_index('ix_events_status_deleted_time', table_name='events')
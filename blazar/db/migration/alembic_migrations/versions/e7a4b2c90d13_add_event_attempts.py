@@ -0,0 +1,41 @@
+# Copyright 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Add attempts and next attempt date to events
+
+Revision ID: e7a4b2c90d13
+Revises: 5c3e8d1a9f20
+Create Date: 2026-10-16 17:22:48.903115
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4b2c90d13'
+down_revision = '5c3e8d1a9f20'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('events', sa.Column('attempts', sa.Integer(),
+                                      nullable=False, server_default='0'))
+    op.add_column('events', sa.Column('next_attempt_at', sa.DateTime(),
+                                      nullable=True))
+
+
+def downgrade():
+    op.drop_column('events', 'next_attempt_at')
+    op.drop_column('events', 'attempts')
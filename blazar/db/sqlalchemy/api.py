@@ -15,6 +15,8 @@
 
 """Implementation of SQLAlchemy backend."""
 
+import decimal
+import operator
 import sys
 
 from oslo_config import cfg
@@ -23,6 +25,9 @@ from oslo_db.sqlalchemy import session as db_session
 from oslo_db.sqlalchemy.utils import _read_deleted_filter
 from oslo_log import log as logging
 import sqlalchemy as sa
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import attributes
+from sqlalchemy.sql import expression
 from sqlalchemy.sql.expression import asc
 from sqlalchemy.sql.expression import desc
 
@@ -151,10 +156,31 @@ def reservation_get_all_by_values(**kwargs):
     return reservation_query.all()
 
 
+def _fill_columns(obj):
+    """Set to None the columns of a new object which get no default.
+
+    Once inserted, all the columns of the object are then loaded, and it
+    can be returned without reading it again from the database.
+    """
+    for column in obj.__table__.columns:
+        if (column.key not in obj.__dict__ and column.default is None and
+                column.server_default is None):
+            setattr(obj, column.key, None)
+
+
+def _set_no_resources(reservation):
+    # A new reservation has no resources yet: this avoids lazy loads when
+    # it is converted to a dict.
+    for name in ('instance_reservations', 'computehost_reservations',
+                 'computehost_allocations'):
+        attributes.set_committed_value(reservation, name, None)
+
+
 def reservation_create(values):
     values = values.copy()
     reservation = models.Reservation()
     reservation.update(values)
+    _fill_columns(reservation)
 
     session = get_session()
     with session.begin():
@@ -165,7 +191,8 @@ def reservation_create(values):
             raise db_exc.BlazarDBDuplicateEntry(
                 model=reservation.__class__.__name__, columns=e.columns)
 
-    return reservation_get(reservation.id)
+    _set_no_resources(reservation)
+    return reservation
 
 
 def reservation_update(reservation_id, values):
@@ -176,7 +203,7 @@ def reservation_update(reservation_id, values):
         reservation.update(values)
         reservation.save(session=session)
 
-    return reservation_get(reservation_id)
+    return reservation
 
 
 def reservation_destroy(reservation_id):
@@ -242,6 +269,7 @@ def lease_create(values):
     reservations = values.pop("reservations", [])
     events = values.pop("events", [])
     lease.update(values)
+    _fill_columns(lease)
 
     session = get_session()
     with session.begin():
@@ -252,29 +280,120 @@ def lease_create(values):
             raise db_exc.BlazarDBDuplicateEntry(
                 model=lease.__class__.__name__, columns=e.columns)
 
+        reservation_objects = []
         try:
             for r in reservations:
                 reservation = models.Reservation()
                 reservation.update({"lease_id": lease.id})
                 reservation.update(r)
+                _fill_columns(reservation)
                 reservation.save(session=session)
+                reservation_objects.append(reservation)
         except common_db_exc.DBDuplicateEntry as e:
             # raise exception about duplicated columns (e.columns)
             raise db_exc.BlazarDBDuplicateEntry(
                 model=reservation.__class__.__name__, columns=e.columns)
 
+        event_objects = []
         try:
             for e in events:
                 event = models.Event()
                 event.update({"lease_id": lease.id})
                 event.update(e)
+                _fill_columns(event)
                 event.save(session=session)
+                event_objects.append(event)
         except common_db_exc.DBDuplicateEntry as e:
             # raise exception about duplicated columns (e.columns)
             raise db_exc.BlazarDBDuplicateEntry(
                 model=event.__class__.__name__, columns=e.columns)
 
-    return lease_get(lease.id)
+    for reservation in reservation_objects:
+        _set_no_resources(reservation)
+    attributes.set_committed_value(lease, 'reservations', reservation_objects)
+    attributes.set_committed_value(lease, 'events', event_objects)
+    return lease
+
+
+def _insert_all(session, model, values):
+    """Insert rows with one statement, without reading them back."""
+    if not values:
+        return
+    try:
+        session.execute(model.__table__.insert(), values)
+    except common_db_exc.DBDuplicateEntry as e:
+        # raise exception about duplicated columns (e.columns)
+        raise db_exc.BlazarDBDuplicateEntry(model=model.__name__,
+                                            columns=e.columns)
+
+
+def _check_hosts_free(session, host_ids, start_date, end_date):
+    # The reservations of a lease share its dates, so a host allocated twice
+    # in the batch is allocated twice over the same period
+    seen = set()
+    for host_id in host_ids:
+        if host_id in seen:
+            raise db_exc.BlazarDBHostNotFree(host=host_id)
+        seen.add(host_id)
+
+    # Lock the hosts in the same order as concurrent transactions
+    host_ids = sorted(seen)
+    hosts = (model_query(models.ComputeHost, session)
+             .filter(models.ComputeHost.id.in_(host_ids))
+             .order_by(models.ComputeHost.id)
+             .with_for_update()
+             .all())
+    missing = set(host_ids) - set(host.id for host in hosts)
+    if missing:
+        raise db_exc.BlazarDBNotFound(id=sorted(missing)[0],
+                                      model='ComputeHost')
+
+    allocation = models.ComputeHostAllocation
+    overlapping = (
+        session.query(allocation.compute_host_id)
+        .join(models.Reservation,
+              models.Reservation.id == allocation.reservation_id)
+        .join(models.Lease, models.Lease.id == models.Reservation.lease_id)
+        .filter(allocation.compute_host_id.in_(host_ids),
+                allocation.deleted == '',
+                models.Lease.start_date < end_date,
+                models.Lease.end_date > start_date)
+        .first())
+    if overlapping:
+        raise db_exc.BlazarDBHostNotFree(host=overlapping[0])
+
+
+_RESOURCE_MODELS = (
+    ('computehost_reservations', models.ComputeHostReservation),
+    ('instance_reservations', models.InstanceReservations),
+    ('computehost_allocations', models.ComputeHostAllocation),
+)
+
+
+def lease_create_batch(lease_values, reservations_values, events_values,
+                       resources_values=None):
+    resources_values = resources_values or {}
+    unknown = set(resources_values) - set(name for name, _model
+                                           in _RESOURCE_MODELS)
+    if unknown:
+        raise db_exc.BlazarDBException(
+            _('Unknown resource tables: %s') % sorted(unknown))
+
+    session = get_session()
+    with session.begin():
+        allocations = resources_values.get('computehost_allocations')
+        if allocations:
+            _check_hosts_free(session,
+                              [allocation['compute_host_id']
+                               for allocation in allocations],
+                              lease_values['start_date'],
+                              lease_values['end_date'])
+
+        _insert_all(session, models.Lease, [lease_values])
+        _insert_all(session, models.Reservation, reservations_values)
+        for name, model in _RESOURCE_MODELS:
+            _insert_all(session, model, resources_values.get(name))
+        _insert_all(session, models.Event, events_values)
 
 
 def lease_update(lease_id, values):
@@ -285,7 +404,7 @@ def lease_update(lease_id, values):
         lease.update(values)
         lease.save(session=session)
 
-    return lease_get(lease_id)
+    return lease
 
 
 def lease_destroy(lease_id):
@@ -306,6 +425,36 @@ def lease_destroy(lease_id):
         lease.soft_delete(session=session)
 
 
+def lease_transition(lease_id, lease_values=None, reservations_values=None,
+                     event_id=None, event_values=None):
+    session = get_session()
+
+    with session.begin():
+        if lease_values:
+            updated = (model_query(models.Lease, session)
+                       .filter(models.Lease.id == lease_id)
+                       .update(lease_values, synchronize_session=False))
+            if not updated:
+                raise db_exc.BlazarDBNotFound(id=lease_id, model='Lease')
+
+        # Reservations usually move to the same status together
+        reservation_ids_by_values = {}
+        for reservation_id, values in (reservations_values or {}).items():
+            key = tuple(sorted(values.items()))
+            reservation_ids_by_values.setdefault(key, []).append(
+                reservation_id)
+        for values, reservation_ids in reservation_ids_by_values.items():
+            (model_query(models.Reservation, session)
+             .filter(models.Reservation.lease_id == lease_id)
+             .filter(models.Reservation.id.in_(reservation_ids))
+             .update(dict(values), synchronize_session=False))
+
+        if event_id is not None and event_values:
+            (model_query(models.Event, session)
+             .filter(models.Event.id == event_id)
+             .update(event_values, synchronize_session=False))
+
+
 # Event
 def _event_get(session, event_id):
     query = model_query(models.Event, session)
@@ -326,7 +475,13 @@ def event_get_all():
 
 
 def _event_get_sorted_by_filters(sort_key, sort_dir, filters):
-    """Return an event query filtered and sorted by name of the field."""
+    """Return an event query filtered and sorted by name of the field.
+
+    The 'time' filter is a dict {'op': 'lt', 'le', 'gt' or 'ge',
+    'border': datetime} bounding the time of the events. The
+    'next_attempt_before' filter is a datetime: events to retry are only
+    returned once their next attempt is due.
+    """
 
     sort_fn = {'desc': desc, 'asc': asc}
 
@@ -341,6 +496,24 @@ def _event_get_sorted_by_filters(sort_key, sort_dir, filters):
     if 'event_type' in filters:
         events_query = events_query.filter(models.Event.event_type ==
                                            filters['event_type'])
+    if 'time' in filters:
+        op = filters['time']['op']
+        border = filters['time']['border']
+        if op == 'lt':
+            events_query = events_query.filter(models.Event.time < border)
+        elif op == 'le':
+            events_query = events_query.filter(models.Event.time <= border)
+        elif op == 'gt':
+            events_query = events_query.filter(models.Event.time > border)
+        elif op == 'ge':
+            events_query = events_query.filter(models.Event.time >= border)
+        else:
+            raise db_exc.BlazarDBInvalidFilterOperator(
+                filter_operator=op)
+    if 'next_attempt_before' in filters:
+        events_query = events_query.filter(sa.or_(
+            models.Event.next_attempt_at == sa.null(),
+            models.Event.next_attempt_at <= filters['next_attempt_before']))
 
     events_query = events_query.order_by(
         sort_fn[sort_dir](getattr(models.Event, sort_key))
@@ -359,16 +532,20 @@ def event_get_first_sorted_by_filters(sort_key, sort_dir, filters):
     return _event_get_sorted_by_filters(sort_key, sort_dir, filters).first()
 
 
-def event_get_all_sorted_by_filters(sort_key, sort_dir, filters):
+def event_get_all_sorted_by_filters(sort_key, sort_dir, filters, limit=None):
     """Return events filtered and sorted by name of the field."""
 
-    return _event_get_sorted_by_filters(sort_key, sort_dir, filters).all()
+    events_query = _event_get_sorted_by_filters(sort_key, sort_dir, filters)
+    if limit is not None:
+        events_query = events_query.limit(limit)
+    return events_query.all()
 
 
 def event_create(values):
     values = values.copy()
     event = models.Event()
     event.update(values)
+    _fill_columns(event)
 
     session = get_session()
     with session.begin():
@@ -379,7 +556,7 @@ def event_create(values):
             raise db_exc.BlazarDBDuplicateEntry(
                 model=event.__class__.__name__, columns=e.columns)
 
-    return event_get(event.id)
+    return event
 
 
 def event_update(event_id, values):
@@ -390,7 +567,55 @@ def event_update(event_id, values):
         event.update(values)
         event.save(session=session)
 
-    return event_get(event_id)
+    return event
+
+
+def event_claim(event_ids, owner, expires_at):
+    if not event_ids:
+        return []
+    session = get_session()
+
+    with session.begin():
+        # A single conditional UPDATE: an event claimed by another manager
+        # in the meantime is no longer UNDONE and is left alone.
+        (model_query(models.Event, session)
+         .filter(models.Event.id.in_(event_ids))
+         .filter(models.Event.status == 'UNDONE')
+         .update({'status': 'IN_PROGRESS',
+                  'owner': owner,
+                  'claim_expires_at': expires_at},
+                 synchronize_session=False))
+        query = (session.query(models.Event.id)
+                 .filter(models.Event.id.in_(event_ids))
+                 .filter(models.Event.status == 'IN_PROGRESS')
+                 .filter(models.Event.owner == owner))
+        return [event_id for (event_id,) in query]
+
+
+def event_renew_claims(owner, expires_at):
+    session = get_session()
+
+    with session.begin():
+        return (model_query(models.Event, session)
+                .filter(models.Event.owner == owner)
+                .filter(models.Event.status == 'IN_PROGRESS')
+                .update({'claim_expires_at': expires_at},
+                        synchronize_session=False))
+
+
+def event_release_expired_claims(now):
+    session = get_session()
+
+    with session.begin():
+        # Events set IN_PROGRESS without a claim, e.g. by delete_lease, have
+        # no expiry date and are never released.
+        return (model_query(models.Event, session)
+                .filter(models.Event.status == 'IN_PROGRESS')
+                .filter(models.Event.claim_expires_at < now)
+                .update({'status': 'UNDONE',
+                         'owner': None,
+                         'claim_expires_at': None},
+                        synchronize_session=False))
 
 
 def event_destroy(event_id):
@@ -435,6 +660,7 @@ def host_reservation_create(values):
     values = values.copy()
     host_reservation = models.ComputeHostReservation()
     host_reservation.update(values)
+    _fill_columns(host_reservation)
 
     session = get_session()
     with session.begin():
@@ -445,7 +671,7 @@ def host_reservation_create(values):
             raise db_exc.BlazarDBDuplicateEntry(
                 model=host_reservation.__class__.__name__, columns=e.columns)
 
-    return host_reservation_get(host_reservation.id)
+    return host_reservation
 
 
 def host_reservation_update(host_reservation_id, values):
@@ -457,7 +683,7 @@ def host_reservation_update(host_reservation_id, values):
         host_reservation.update(values)
         host_reservation.save(session=session)
 
-    return host_reservation_get(host_reservation_id)
+    return host_reservation
 
 
 def host_reservation_destroy(host_reservation_id):
@@ -479,6 +705,7 @@ def instance_reservation_create(values):
     value = values.copy()
     instance_reservation = models.InstanceReservations()
     instance_reservation.update(value)
+    _fill_columns(instance_reservation)
 
     session = get_session()
     with session.begin():
@@ -490,7 +717,7 @@ def instance_reservation_create(values):
                 model=instance_reservation.__class__.__name__,
                 columns=e.columns)
 
-    return instance_reservation_get(instance_reservation.id)
+    return instance_reservation
 
 
 def instance_reservation_get(instance_reservation_id, session=None):
@@ -514,7 +741,7 @@ def instance_reservation_update(instance_reservation_id, values):
         instance_reservation.update(values)
         instance_reservation.save(session=session)
 
-    return instance_reservation_get(instance_reservation_id)
+    return instance_reservation
 
 
 def instance_reservation_destroy(instance_reservation_id):
@@ -558,6 +785,7 @@ def host_allocation_create(values):
     values = values.copy()
     host_allocation = models.ComputeHostAllocation()
     host_allocation.update(values)
+    _fill_columns(host_allocation)
 
     session = get_session()
     with session.begin():
@@ -568,7 +796,68 @@ def host_allocation_create(values):
             raise db_exc.BlazarDBDuplicateEntry(
                 model=host_allocation.__class__.__name__, columns=e.columns)
 
-    return host_allocation_get(host_allocation.id)
+    return host_allocation
+
+
+def host_allocation_claim(values, start_date, end_date):
+    """Create an allocation if its host is free during a period.
+
+    The row of the host is locked first with SELECT ... FOR UPDATE, so that
+    concurrent claims of the same host are serialized by the database while
+    claims of different hosts proceed in parallel. The overlap check and the
+    insert are then done in the same transaction. SQLite ignores FOR UPDATE
+    and is only safe with a single blazar-manager process.
+
+    Allocations of the claiming reservation itself are ignored, so that a
+    reservation can claim hosts for its new period when it is updated.
+
+    Only the new allocations of physical host reservations are claimed, two
+    gaps remain:
+
+    * the instance plugin still uses host_allocation_create: its
+      reservations share hosts up to their capacity, which the exclusive
+      overlap check would refuse, so they are only checked by pickup_hosts
+      without the lock;
+    * when the period of a host reservation grows, the hosts it keeps are
+      checked with get_busy_hosts without the lock, and the lease gets its
+      new dates in a later transaction, so a concurrent claim checking them
+      against the old dates may still succeed.
+
+    :raises: BlazarDBHostNotFree if the host has an allocation of another
+        reservation belonging to a lease overlapping [start_date, end_date).
+    """
+    values = values.copy()
+    session = get_session()
+    with session.begin():
+        host = (model_query(models.ComputeHost, session)
+                .filter_by(id=values['compute_host_id'])
+                .with_for_update()
+                .first())
+        if not host:
+            raise db_exc.BlazarDBNotFound(id=values['compute_host_id'],
+                                          model='ComputeHost')
+
+        allocation = models.ComputeHostAllocation
+        overlapping = (
+            session.query(allocation.id)
+            .join(models.Reservation,
+                  models.Reservation.id == allocation.reservation_id)
+            .join(models.Lease, models.Lease.id == models.Reservation.lease_id)
+            .filter(allocation.compute_host_id == host.id,
+                    allocation.deleted == '',
+                    allocation.reservation_id != values['reservation_id'],
+                    models.Lease.start_date < end_date,
+                    models.Lease.end_date > start_date)
+            .first())
+        if overlapping:
+            raise db_exc.BlazarDBHostNotFree(host=host.id)
+
+        host_allocation = models.ComputeHostAllocation()
+        host_allocation.update(values)
+        _fill_columns(host_allocation)
+        host_allocation.save(session=session)
+
+    return host_allocation
 
 
 def host_allocation_update(host_allocation_id, values):
@@ -580,7 +869,7 @@ def host_allocation_update(host_allocation_id, values):
         host_allocation.update(values)
         host_allocation.save(session=session)
 
-    return host_allocation_get(host_allocation_id)
+    return host_allocation
 
 
 def host_allocation_destroy(host_allocation_id, soft_delete=True):
@@ -631,82 +920,220 @@ def host_get_all_by_filters(filters):
     return hosts_query.all()
 
 
-def host_get_all_by_queries(queries):
-    """Returns hosts filtered by an array of queries.
+class _IsNumeric(expression.ColumnElement):
+    """Tells whether a string column holds a decimal number."""
 
-    :param queries: array of queries "key op value" where op can be
-        http://docs.sqlalchemy.org/en/rel_0_7/core/expression_api.html
-            #sqlalchemy.sql.operators.ColumnOperators
+    type = sa.Boolean()
+
+    def __init__(self, column):
+        self.column = column
+
+
+@compiles(_IsNumeric)
+def _is_numeric_default(element, compiler, **kw):
+    # SQLite has no regular expressions, use GLOB patterns instead
+    column = compiler.process(element.column, **kw)
+    unsigned = "ltrim(%s, '+-')" % column
+    return ("(%(u)s GLOB '[0-9]*' AND %(u)s NOT GLOB '*[^0-9.]*' "
+            "AND %(u)s NOT GLOB '*.*.*' AND %(u)s NOT GLOB '*.')"
+            % {'u': unsigned})
 
+
+@compiles(_IsNumeric, 'mysql')
+def _is_numeric_mysql(element, compiler, **kw):
+    return "(%s REGEXP '^[-+]?[0-9]+(\\\\.[0-9]+)?$')" % compiler.process(
+        element.column, **kw)
+
+
+@compiles(_IsNumeric, 'postgresql')
+def _is_numeric_postgresql(element, compiler, **kw):
+    return "(%s ~ '^[-+]?[0-9]+(\\.[0-9]+)?$')" % compiler.process(
+        element.column, **kw)
+
+
+def _to_number(value):
+    try:
+        number = decimal.Decimal(value)
+    except (decimal.InvalidOperation, TypeError):
+        return None
+    return number if number.is_finite() else None
+
+
+def _extra_capability_filter(key, op, value):
+    """Returns a filter on hosts for an extra capability predicate.
+
+    A host matches if it has the extra capability and all its values for it
+    satisfy the predicate. Values are compared as numbers when both operands
+    are numeric, and as strings otherwise.
+    """
+    oper = {
+        '<': operator.lt,
+        '>': operator.gt,
+        '<=': operator.le,
+        '>=': operator.ge,
+        '==': operator.eq,
+        '!=': operator.ne,
+        'in': lambda column, values: column.in_(values),
+    }
+    if op not in oper:
+        msg = 'Operator %s for extra capabilities not implemented'
+        raise NotImplementedError(msg % op)
+
+    capability = models.ComputeHostExtraCapability
+    column = capability.capability_value
+    if op == 'in':
+        values = value.split(',')
+        numbers = [_to_number(v) for v in values]
+        numeric = None not in numbers
+    else:
+        values = value
+        numbers = _to_number(value)
+        numeric = numbers is not None
+
+    cond = oper[op](column, values)
+    if numeric:
+        cond = sa.case(
+            [(_IsNumeric(column),
+              oper[op](sa.cast(column, sa.Numeric(30, 10)), numbers))],
+            else_=cond)
+
+    host_capability = sa.and_(
+        capability.computehost_id == models.ComputeHost.id,
+        capability.capability_name == key,
+        capability.deleted == '')
+    return sa.and_(sa.exists().where(host_capability),
+                   ~sa.exists().where(sa.and_(host_capability, ~cond)))
+
+
+def _host_query_filter(query, extra_capabilities):
+    """Returns the filter on hosts for a query.
+
+    :param query: a "key op value" string, an object with key, op and value
+        attributes, or a group of queries with operator ("and" or "or") and
+        children attributes.
+    :param extra_capabilities: set where the names of the extra
+        capabilities used by the query are added.
     """
-    hosts_query = model_query(models.ComputeHost, get_session())
+    children = getattr(query, 'children', None)
+    if children is not None:
+        combine = sa.or_ if query.operator == 'or' else sa.and_
+        return combine(*[_host_query_filter(child, extra_capabilities)
+                         for child in children])
 
     oper = {
-        '<': ['lt', lambda a, b: a >= b],
-        '>': ['gt', lambda a, b: a <= b],
-        '<=': ['le', lambda a, b: a > b],
-        '>=': ['ge', lambda a, b: a < b],
-        '==': ['eq', lambda a, b: a != b],
-        '!=': ['ne', lambda a, b: a == b],
+        '<': 'lt',
+        '>': 'gt',
+        '<=': 'le',
+        '>=': 'ge',
+        '==': 'eq',
+        '!=': 'ne',
     }
 
-    hosts = []
-    for query in queries:
+    if hasattr(query, 'key'):
+        key, op, value = query.key, query.op, query.value
+    else:
         try:
             key, op, value = query.split(' ', 3)
         except ValueError:
             raise db_exc.BlazarDBInvalidFilter(query_filter=query)
 
-        column = getattr(models.ComputeHost, key, None)
-        if column:
-            if op == 'in':
-                filt = column.in_(value.split(','))
-            else:
-                if op in oper:
-                    op = oper[op][0]
-                try:
-                    attr = filter(lambda e: hasattr(column, e % op),
-                                  ['%s', '%s_', '__%s__'])[0] % op
-                except IndexError:
-                    raise db_exc.BlazarDBInvalidFilterOperator(
-                        filter_operator=op)
+    column = getattr(models.ComputeHost, key, None)
+    if not column:
+        # looking for extra capabilities matches
+        extra_capabilities.add(key)
+        return _extra_capability_filter(key, op, value)
 
-                if value == 'null':
-                    value = None
+    if op == 'in':
+        return column.in_(value.split(','))
 
-                filt = getattr(column, attr)(value)
+    if op in oper:
+        op = oper[op]
+    try:
+        attr = filter(lambda e: hasattr(column, e % op),
+                      ['%s', '%s_', '__%s__'])[0] % op
+    except IndexError:
+        raise db_exc.BlazarDBInvalidFilterOperator(filter_operator=op)
 
-            hosts_query = hosts_query.filter(filt)
-        else:
-            # looking for extra capabilities matches
-            extra_filter = model_query(
-                models.ComputeHostExtraCapability, get_session()
-            ).filter(models.ComputeHostExtraCapability.capability_name == key
-                     ).all()
-            if not extra_filter:
-                raise db_exc.BlazarDBNotFound(
-                    id=key, model='ComputeHostExtraCapability')
-
-            for host in extra_filter:
-                if op in oper and oper[op][1](host.capability_value, value):
-                    hosts.append(host.computehost_id)
-                elif op not in oper:
-                    msg = 'Operator %s for extra capabilities not implemented'
-                    raise NotImplementedError(msg % op)
-
-            # We must also avoid selecting any host which doesn't have the
-            # extra capability present.
-            all_hosts = [h.id for h in hosts_query.all()]
-            extra_filter_hosts = [h.computehost_id for h in extra_filter]
-            hosts += [h for h in all_hosts if h not in extra_filter_hosts]
-
-    return hosts_query.filter(~models.ComputeHost.id.in_(hosts)).all()
+    if value == 'null':
+        value = None
+
+    return getattr(column, attr)(value)
+
+
+def _host_query_by_queries(queries, session=None):
+    """Returns a query of the hosts filtered by an array of queries."""
+    hosts_query = model_query(models.ComputeHost, session)
+
+    extra_capabilities = set()
+    for query in queries:
+        hosts_query = hosts_query.filter(
+            _host_query_filter(query, extra_capabilities))
+
+    if extra_capabilities:
+        capability = models.ComputeHostExtraCapability
+        known = model_query(capability, session).with_entities(
+            capability.capability_name
+        ).filter(capability.capability_name.in_(extra_capabilities)
+                 ).distinct().all()
+        unknown = extra_capabilities - set(name for name, in known)
+        if unknown:
+            raise db_exc.BlazarDBNotFound(
+                id=sorted(unknown)[0], model='ComputeHostExtraCapability')
+
+    return hosts_query
+
+
+def host_get_all_by_queries(queries):
+    """Returns hosts filtered by an array of queries.
+
+    :param queries: array of queries "key op value" where op can be
+        http://docs.sqlalchemy.org/en/rel_0_7/core/expression_api.html
+            #sqlalchemy.sql.operators.ColumnOperators
+        Queries can also be groups of queries combined with "and" or
+        "or", like the Requirements objects of blazar.utils.plugins.
+
+    """
+    return _host_query_by_queries(queries).all()
+
+
+def host_get_all_free_in_window(queries, start_date, end_date,
+                                host_ids=None):
+    """Returns hosts matching the queries and free during a period.
+
+    A host is free if none of its allocations belongs to a lease overlapping
+    [start_date, end_date). The overlap check is done in the same statement
+    as the host filters, with a NOT EXISTS subquery.
+
+    :param host_ids: if not None, only these hosts are considered.
+    :return: a list of tuples (host, allocated), where allocated tells
+        whether the host has any allocation at all.
+    """
+    session = get_session()
+    allocation = models.ComputeHostAllocation
+    host_allocated = sa.and_(
+        allocation.compute_host_id == models.ComputeHost.id,
+        allocation.deleted == '')
+    overlapping = sa.exists().where(sa.and_(
+        host_allocated,
+        models.Reservation.id == allocation.reservation_id,
+        models.Lease.id == models.Reservation.lease_id,
+        models.Lease.start_date < end_date,
+        models.Lease.end_date > start_date))
+    allocated = sa.exists().where(host_allocated)
+
+    hosts_query = (_host_query_by_queries(queries, session)
+                   .add_columns(allocated.label('allocated'))
+                   .filter(~overlapping))
+    if host_ids is not None:
+        hosts_query = hosts_query.filter(models.ComputeHost.id.in_(host_ids))
+    return [(host, bool(is_allocated)) for host, is_allocated in hosts_query]
 
 
 def host_create(values):
     values = values.copy()
     host = models.ComputeHost()
     host.update(values)
+    _fill_columns(host)
 
     session = get_session()
     with session.begin():
@@ -717,7 +1144,7 @@ def host_create(values):
             raise db_exc.BlazarDBDuplicateEntry(
                 model=host.__class__.__name__, columns=e.columns)
 
-    return host_get(host.id)
+    return host
 
 
 def host_update(host_id, values):
@@ -728,7 +1155,7 @@ def host_update(host_id, values):
         host.update(values)
         host.save(session=session)
 
-    return host_get(host_id)
+    return host
 
 
 def host_destroy(host_id):
@@ -764,10 +1191,15 @@ def host_extra_capability_get_all_per_host(host_id):
                                                    host_id).all()
 
 
+def host_extra_capability_list():
+    return model_query(models.ComputeHostExtraCapability, get_session()).all()
+
+
 def host_extra_capability_create(values):
     values = values.copy()
     host_extra_capability = models.ComputeHostExtraCapability()
     host_extra_capability.update(values)
+    _fill_columns(host_extra_capability)
 
     session = get_session()
     with session.begin():
@@ -779,7 +1211,7 @@ def host_extra_capability_create(values):
                 model=host_extra_capability.__class__.__name__,
                 columns=e.columns)
 
-    return host_extra_capability_get(host_extra_capability.id)
+    return host_extra_capability
 
 
 def host_extra_capability_update(host_extra_capability_id, values):
@@ -792,7 +1224,7 @@ def host_extra_capability_update(host_extra_capability_id, values):
         host_extra_capability.update(values)
         host_extra_capability.save(session=session)
 
-    return host_extra_capability_get(host_extra_capability_id)
+    return host_extra_capability
 
 
 def host_extra_capability_destroy(host_extra_capability_id):
@@ -132,12 +132,23 @@ class Event(mb.BlazarBase):
     """An events occurring with the lease."""
 
     __tablename__ = 'events'
+    __table_args__ = (
+        sa.Index('ix_events_status_deleted_time', 'status', 'deleted',
+                 'time'),
+    )
 
     id = _id_column()
     lease_id = sa.Column(sa.String(36), sa.ForeignKey('leases.id'))
     event_type = sa.Column(sa.String(66))
     time = sa.Column(sa.DateTime)
     status = sa.Column(sa.String(13))
+    # Manager process executing the event, while it is IN_PROGRESS
+    owner = sa.Column(sa.String(255))
+    claim_expires_at = sa.Column(sa.DateTime)
+    # Failed executions, the event being retried from next_attempt_at
+    attempts = sa.Column(sa.Integer, nullable=False, default=0,
+                         server_default='0')
+    next_attempt_at = sa.Column(sa.DateTime)
 
     def to_dict(self):
         return super(Event, self).to_dict()
@@ -234,6 +245,10 @@ class ComputeHostExtraCapability(mb.BlazarBase):
     """
 
     __tablename__ = 'computehost_extra_capabilities'
+    __table_args__ = (
+        sa.Index('ix_extra_capabilities_name_host', 'capability_name',
+                 'computehost_id'),
+    )
 
     id = _id_column()
     computehost_id = sa.Column(sa.String(36), sa.ForeignKey('computehosts.id'))
@@ -14,10 +14,16 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import datetime
+import itertools
+import math
 import sys
 
+import six
 import sqlalchemy as sa
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import expression
 
 from blazar.db.sqlalchemy import facade_wrapper
 from blazar.db.sqlalchemy import models
@@ -50,10 +56,13 @@ def _get_leases_from_host_id(host_id, start_date, end_date):
                       models.Lease.end_date < start_date)
     border1 = sa.and_(models.Lease.start_date > end_date,
                       models.Lease.end_date > end_date)
+    # The allocations of the leases which ended are deleted, they are
+    # counted like in longest_lease and shortest_lease, unlike the leases
+    # which were deleted
     query = (session.query(models.Lease).join(models.Reservation)
              .join(models.ComputeHostAllocation)
              .filter(models.ComputeHostAllocation.compute_host_id == host_id)
-             .filter(models.ComputeHostAllocation.deleted == '')
+             .filter(models.Lease.deleted == '')
              .filter(~sa.or_(border0, border1)))
     for lease in query:
         yield lease
@@ -72,12 +81,203 @@ def get_reservations_by_host_id(host_id, start_date, end_date):
     return query.all()
 
 
-def get_free_periods(resource_id, start_date, end_date, duration):
-    """Returns a list of free periods."""
-    full_periods = get_full_periods(resource_id,
-                                    start_date,
-                                    end_date,
-                                    duration)
+def get_reservations_by_host_ids(host_ids, start_date, end_date):
+    """Returns the reservations of several hosts overlapping a period.
+
+    :return: a dict mapping the host IDs to lists of reservations, hosts
+        without any reservation during the period being omitted.
+    """
+    if not host_ids:
+        return {}
+    session = get_session()
+    border0 = sa.and_(models.Lease.start_date < start_date,
+                      models.Lease.end_date < start_date)
+    border1 = sa.and_(models.Lease.start_date > end_date,
+                      models.Lease.end_date > end_date)
+    query = (session.query(models.ComputeHostAllocation.compute_host_id,
+                           models.Reservation)
+             .select_from(models.ComputeHostAllocation)
+             .join(models.Reservation,
+                   models.Reservation.id ==
+                   models.ComputeHostAllocation.reservation_id)
+             .join(models.Lease,
+                   models.Lease.id == models.Reservation.lease_id)
+             .filter(models.ComputeHostAllocation.compute_host_id.in_(
+                 host_ids))
+             .filter(~sa.or_(border0, border1)))
+    reservations = collections.defaultdict(list)
+    for host_id, reservation in query:
+        reservations[host_id].append(reservation)
+    return dict(reservations)
+
+
+def get_instance_usage_events_by_host(host_ids, start_date, end_date):
+    """Returns the start and end events of instance reservations per host.
+
+    Only the reservations allocating one of the hosts and overlapping the
+    period are considered. Every event is a dict with the event_type and time
+    of the lease event and the vcpus, memory_mb and disk_gb of the instance
+    reservation.
+
+    :return: a dict mapping the host IDs to lists of events, hosts without
+        any instance reservation during the period being omitted.
+    """
+    if not host_ids:
+        return {}
+    session = get_session()
+    border0 = sa.and_(models.Lease.start_date < start_date,
+                      models.Lease.end_date < start_date)
+    border1 = sa.and_(models.Lease.start_date > end_date,
+                      models.Lease.end_date > end_date)
+    query = (session.query(models.ComputeHostAllocation.compute_host_id,
+                           models.Reservation.id,
+                           models.Event.id,
+                           models.Event.event_type,
+                           models.Event.time,
+                           models.InstanceReservations.vcpus,
+                           models.InstanceReservations.memory_mb,
+                           models.InstanceReservations.disk_gb)
+             .select_from(models.ComputeHostAllocation)
+             .join(models.Reservation,
+                   models.Reservation.id ==
+                   models.ComputeHostAllocation.reservation_id)
+             .join(models.Lease,
+                   models.Lease.id == models.Reservation.lease_id)
+             .join(models.InstanceReservations,
+                   models.InstanceReservations.reservation_id ==
+                   models.Reservation.id)
+             .join(models.Event, models.Event.lease_id == models.Lease.id)
+             .filter(models.ComputeHostAllocation.compute_host_id.in_(
+                 host_ids))
+             .filter(~sa.or_(border0, border1))
+             .filter(models.Event.event_type.in_(['start_lease',
+                                                  'end_lease']))
+             .filter(models.Event.deleted == '')
+             .distinct())
+    events = collections.defaultdict(list)
+    for (host_id, _reservation_id, _event_id, event_type, time, vcpus,
+         memory_mb, disk_gb) in query:
+        events[host_id].append({'event_type': event_type,
+                                'time': time,
+                                'vcpus': vcpus,
+                                'memory_mb': memory_mb,
+                                'disk_gb': disk_gb})
+    return dict(events)
+
+
+def get_host_allocation_periods():
+    """Returns the reserved period of every current host allocation.
+
+    Each item is a tuple (allocation_id, host_id, reservation_id, start_date,
+    end_date), the dates being the ones of the lease owning the allocation.
+    """
+    session = get_session()
+    query = (session.query(models.ComputeHostAllocation.id,
+                           models.ComputeHostAllocation.compute_host_id,
+                           models.ComputeHostAllocation.reservation_id,
+                           models.Lease.start_date,
+                           models.Lease.end_date)
+             .join(models.Reservation,
+                   models.Reservation.id ==
+                   models.ComputeHostAllocation.reservation_id)
+             .join(models.Lease,
+                   models.Lease.id == models.Reservation.lease_id)
+             .filter(models.ComputeHostAllocation.deleted == ''))
+    return [tuple(row) for row in query]
+
+
+def get_host_allocation_changes(since):
+    """Returns the host allocations changed after a date.
+
+    An allocation has changed if it, its reservation or its lease has been
+    created, updated or deleted after the date. Each item is a tuple
+    (allocation_id, host_id, reservation_id, start_date, end_date, deleted).
+    """
+    session = get_session()
+    changed = sa.or_(*[column > since for column in (
+        models.ComputeHostAllocation.created_at,
+        models.ComputeHostAllocation.updated_at,
+        models.ComputeHostAllocation.deleted_at,
+        models.Reservation.updated_at,
+        models.Lease.updated_at)])
+    query = (session.query(models.ComputeHostAllocation.id,
+                           models.ComputeHostAllocation.compute_host_id,
+                           models.ComputeHostAllocation.reservation_id,
+                           models.Lease.start_date,
+                           models.Lease.end_date,
+                           models.ComputeHostAllocation.deleted)
+             .join(models.Reservation,
+                   models.Reservation.id ==
+                   models.ComputeHostAllocation.reservation_id)
+             .join(models.Lease,
+                   models.Lease.id == models.Reservation.lease_id)
+             .filter(changed))
+    return [tuple(row[:5]) + (row[5] != '',) for row in query]
+
+
+def get_host_allocation_ids():
+    """Returns the IDs of all the current host allocations."""
+    session = get_session()
+    query = (session.query(models.ComputeHostAllocation.id)
+             .filter(models.ComputeHostAllocation.deleted == ''))
+    return [allocation_id for (allocation_id,) in query]
+
+
+def get_host_ids_by_lease(lease_ids):
+    """Returns the hosts allocated to the reservations of several leases.
+
+    :return: a dict mapping the lease IDs to sets of host IDs. Leases
+        without any host allocation are omitted.
+    """
+    if not lease_ids:
+        return {}
+    session = get_session()
+    query = (session.query(models.Reservation.lease_id,
+                           models.ComputeHostAllocation.compute_host_id)
+             .join(models.ComputeHostAllocation,
+                   models.Reservation.id ==
+                   models.ComputeHostAllocation.reservation_id)
+             .filter(models.ComputeHostAllocation.deleted == '')
+             .filter(models.Reservation.lease_id.in_(lease_ids)))
+    host_ids_by_lease = collections.defaultdict(set)
+    for lease_id, host_id in query:
+        host_ids_by_lease[lease_id].add(host_id)
+    return dict(host_ids_by_lease)
+
+
+def get_adjacent_allocations_by_host(host_ids, start_date, end_date):
+    """Returns the allocations of several hosts just around a period.
+
+    All the hosts are handled with a single aggregate query.
+
+    :return: a dict mapping the host IDs to tuples (previous_end,
+        next_start): the latest end date of the leases allocating the host
+        and ending at or before start_date, and the earliest start date of
+        the ones starting at or after end_date. Both are None when there is
+        no such lease. Hosts without any allocation are omitted.
+    """
+    session = get_session()
+    previous_end = sa.func.max(sa.case([(models.Lease.end_date <= start_date,
+                                         models.Lease.end_date)]))
+    next_start = sa.func.min(sa.case([(models.Lease.start_date >= end_date,
+                                       models.Lease.start_date)]))
+    query = (session.query(models.ComputeHostAllocation.compute_host_id,
+                           previous_end, next_start)
+             .join(models.Reservation,
+                   models.Reservation.id ==
+                   models.ComputeHostAllocation.reservation_id)
+             .join(models.Lease,
+                   models.Lease.id == models.Reservation.lease_id)
+             .filter(models.ComputeHostAllocation.deleted == '')
+             .filter(models.ComputeHostAllocation.compute_host_id.in_(
+                 host_ids))
+             .group_by(models.ComputeHostAllocation.compute_host_id))
+    return dict((host_id, (previous_end, next_start))
+                for host_id, previous_end, next_start in query)
+
+
+def _free_periods(full_periods, start_date, end_date, duration):
+    """Returns the free periods between some full periods."""
     free_periods = []
     previous = (start_date, start_date)
     if len(full_periods) >= 1:
@@ -94,40 +294,93 @@ def get_free_periods(resource_id, start_date, end_date, duration):
     return free_periods
 
 
-def _get_events(host_id, start_date, end_date):
-    """Create a list of events."""
-    events = {}
-    for lease in _get_leases_from_host_id(host_id, start_date, end_date):
-        if lease.start_date < start_date:
-            min_date = start_date
-        else:
-            min_date = lease.start_date
-        if lease.end_date > end_date:
-            max_date = end_date
-        else:
-            max_date = lease.end_date
-        if min_date in events.keys():
-            events[min_date]['quantity'] += 1
-        else:
-            events[min_date] = {'quantity': 1}
-        if max_date in events.keys():
-            events[max_date]['quantity'] -= 1
-        else:
-            events[max_date] = {'quantity': -1}
+def get_free_periods_by_host(host_ids, start_date, end_date, duration):
+    """Returns the free periods of several hosts.
+
+    :param host_ids: list of host IDs, or None for every host.
+    :return: a dict mapping the host IDs to lists of free periods. When
+        host_ids is None, hosts which never had an allocation are omitted.
+    """
+    return dict(
+        (host_id, _free_periods(full_periods, start_date, end_date, duration))
+        for host_id, full_periods in six.iteritems(get_full_periods_by_host(
+            host_ids, start_date, end_date, duration)))
+
+
+def get_free_periods(resource_id, start_date, end_date, duration):
+    """Returns a list of free periods."""
+    return get_free_periods_by_host([resource_id], start_date, end_date,
+                                    duration)[resource_id]
+
+
+def _get_host_events(host_ids, start_date, end_date):
+    """Returns the events of the hosts, sorted by host and date.
+
+    Every lease allocating a host and overlapping the period gives one event
+    (host_id, date, 1) at its start and one event (host_id, date, -1) at its
+    end, both dates being clipped to the period. All the hosts are loaded
+    with a single query.
+    """
+    session = get_session()
+    border0 = sa.and_(models.Lease.start_date < start_date,
+                      models.Lease.end_date < start_date)
+    border1 = sa.and_(models.Lease.start_date > end_date,
+                      models.Lease.end_date > end_date)
+    query = (session.query(models.ComputeHostAllocation.compute_host_id,
+                           models.Lease.id,
+                           models.Lease.start_date,
+                           models.Lease.end_date)
+             .select_from(models.ComputeHostAllocation)
+             .join(models.Reservation,
+                   models.Reservation.id ==
+                   models.ComputeHostAllocation.reservation_id)
+             .join(models.Lease,
+                   models.Lease.id == models.Reservation.lease_id)
+             .filter(models.ComputeHostAllocation.deleted == '')
+             .filter(~sa.or_(border0, border1))
+             .distinct())
+    if host_ids is not None:
+        query = query.filter(
+            models.ComputeHostAllocation.compute_host_id.in_(host_ids))
+
+    events = []
+    for host_id, _lease_id, lease_start, lease_end in query:
+        events.append((host_id, max(lease_start, start_date), 1))
+        events.append((host_id, min(lease_end, end_date), -1))
+    events.sort()
     return events
 
 
-def _find_full_periods(events, quantity, capacity):
-    """Find the full periods."""
-    full_periods = []
+def _sweep_full_periods(events):
+    """Find the full periods of several hosts in one pass.
+
+    :param events: events sorted by host and date, as returned by
+        _get_host_events.
+    :return: a dict mapping the host IDs to their full periods.
+    """
+    full_periods = {}
+    host_id = None
     used = 0
     full_start = None
-    for event_date in sorted(events):
-        used += events[event_date]['quantity']
-        if not full_start and used + quantity > capacity:
+    index = 0
+    while index < len(events):
+        event_host, event_date, quantity = events[index]
+        index += 1
+        # Events happening at the same date are applied at once
+        while (index < len(events) and events[index][0] == event_host and
+               events[index][1] == event_date):
+            quantity += events[index][2]
+            index += 1
+        if event_host != host_id:
+            host_id = event_host
+            used = 0
+            full_start = None
+            periods = full_periods.setdefault(host_id, [])
+        used += quantity
+        if full_start is None and used > 0:
             full_start = event_date
-        elif full_start and used + quantity <= capacity:
-            full_periods.append((full_start, event_date))
+        elif full_start is not None and used <= 0:
+            periods.append((full_start, event_date))
             full_start = None
     return full_periods
 
@@ -158,20 +411,38 @@ def _merge_periods(full_periods, start_date, end_date, duration):
     return merged_full_periods
 
 
+def get_full_periods_by_host(host_ids, start_date, end_date, duration):
+    """Returns the full periods of several hosts.
+
+    :param host_ids: list of host IDs, or None for every host.
+    :return: a dict mapping the host IDs to lists of full periods. When
+        host_ids is None, hosts which never had an allocation are omitted.
+    """
+    if host_ids is not None and (not host_ids or
+                                 end_date - start_date < duration):
+        return dict((host_id, [(start_date, end_date)])
+                    for host_id in host_ids)
+    full_periods = _sweep_full_periods(
+        _get_host_events(host_ids, start_date, end_date))
+    if end_date - start_date < duration:
+        return dict((host_id, [(start_date, end_date)])
+                    for host_id in full_periods)
+    for host_id in host_ids or []:
+        full_periods.setdefault(host_id, [])
+    return dict(
+        (host_id, _merge_periods(periods, start_date, end_date, duration))
+        for host_id, periods in six.iteritems(full_periods))
+
+
 def get_full_periods(host_id, start_date, end_date, duration):
     """Returns a list of full periods."""
-    capacity = 1  # The resource status is binary (empty or full)
-    quantity = 1  # One reservation per host at the same time
-    if end_date - start_date < duration:
-        return [(start_date, end_date)]
-    events = _get_events(host_id, start_date, end_date)
-    full_periods = _find_full_periods(events, quantity, capacity)
-    return _merge_periods(full_periods, start_date, end_date, duration)
+    return get_full_periods_by_host([host_id], start_date, end_date,
+                                    duration)[host_id]
 
 
 def reservation_ratio(host_id, start_date, end_date):
-    res_time = reservation_time(host_id, start_date, end_date).seconds
-    return float(res_time) / (end_date - start_date).seconds
+    res_time = reservation_time(host_id, start_date, end_date)
+    return res_time.total_seconds() / (end_date - start_date).total_seconds()
 
 
 def availability_time(host_id, start_date, end_date):
@@ -195,36 +466,194 @@ def number_of_reservations(host_id, start_date, end_date):
                _get_leases_from_host_id(host_id, start_date, end_date))
 
 
-def longest_lease(host_id, start_date, end_date):
-    max_duration = datetime.timedelta(0)
-    longest_lease = None
+class _SecondsBetween(expression.FunctionElement):
+    """Number of seconds between two dates, computed by the database."""
+
+    type = sa.Integer()
+    name = 'seconds_between'
+
+
+@compiles(_SecondsBetween)
+def _seconds_between_default(element, compiler, **kw):
+    start, end = [compiler.process(clause, **kw)
+                  for clause in element.clauses]
+    return ("CAST(ROUND((julianday(%s) - julianday(%s)) * 86400) "
+            "AS INTEGER)" % (end, start))
+
+
+@compiles(_SecondsBetween, 'mysql')
+def _seconds_between_mysql(element, compiler, **kw):
+    start, end = [compiler.process(clause, **kw)
+                  for clause in element.clauses]
+    return "TIMESTAMPDIFF(SECOND, %s, %s)" % (start, end)
+
+
+@compiles(_SecondsBetween, 'postgresql')
+def _seconds_between_postgresql(element, compiler, **kw):
+    start, end = [compiler.process(clause, **kw)
+                  for clause in element.clauses]
+    return "CAST(EXTRACT(EPOCH FROM (%s - %s)) AS BIGINT)" % (end, start)
+
+
+def _lease_duration():
+    return _SecondsBetween(models.Lease.start_date, models.Lease.end_date)
+
+
+def _host_lease_by_duration(host_id, start_date, end_date, order):
     session = get_session()
-    query = (session.query(models.Lease).join(models.Reservation)
+    query = (session.query(models.Lease.id).join(models.Reservation)
              .join(models.ComputeHostAllocation)
              .filter(models.ComputeHostAllocation.compute_host_id == host_id)
+             .filter(models.Lease.deleted == '')
              .filter(models.Lease.start_date >= start_date)
-             .filter(models.Lease.end_date <= end_date))
-    for lease in query:
-        duration = lease.end_date - lease.start_date
-        if max_duration < duration:
-            max_duration = duration
-            longest_lease = lease.id
-    return longest_lease
+             .filter(models.Lease.end_date <= end_date)
+             .order_by(order(_lease_duration()), models.Lease.start_date)
+             .limit(1))
+    lease = query.first()
+    return lease and lease[0]
+
+
+def longest_lease(host_id, start_date, end_date):
+    return _host_lease_by_duration(host_id, start_date, end_date, sa.desc)
 
 
 def shortest_lease(host_id, start_date, end_date):
-    # TODO(frossigneux) Fix max timedelta
-    min_duration = datetime.timedelta(365 * 1000)
-    longest_lease = None
+    return _host_lease_by_duration(host_id, start_date, end_date, sa.asc)
+
+
+def _duration_statistics(count, total, minimum, maximum):
+    return {
+        'count': count,
+        'mean_duration': float(total) / count if count else None,
+        'min_duration': minimum,
+        'max_duration': maximum,
+    }
+
+
+def get_lease_statistics(start_date=None, end_date=None, project_id=None,
+                         percentiles=(50, 95)):
+    """Returns statistics on the durations of leases, in seconds.
+
+    Durations are computed by the database. The count, mean, min and max
+    durations of the leases of every project are computed with a single
+    aggregate query, and each percentile with a query reading one row.
+
+    :param start_date: if set, only the leases starting at or after it.
+    :param end_date: if set, only the leases ending at or before it.
+    :param project_id: if set, only the leases of this project.
+    :return: a dict with the count, mean_duration, min_duration,
+        max_duration and p<N>_duration of all the leases, and the count,
+        mean_duration, min_duration and max_duration of the leases of each
+        project under 'projects'.
+    """
     session = get_session()
-    query = (session.query(models.Lease).join(models.Reservation)
-             .join(models.ComputeHostAllocation)
-             .filter(models.ComputeHostAllocation.compute_host_id == host_id)
-             .filter(models.Lease.start_date >= start_date)
-             .filter(models.Lease.end_date <= end_date))
-    for lease in query:
-        duration = lease.end_date - lease.start_date
-        if min_duration > duration:
-            min_duration = duration
-            longest_lease = lease.id
-    return longest_lease
+    duration = _lease_duration()
+    filters = [models.Lease.deleted == '']
+    if start_date is not None:
+        filters.append(models.Lease.start_date >= start_date)
+    if end_date is not None:
+        filters.append(models.Lease.end_date <= end_date)
+    if project_id is not None:
+        filters.append(models.Lease.project_id == project_id)
+
+    query = (session.query(models.Lease.project_id,
+                           sa.func.count(models.Lease.id),
+                           sa.func.sum(duration),
+                           sa.func.min(duration),
+                           sa.func.max(duration))
+             .filter(*filters)
+             .group_by(models.Lease.project_id))
+    projects = {}
+    for project, count, total, minimum, maximum in query:
+        projects[project] = _duration_statistics(count, total, minimum,
+                                                 maximum)
+
+    count = sum(p['count'] for p in six.itervalues(projects))
+    statistics = _duration_statistics(
+        count,
+        sum(p['mean_duration'] * p['count']
+            for p in six.itervalues(projects)),
+        min([p['min_duration'] for p in six.itervalues(projects)] or [None]),
+        max([p['max_duration'] for p in six.itervalues(projects)] or [None]))
+    for percentile in percentiles:
+        value = None
+        if count:
+            # Nearest-rank percentile
+            rank = max(int(math.ceil(percentile / 100.0 * count)), 1)
+            value = (session.query(duration).filter(*filters)
+                     .order_by(duration).offset(rank - 1).limit(1).scalar())
+        statistics['p%d_duration' % percentile] = value
+    statistics['projects'] = projects
+    return statistics
+
+
+def _host_utilization(host_id, leases, start_date, end_date):
+    """Returns the utilization metrics of a host from its leases."""
+    res_time = datetime.timedelta(0)
+    longest = shortest = None
+    for lease_id, lease_start, lease_end in leases:
+        res_time += min(lease_end, end_date) - max(lease_start, start_date)
+        # Only the leases within the period are candidates for the longest
+        # and shortest ones
+        if lease_start >= start_date and lease_end <= end_date:
+            duration = lease_end - lease_start
+            if longest is None or duration > longest[1]:
+                longest = (lease_id, duration)
+            if shortest is None or duration < shortest[1]:
+                shortest = (lease_id, duration)
+    period = end_date - start_date
+    return {
+        'host_id': host_id,
+        'reservation_time': res_time.total_seconds(),
+        'availability_time': (period - res_time).total_seconds(),
+        'reservation_ratio': res_time.total_seconds() / period.total_seconds(),
+        'number_of_reservations': len(leases),
+        'longest_lease': longest and longest[0],
+        'shortest_lease': shortest and shortest[0],
+    }
+
+
+def get_host_utilization(host_ids, start_date, end_date, batch_size=1000):
+    """Yields the utilization metrics of hosts during a period.
+
+    The leases of all the hosts are read with a single query ordered by
+    host, batch_size rows at a time, so that the metrics of every host are
+    computed in one pass. The metrics are the ones of reservation_time,
+    availability_time (both in seconds), reservation_ratio,
+    number_of_reservations, longest_lease and shortest_lease, over the same
+    leases, including the ended ones but not the deleted ones.
+
+    :param host_ids: list of host IDs, or None for every host.
+    :return: an iterator of dicts, one per host, ordered by host ID.
+    """
+    session = get_session()
+    border0 = sa.and_(models.Lease.start_date < start_date,
+                      models.Lease.end_date < start_date)
+    border1 = sa.and_(models.Lease.start_date > end_date,
+                      models.Lease.end_date > end_date)
+    leases = (session.query(
+        models.ComputeHostAllocation.compute_host_id.label('host_id'),
+        models.Lease.id.label('lease_id'),
+        models.Lease.start_date.label('start_date'),
+        models.Lease.end_date.label('end_date'))
+        .join(models.Reservation,
+              models.Reservation.id ==
+              models.ComputeHostAllocation.reservation_id)
+        .join(models.Lease,
+              models.Lease.id == models.Reservation.lease_id)
+        .filter(models.Lease.deleted == '')
+        .filter(~sa.or_(border0, border1))
+        .distinct()
+        .subquery())
+    query = (session.query(models.ComputeHost.id, leases.c.lease_id,
+                           leases.c.start_date, leases.c.end_date)
+             .outerjoin(leases, leases.c.host_id == models.ComputeHost.id)
+             .filter(models.ComputeHost.deleted == ''))
+    if host_ids is not None:
+        query = query.filter(models.ComputeHost.id.in_(host_ids))
+    query = (query.order_by(models.ComputeHost.id, leases.c.start_date)
+             .yield_per(batch_size))
+
+    for host_id, rows in itertools.groupby(query, lambda row: row[0]):
+        host_leases = [tuple(row[1:]) for row in rows if row[1] is not None]
+        yield _host_utilization(host_id, host_leases, start_date, end_date)
@@ -107,6 +107,43 @@ def get_reservations_by_host_id(host_id, start_date, end_date):
     return IMPL.get_reservations_by_host_id(host_id, start_date, end_date)
 
 
+def get_reservations_by_host_ids(host_ids, start_date, end_date):
+    """Returns the reservations of several hosts overlapping a period."""
+    return IMPL.get_reservations_by_host_ids(host_ids, start_date, end_date)
+
+
+def get_instance_usage_events_by_host(host_ids, start_date, end_date):
+    """Returns the events of the instance reservations of several hosts."""
+    return IMPL.get_instance_usage_events_by_host(host_ids, start_date,
+                                                  end_date)
+
+
+def get_host_allocation_periods():
+    """Returns the reserved period of every current host allocation."""
+    return IMPL.get_host_allocation_periods()
+
+
+def get_host_allocation_changes(since):
+    """Returns the host allocations changed after a date."""
+    return IMPL.get_host_allocation_changes(since)
+
+
+def get_host_allocation_ids():
+    """Returns the IDs of all the current host allocations."""
+    return IMPL.get_host_allocation_ids()
+
+
+def get_host_ids_by_lease(lease_ids):
+    """Returns the hosts allocated to the reservations of several leases."""
+    return IMPL.get_host_ids_by_lease(lease_ids)
+
+
+def get_adjacent_allocations_by_host(host_ids, start_date, end_date):
+    """Returns the allocations of several hosts just around a period."""
+    return IMPL.get_adjacent_allocations_by_host(host_ids, start_date,
+                                                 end_date)
+
+
 def get_free_periods(resource_id, start_date, end_date, duration):
     """Returns a list of free periods."""
     return IMPL.get_free_periods(resource_id, start_date, end_date, duration)
@@ -117,6 +154,30 @@ def get_full_periods(resource_id, start_date, end_date, duration):
     return IMPL.get_full_periods(resource_id, start_date, end_date, duration)
 
 
+def get_free_periods_by_host(host_ids, start_date, end_date, duration):
+    """Returns the free periods of several hosts, keyed by host ID."""
+    return IMPL.get_free_periods_by_host(host_ids, start_date, end_date,
+                                         duration)
+
+
+def get_full_periods_by_host(host_ids, start_date, end_date, duration):
+    """Returns the full periods of several hosts, keyed by host ID."""
+    return IMPL.get_full_periods_by_host(host_ids, start_date, end_date,
+                                         duration)
+
+
+def get_lease_statistics(start_date=None, end_date=None, project_id=None):
+    """Returns statistics on the durations of leases, in seconds."""
+    return IMPL.get_lease_statistics(start_date=start_date,
+                                     end_date=end_date,
+                                     project_id=project_id)
+
+
+def get_host_utilization(host_ids, start_date, end_date):
+    """Yields the utilization metrics of hosts during a period."""
+    return IMPL.get_host_utilization(host_ids, start_date, end_date)
+
+
 def reservation_ratio(resource_id, start_date, end_date):
     return IMPL.reservation_ratio(resource_id, start_date, end_date)
 
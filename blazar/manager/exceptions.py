@@ -89,6 +89,12 @@ class UnsupportedResourceType(exceptions.BlazarException):
     msg_fmt = _("The %(resource_type)s resource type is not supported")
 
 
+class DryRunNotSupported(exceptions.BlazarException):
+    code = 400
+    msg_fmt = _("The %(resource_type)s resource type does not support "
+                "dry runs")
+
+
 class LeaseNameAlreadyExists(exceptions.BlazarException):
     code = 409
     msg_fmt = _("The lease with name: %(name)s already exists")
@@ -169,3 +175,9 @@ class InvalidRange(exceptions.BlazarException):
     code = 400
     msg_fmt = _('Invalid values for min/max of hosts. '
                 'Max must be equal to or larger than min.')
+
+
+class InvalidPeriod(exceptions.BlazarException):
+    code = 400
+    msg_fmt = _('Invalid period: start date %(start_date)s must be earlier '
+                'than end date %(end_date)s.')
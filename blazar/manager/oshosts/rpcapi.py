@@ -55,3 +55,12 @@ class ManagerRPCAPI(service.RPCClient):
         """Delete specified computehost."""
         return self.call('physical:host:delete_computehost',
                          host_id=host_id)
+
+    def find_earliest_window(self, values):
+        """Find the earliest window where a host reservation fits."""
+        return self.call('physical:host:find_earliest_window', values=values)
+
+    def get_utilization_report(self, values):
+        """Get the utilization metrics of hosts during a period."""
+        return self.call('physical:host:get_utilization_report',
+                         values=values)
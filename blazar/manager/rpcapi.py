@@ -34,14 +34,20 @@ class ManagerRPCAPI(service.RPCClient):
         """List all leases."""
         return self.call('list_leases', project_id=project_id)
 
-    def create_lease(self, lease_values):
+    def create_lease(self, lease_values, dry_run=False):
         """Create lease with specified parameters."""
-        return self.call('create_lease', lease_values=lease_values)
+        return self.call('create_lease', lease_values=lease_values,
+                         dry_run=dry_run)
 
-    def update_lease(self, lease_id, values):
+    def update_lease(self, lease_id, values, dry_run=False):
         """Update lease with passes values dictionary."""
-        return self.call('update_lease', lease_id=lease_id, values=values)
+        return self.call('update_lease', lease_id=lease_id, values=values,
+                         dry_run=dry_run)
 
     def delete_lease(self, lease_id):
         """Delete specified lease."""
         return self.call('delete_lease', lease_id=lease_id)
+
+    def get_lease_statistics(self, values):
+        """Get statistics on the durations of leases."""
+        return self.call('get_lease_statistics', values=values)
@@ -0,0 +1,118 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import heapq
+import threading
+
+
+class EventScheduler(object):
+    """Keeps the UNDONE events in a heap ordered by time.
+
+    The manager waits on the scheduler until the first event is due instead
+    of polling the database. The heap is not updated in place: moving or
+    removing an event leaves its old entry in the heap, which is skipped
+    since it no longer matches the time recorded for the event.
+    """
+
+    def __init__(self):
+        self._heap = []
+        # event id -> (time, lease id) of the scheduled events
+        self._events = {}
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._events)
+
+    def schedule(self, event):
+        """Add, move or remove an event depending on its time and status."""
+        with self._condition:
+            self._schedule(event)
+            self._condition.notify_all()
+
+    def unschedule_lease(self, lease_id):
+        """Remove all the events of a lease."""
+        with self._condition:
+            for event_id, (_time, event_lease_id) in list(
+                    self._events.items()):
+                if event_lease_id == lease_id:
+                    del self._events[event_id]
+
+    def reset(self, events):
+        """Replace the scheduled events, e.g. with the UNDONE events in DB."""
+        with self._condition:
+            self._heap = []
+            self._events = {}
+            for event in events:
+                self._schedule(event)
+            self._condition.notify_all()
+
+    def next_time(self):
+        """Return the time of the first scheduled event, or None."""
+        with self._condition:
+            return self._next_time()
+
+    def pop_due(self, now=None):
+        """Remove the events due at now and return their ids by time."""
+        now = now or datetime.datetime.utcnow()
+        due = []
+        with self._condition:
+            while True:
+                time = self._next_time()
+                if time is None or time > now:
+                    return due
+                _time, event_id = heapq.heappop(self._heap)
+                del self._events[event_id]
+                due.append(event_id)
+
+    def wait(self, timeout=None):
+        """Sleep until the first event is due, or at most timeout seconds.
+
+        Returns True if an event is due. The sleep is interrupted whenever
+        the scheduled events change, so that an event scheduled earlier than
+        the current first one is not delayed.
+        """
+        with self._condition:
+            time = self._next_time()
+            delay = timeout
+            if time is not None:
+                until_due = (time - datetime.datetime.utcnow()
+                             ).total_seconds()
+                if until_due <= 0:
+                    return True
+                if delay is None or until_due < delay:
+                    delay = until_due
+            self._condition.wait(delay)
+            time = self._next_time()
+            return (time is not None and
+                    time <= datetime.datetime.utcnow())
+
+    def _schedule(self, event):
+        self._events.pop(event['id'], None)
+        if event['status'] != 'UNDONE':
+            return
+        # A failed event is due again at its next attempt
+        time = max(event['time'], event.get('next_attempt_at') or
+                   event['time'])
+        self._events[event['id']] = (time, event['lease_id'])
+        heapq.heappush(self._heap, (time, event['id']))
+
+    def _next_time(self):
+        while self._heap:
+            time, event_id = self._heap[0]
+            if self._events.get(event_id, (None, None))[0] == time:
+                return time
+            heapq.heappop(self._heap)
+        return None
@@ -15,21 +15,29 @@
 
 from collections import defaultdict
 import datetime
+import os
+import socket
 
 import eventlet
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import excutils
+from oslo_utils import uuidutils
 import redis
 from stevedore import enabled
 
 from blazar.db import api as db_api
 from blazar.db import exceptions as db_ex
+from blazar.db import utils as db_utils
 from blazar import exceptions as common_ex
 from blazar import states
 from blazar.i18n import _
 from blazar import manager
 from blazar.manager import exceptions
+from blazar.manager import scheduler
 from blazar.notification import api as notification_api
+from blazar.plugins import base
+from blazar.utils import pool
 from blazar.utils import service as service_utils
 from blazar.utils import trusts
 from blazar.utils.openstack import keystone
@@ -64,7 +72,70 @@ manager_opts = [
                help='Hostname of the server hosting the usage DB. '
                'It must be a hostname, FQDN, or IP address.'),
     cfg.FloatOpt('usage_default_allocated', default=20000.0,
-                 help='Default usage allocated if project missing from usage DB.')
+                 help='Default usage allocated if project missing from usage DB.'),
+    cfg.IntOpt('events_reconcile_interval',
+               default=300,
+               min=1,
+               help='Number of seconds between two reloads of the UNDONE '
+                    'events from the DB. Events are run when they are due '
+                    'by an in-process scheduler, updated when leases are '
+                    'created, updated or deleted: the reload only catches '
+                    'the events changed by other means.'),
+    cfg.IntOpt('events_batch_size',
+               default=1000,
+               min=1,
+               help='Maximum number of due events loaded from the DB at '
+                    'once.'),
+    cfg.IntOpt('events_claim_timeout',
+               default=300,
+               min=1,
+               help='Number of seconds after which the events claimed by a '
+                    'blazar-manager process are released, unless the '
+                    'process renews its claims. The claims are renewed '
+                    'every third of this period, so that events left '
+                    'IN_PROGRESS by a crashed process are executed again '
+                    'by another one.'),
+    cfg.IntOpt('event_max_attempts',
+               default=5,
+               min=1,
+               help='Number of times an event raising an error is executed '
+                    'before it is marked DEAD.'),
+    cfg.IntOpt('event_retry_delay',
+               default=30,
+               min=0,
+               help='Number of seconds before the first retry of a failed '
+                    'event. The delay doubles at every attempt.'),
+    cfg.IntOpt('event_retry_max_delay',
+               default=1800,
+               min=0,
+               help='Maximum number of seconds between two attempts of a '
+                    'failed event.'),
+    cfg.IntOpt('start_lease_lookahead',
+               default=0,
+               min=0,
+               help='Number of seconds before their start in which leases '
+                    'are prepared: the trust of the lease is authenticated '
+                    'and the plugins check the resources to start. It must '
+                    'be less than half of the lifetime of Keystone tokens. '
+                    'If this is set to 0, leases are not prepared.'),
+    cfg.IntOpt('events_concurrency',
+               default=32,
+               min=1,
+               help='Maximum number of events executed at the same time.'),
+    cfg.ListOpt('events_plugin_concurrency',
+                default=[],
+                help='Maximum number of plugin actions run at the same time '
+                     'by events, for specific resource types. Syntax is a '
+                     'comma-separated list of <resource_type>:<limit> '
+                     'pairs, e.g. physical:host:8.'),
+    cfg.IntOpt('lease_create_retries',
+               default=3,
+               min=0,
+               help='Number of times the resources of a new lease are '
+                    'selected again when some of them were allocated to '
+                    'another lease meanwhile. Only used when the plugins '
+                    'of all its reservations create leases in a single '
+                    'transaction.'),
 ]
 
 CONF = cfg.CONF
@@ -73,6 +144,17 @@ LOG = logging.getLogger(__name__)
 
 LEASE_DATE_FORMAT = "%Y-%m-%d %H:%M"
 
+# Order of the events of a lease due at the same time
+EVENT_TYPES_ORDER = {'start_lease': 0, 'before_end_lease': 1, 'end_lease': 2}
+
+
+def _limit_concurrency(action, semaphore):
+    """Wrap a plugin action so that it runs while holding a semaphore."""
+    def limited_action(*args, **kwargs):
+        with semaphore:
+            return action(*args, **kwargs)
+    return limited_action
+
 
 class ManagerService(service_utils.RPCServer):
     """Service class for the blazar-manager service.
@@ -87,10 +169,22 @@ class ManagerService(service_utils.RPCServer):
         self.plugins = self._get_plugins()
         self.resource_actions = self._setup_actions()
         self.project_max_lease_durations = self._get_project_max_lease_durations()
+        self.event_scheduler = scheduler.EventScheduler()
+        # start_lease events already prepared, with their time
+        self._prepared_events = {}
+        # Identifies this process in the events it claims
+        self.owner = '%s:%d' % (socket.gethostname(), os.getpid())
 
     def start(self):
         super(ManagerService, self).start()
-        self.tg.add_timer(10, self._process_events)
+        self.tg.add_timer(CONF.manager.events_reconcile_interval,
+                          self._reconcile_events)
+        self.tg.add_timer(max(1, CONF.manager.events_claim_timeout // 3),
+                          self._renew_event_claims)
+        if CONF.manager.start_lease_lookahead:
+            self.tg.add_timer(max(1, CONF.manager.start_lease_lookahead // 2),
+                              self._prepare_start_events)
+        self.tg.add_thread(self._run_events)
 
     def _get_plugins(self):
         """Return dict of resource-plugin class pairs."""
@@ -136,6 +230,7 @@ class ManagerService(service_utils.RPCServer):
         [resource_type] group of configuration file.
         """
         actions = {}
+        concurrency = self._get_plugin_concurrency()
 
         for resource_type, plugin in self.plugins.items():
             plugin = self.plugins[resource_type]
@@ -145,78 +240,191 @@ class ManagerService(service_utils.RPCServer):
             actions[resource_type]['on_start'] = plugin.on_start
             actions[resource_type]['on_end'] = plugin.on_end
             actions[resource_type]['before_end'] = plugin.before_end
+            if resource_type in concurrency:
+                semaphore = eventlet.Semaphore(concurrency[resource_type])
+                for action_time, action in actions[resource_type].items():
+                    actions[resource_type][action_time] = (
+                        _limit_concurrency(action, semaphore))
             plugin.setup(None)
         return actions
 
+    def _get_plugin_concurrency(self):
+        concurrency = {}
+
+        for kv in CONF.manager.events_plugin_concurrency:
+            try:
+                # Resource types contain colons, e.g. physical:host
+                resource_type, limit = kv.rsplit(':', 1)
+                concurrency[resource_type] = int(limit)
+            except ValueError:
+                msg = "%s is not a valid resource_type:limit pair" % kv
+                raise exceptions.ConfigurationError(error=msg)
+        return concurrency
+
     @service_utils.with_empty_context
     def _process_events_concurrently(self, events):
+        """Execute events, at most events_concurrency at a time.
+
+        Events are only ordered when they may interfere, see
+        _get_event_dependencies: the other ones run in parallel. The events
+        are first claimed, so that an event due at the same time in several
+        manager processes is only executed by one of them.
+        """
+        claimed = set(db_api.event_claim(
+            [event['id'] for event in events], self.owner,
+            self._get_claim_expiry()))
+        events = [event for event in events if event['id'] in claimed]
+        if not events:
+            return
         LOG.info("Trying to execute events: %s", events)
-        event_threads = {}
-        for event in events:
-            db_api.event_update(event['id'], {'status': 'IN_PROGRESS'})
-            try:
-                event_thread = eventlet.spawn(
-                    service_utils.with_empty_context(self._exec_event),
-                    event)
-                event_threads[event['id']] = event_thread
-            except Exception:
-                db_api.event_update(event['id'], {'status': 'ERROR'})
-                LOG.exception('Error occurred while spawning event %s.',
-                              event['id'])
 
-        for event_id, event_thread in event_threads.items():
-            try:
-                event_thread.wait()
-            except Exception:
-                db_api.event_update(event['id'], {'status': 'ERROR'})
-                LOG.exception('Error occurred while handling event %s.',
-                              event_id)
+        pool.run_with_dependencies(
+            service_utils.with_empty_context(self._run_event),
+            events,
+            self._get_event_dependencies(events),
+            CONF.manager.events_concurrency)
 
-    def _select_for_execution(self, events):
-        """Selects the first events that can be safely executed concurrently.
+    def _get_claim_expiry(self):
+        return datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=CONF.manager.events_claim_timeout)
 
-        Events are selected to be executed concurrently if they are of the same
-        type, while keeping strict time ordering and the following priority of
-        event types: before_end_lease, end_lease, and start_lease (except for
-        before_end_lease events where there is a start_lease event for the same
-        lease at the same time).
+    def _renew_event_claims(self):
+        """Extend the claims of the events this process is executing."""
+        db_api.event_renew_claims(self.owner, self._get_claim_expiry())
+
+    def _run_event(self, event):
+        try:
+            self._exec_event(event)
+        except Exception:
+            db_api.event_update(event['id'], {'status': 'ERROR'})
+            LOG.exception('Error occurred while handling event %s.',
+                          event['id'])
+
+    def _get_event_dependencies(self, events):
+        """Return, for every event, the indexes of the events to run first.
 
         We ensure that:
 
-        - the before_end_lease event of a lease is executed after the
-          start_lease event and before the end_lease event of the same lease,
-        - for two reservations using the same hosts back to back, the end_lease
-          event is executed before the start_lease event.
+        - the events of a lease are executed by time and, at the same time,
+          in the order start_lease, before_end_lease and end_lease,
+        - for two leases using the same hosts back to back, the end_lease
+          event of the first lease is executed before the start_lease event
+          of the second one.
+
+        Other events, e.g. the start_lease and end_lease events of leases
+        using different hosts, are independent.
         """
-        if not events:
-            return [], events
+        dependencies = [set() for _event in events]
 
         events_by_lease = defaultdict(list)
-        events_by_type = defaultdict(list)
-        selected_events = []
-
-        first_events = [e for e in events if e['time'] == events[0]['time']]
-        for e in first_events:
-            events_by_lease[e['lease_id']].append(e)
-            events_by_type[e['event_type']].append(e)
-
-        # If there is a start_lease event for the same lease, we run it
-        # first.
-        for before_end_event in events_by_type['before_end_lease']:
-            if len([e for e in events_by_lease[before_end_event['lease_id']]
-                    if e['event_type'] == 'start_lease']) > 0:
-                events_by_type['before_end_lease'].remove(before_end_event)
-
-        if events_by_type['before_end_lease']:
-            selected_events = events_by_type['before_end_lease']
-        elif events_by_type['end_lease']:
-            selected_events = events_by_type['end_lease']
-        elif events_by_type['start_lease']:
-            selected_events = events_by_type['start_lease']
-
-        for e in selected_events:
-            events.remove(e)
-        return selected_events, events
+        for index, event in enumerate(events):
+            events_by_lease[event['lease_id']].append(index)
+        for indexes in events_by_lease.values():
+            indexes.sort(key=lambda index: (
+                events[index]['time'],
+                EVENT_TYPES_ORDER.get(events[index]['event_type'], 0)))
+            for previous, index in zip(indexes, indexes[1:]):
+                dependencies[index].add(previous)
+
+        event_types = set(event['event_type'] for event in events)
+        if not set(['start_lease', 'end_lease']) <= event_types:
+            return dependencies
+
+        host_ids_by_lease = db_utils.get_host_ids_by_lease(
+            list(events_by_lease))
+        # Sweep the start_lease and end_lease events of every host by time,
+        # end_lease events first at the same time. A start_lease event
+        # depends on the end_lease events since the previous start time of
+        # the host and on the start_lease events at that time, which
+        # themselves come after the earlier end_lease events: every event
+        # is only looked at once per host.
+        sweep = sorted(
+            (index for index, event in enumerate(events)
+             if event['event_type'] in ('start_lease', 'end_lease')),
+            key=lambda index: (events[index]['time'],
+                               events[index]['event_type'] != 'end_lease'))
+        hosts = {}
+        for index in sweep:
+            event = events[index]
+            for host_id in host_ids_by_lease.get(event['lease_id'], ()):
+                host = hosts.setdefault(host_id, {
+                    'time': None, 'starts': [], 'ends': [], 'before': []})
+                if event['event_type'] == 'end_lease':
+                    host['ends'].append(index)
+                    continue
+                if host['time'] != event['time']:
+                    host['before'] = host['starts'] + host['ends']
+                    host['time'] = event['time']
+                    host['starts'] = []
+                    host['ends'] = []
+                host['starts'].append(index)
+                dependencies[index].update(
+                    before for before in host['before']
+                    if events[before]['lease_id'] != event['lease_id'])
+        return dependencies
+
+    def _reconcile_events(self):
+        """Reload the scheduled events from the UNDONE events in DB.
+
+        The events claimed by a manager process which did not renew its
+        claims, e.g. because it crashed, are made UNDONE again first.
+        """
+        released = db_api.event_release_expired_claims(
+            datetime.datetime.utcnow())
+        if released:
+            LOG.warning('Released %d events whose claim expired.', released)
+        LOG.debug('Reloading events from DB.')
+        self.event_scheduler.reset(db_api.event_get_all_sorted_by_filters(
+            sort_key='time',
+            sort_dir='asc',
+            filters={'status': 'UNDONE'}
+        ))
+
+    def _run_events(self):
+        """Execute the events as soon as they are due."""
+        while True:
+            if not self.event_scheduler.wait(
+                    CONF.manager.events_reconcile_interval):
+                continue
+            self.event_scheduler.pop_due()
+            try:
+                self._process_events()
+            except Exception:
+                LOG.exception('Error occurred while processing events.')
+
+    def _get_due_events(self, now):
+        """Return the next batch of UNDONE events due at now, sorted by time.
+
+        The events are returned with a boolean telling whether more events
+        may be due. When the batch is full, the events at its last time are
+        left for the next batch, since the other events at that time may not
+        be part of it: _get_event_dependencies needs all of them to order
+        them.
+        """
+        limit = CONF.manager.events_batch_size
+        events = db_api.event_get_all_sorted_by_filters(
+            sort_key='time',
+            sort_dir='asc',
+            filters={'status': 'UNDONE',
+                     'time': {'op': 'le', 'border': now},
+                     'next_attempt_before': now},
+            limit=limit
+        )
+        if len(events) < limit:
+            return events, False
+
+        last_time = events[-1]['time']
+        earlier_events = [e for e in events if e['time'] < last_time]
+        if earlier_events:
+            return earlier_events, True
+        # All the events of the batch are at the same time: load all of them
+        return db_api.event_get_all_sorted_by_filters(
+            sort_key='time',
+            sort_dir='asc',
+            filters={'status': 'UNDONE',
+                     'time': {'op': 'le', 'border': last_time},
+                     'next_attempt_before': now}
+        ), True
 
     def _process_events(self):
         """Tries to execute events.
@@ -225,16 +433,52 @@ class ManagerService(service_utils.RPCServer):
         status to 'DONE'. Events are executed concurrently if possible.
         """
         LOG.debug('Trying to get events from DB.')
+        now = datetime.datetime.utcnow()
+        more = True
+        while more:
+            events, more = self._get_due_events(now)
+            if events:
+                self._process_events_concurrently(events)
+
+    @service_utils.with_empty_context
+    def _prepare_start_events(self):
+        """Prepare the leases starting within start_lease_lookahead.
+
+        Only the start_lease events not prepared yet are handled. Failures
+        are reported but the events are left to run as scheduled.
+        """
+        now = datetime.datetime.utcnow()
+        lookahead = datetime.timedelta(
+            seconds=CONF.manager.start_lease_lookahead)
+        for event_id, time in list(self._prepared_events.items()):
+            if time <= now:
+                del self._prepared_events[event_id]
+
         events = db_api.event_get_all_sorted_by_filters(
             sort_key='time',
             sort_dir='asc',
-            filters={'status': 'UNDONE'}
+            filters={'status': 'UNDONE',
+                     'event_type': 'start_lease',
+                     'time': {'op': 'le', 'border': now + lookahead}}
         )
-
-        events = [e for e in events if e['time'] <= datetime.datetime.utcnow()]
-        while events:
-            executable_events, events = self._select_for_execution(events)
-            self._process_events_concurrently(executable_events)
+        for event in events:
+            if event['time'] <= now or event['id'] in self._prepared_events:
+                continue
+            self._prepared_events[event['id']] = event['time']
+            try:
+                lease = self.get_lease(event['lease_id'])
+                # The token must stay valid until the event, possibly
+                # delayed, has run.
+                trusts.prefetch_ctx_from_trust(
+                    lease['trust_id'], event['time'] + lookahead)
+                with trusts.create_ctx_from_trust(lease['trust_id']):
+                    for reservation in lease['reservations']:
+                        self.plugins[
+                            reservation['resource_type']].prepare_start(
+                                reservation['resource_id'])
+            except Exception:
+                LOG.exception('Lease %s may fail to start.',
+                              event['lease_id'])
 
     def _exec_event(self, event):
         """Execute an event function"""
@@ -246,14 +490,44 @@ class ManagerService(service_utils.RPCServer):
         try:
             event_fn(lease_id=event['lease_id'], event_id=event['id'])
         except Exception:
-            db_api.event_update(event['id'], {'status': 'ERROR'})
             LOG.exception('Error occurred while handling event.')
+            self._retry_event(event)
         else:
             lease = db_api.lease_get(event['lease_id'])
             with trusts.create_ctx_from_trust(lease['trust_id']) as ctx:
                 self._send_notification(
                     lease, ctx, events=['event.%s' % event['event_type']])
 
+    def _retry_event(self, event):
+        """Schedule a failed event again, with an exponential backoff.
+
+        The event is marked DEAD once it failed event_max_attempts times,
+        the lease it starts or ends being marked as failed.
+        """
+        attempts = (event.get('attempts') or 0) + 1
+        if attempts >= CONF.manager.event_max_attempts:
+            LOG.error('Event %s failed %d times, giving up.', event['id'],
+                      attempts)
+            event_values = {'status': 'DEAD', 'attempts': attempts}
+            if event['event_type'] in ('start_lease', 'end_lease'):
+                self._fail_lease_action(event, event_values)
+            else:
+                db_api.event_update(event['id'], event_values)
+            return
+
+        delay = min(CONF.manager.event_retry_delay * 2 ** (attempts - 1),
+                    CONF.manager.event_retry_max_delay)
+        next_attempt_at = (datetime.datetime.utcnow() +
+                           datetime.timedelta(seconds=delay))
+        LOG.warning('Event %s failed, retrying at %s.', event['id'],
+                    next_attempt_at)
+        self.event_scheduler.schedule(db_api.event_update(
+            event['id'], {'status': 'UNDONE',
+                          'attempts': attempts,
+                          'next_attempt_at': next_attempt_at,
+                          'owner': None,
+                          'claim_expires_at': None}))
+
     def _date_from_string(self, date_string, date_format=LEASE_DATE_FORMAT):
         try:
             date = datetime.datetime.strptime(date_string, date_format)
@@ -323,6 +597,26 @@ class ManagerService(service_utils.RPCServer):
     def list_leases(self, project_id=None):
         return db_api.lease_list(project_id)
 
+    def get_lease_statistics(self, values):
+        """Return statistics on the durations of leases.
+
+        :param values: dict with optionally the start_date and end_date of
+            a period, and a project_id, restricting the leases.
+        :return: a dict with the count and the mean, min, max, p50 and p95
+            durations (in seconds) of the leases, and the count and mean, min
+            and max durations of the leases of each project under 'projects'.
+        """
+        dates = {}
+        for param in ('start_date', 'end_date'):
+            if values.get(param):
+                dates[param] = self._date_from_string(values[param])
+        if ('start_date' in dates and 'end_date' in dates and
+                dates['start_date'] >= dates['end_date']):
+            raise exceptions.InvalidPeriod(start_date=values['start_date'],
+                                           end_date=values['end_date'])
+        return db_utils.get_lease_statistics(
+            project_id=values.get('project_id'), **dates)
+
     def _get_user_name(self, user_id):
         """Get user name from Keystone"""
         client = keystone.BlazarKeystoneClient(username=CONF.os_admin_username,
@@ -339,15 +633,114 @@ class ManagerService(service_utils.RPCServer):
         project = client.projects.get(project_id)
         return project.name
 
-    def create_lease(self, lease_values):
+    def _get_lease_exception(self, user_name, project_name,
+                             init_usage=True):
+        """Return the maximum lease duration granted to a user, if any.
+
+        The usage of the project is initialized in the usage DB unless
+        init_usage is False.
+        """
+        if not CONF.manager.usage_enforcement:
+            return None
+        if not CONF.manager.usage_db_host:
+            raise common_ex.ConfigurationError('usage_db_host must be set')
+        try:
+            r = redis.StrictRedis(host=CONF.manager.usage_db_host, port=6379, db=0)
+            if init_usage:
+                allocated = r.hget('allocated', project_name)
+                if allocated is None:
+                    LOG.info('Setting project %s allocated to %f', project_name, CONF.manager.usage_default_allocated)
+                    r.hset('allocated', project_name, CONF.manager.usage_default_allocated)
+                balance = r.hget('balance', project_name)
+                if balance is None:
+                    LOG.info('Setting project %s balance to %f', project_name, CONF.manager.usage_default_allocated)
+                    r.hset('balance', project_name, CONF.manager.usage_default_allocated)
+            return r.hget('user_exceptions', user_name)
+        except redis.exceptions.ConnectionError:
+            LOG.exception('Cannot connect to redis server %s', CONF.manager.usage_db_host)
+
+    def _prepare_lease(self, lease_values, events, init_usage=True):
+        """Check the limits of a new lease and add its events.
+
+        :return: a tuple (user_name, project_name).
+        """
+        start_date = lease_values['start_date']
+        end_date = lease_values['end_date']
+        user_name = self._get_user_name(lease_values['user_id'])
+        project_name = self._get_project_name(lease_values['project_id'])
+        lease_exception = self._get_lease_exception(user_name, project_name,
+                                                    init_usage=init_usage)
+
+        self._check_lease_duration_limit(lease_values, user_name, project_name, lease_exception=lease_exception)
+
+        events.append({'event_type': 'start_lease',
+                       'time': start_date,
+                       'status': 'UNDONE'})
+        events.append({'event_type': 'end_lease',
+                       'time': end_date,
+                       'status': 'UNDONE'})
+
+        before_end_date = lease_values.get('before_end_date', None)
+        if before_end_date:
+            # incoming param. Validation check
+            try:
+                before_end_date = self._date_from_string(
+                    before_end_date)
+                self._check_date_within_lease_limits(before_end_date,
+                                                     lease_values)
+            except common_ex.BlazarException as e:
+                LOG.error("Invalid before_end_date param. %s" % e.message)
+                raise e
+        elif CONF.manager.minutes_before_end_lease > 0:
+            delta = datetime.timedelta(
+                minutes=CONF.manager.minutes_before_end_lease)
+            before_end_date = lease_values['end_date'] - delta
+
+        if before_end_date:
+            event = {'event_type': 'before_end_lease',
+                     'status': 'UNDONE'}
+            events.append(event)
+            self._update_before_end_event_date(event, before_end_date,
+                                               lease_values)
+        return user_name, project_name
+
+    def _lease_preview(self, lease_values, reservations):
+        """Return what a lease would be, given the checks of its reservations.
+
+        :param reservations: dicts returned by check_reservation or
+            check_reservation_update of the plugins.
+        """
+        preview = {'name': lease_values.get('name'),
+                   'user_id': lease_values.get('user_id'),
+                   'project_id': lease_values.get('project_id'),
+                   'start_date': lease_values['start_date'],
+                   'end_date': lease_values['end_date'],
+                   'reservations': reservations,
+                   'dry_run': True}
+        costs = [reservation['cost'] for reservation in reservations
+                 if reservation.get('cost') is not None]
+        if costs:
+            preview['cost'] = sum(costs)
+        return preview
+
+    def create_lease(self, lease_values, dry_run=False):
         """Create a lease with reservations.
 
         Return either the model of created lease or None if any error.
+
+        With dry_run, the lease is only checked: the resources its
+        reservations would get are returned with their cost, and nothing is
+        written to the DB, Nova or the usage DB. The project_id must then be
+        part of lease_values since no trust is used. Reservations are checked
+        independently of each other.
         """
-        try:
-            trust_id = lease_values.pop('trust_id')
-        except KeyError:
-            raise exceptions.MissingTrustId()
+        if dry_run:
+            trust_id = lease_values.pop('trust_id', None)
+        else:
+            try:
+                trust_id = lease_values.pop('trust_id')
+            except KeyError:
+                raise exceptions.MissingTrustId()
 
         # Remove and keep event and reservation values
         events = lease_values.pop("events", [])
@@ -373,65 +766,48 @@ class ManagerService(service_utils.RPCServer):
             raise common_ex.NotAuthorized(
                 'Start date must later than current date')
 
+        lease_values['start_date'] = start_date
+        lease_values['end_date'] = end_date
+
+        if dry_run:
+            if not lease_values.get('project_id'):
+                raise exceptions.ProjectIdNotFound()
+            user_name, project_name = self._prepare_lease(
+                lease_values, events, init_usage=False)
+            checked = []
+            for reservation in reservations:
+                resource_type = reservation['resource_type']
+                if resource_type not in self.plugins:
+                    raise exceptions.UnsupportedResourceType(resource_type)
+                reservation['start_date'] = start_date
+                reservation['end_date'] = end_date
+                checked.append(self.plugins[resource_type].check_reservation(
+                    reservation,
+                    usage_enforcement=CONF.manager.usage_enforcement,
+                    usage_db_host=CONF.manager.usage_db_host,
+                    user_name=user_name,
+                    project_name=project_name))
+            return self._lease_preview(lease_values, checked)
+
         with trusts.create_ctx_from_trust(trust_id) as ctx:
             # NOTE(priteau): We should not get user_id from ctx, because we are
             # in the context of the trustee (blazar user).
             # lease_values['user_id'] is set in blazar/api/v1/service.py
             lease_values['project_id'] = ctx.project_id
-            lease_values['start_date'] = start_date
-            lease_values['end_date'] = end_date
-            user_name = self._get_user_name(lease_values['user_id'])
-            project_name = self._get_project_name(lease_values['project_id'])
-            lease_exception = None
-
-            if CONF.manager.usage_enforcement:
-                if not CONF.manager.usage_db_host:
-                    raise common_ex.ConfigurationError('usage_db_host must be set')
-                try:
-                    r = redis.StrictRedis(host=CONF.manager.usage_db_host, port=6379, db=0)
-                    allocated = r.hget('allocated', project_name)
-                    if allocated is None:
-                        LOG.info('Setting project %s allocated to %f', CONF.manager.usage_default_allocated)
-                        r.hset('allocated', project_name, CONF.manager.usage_default_allocated)
-                    balance = r.hget('balance', project_name)
-                    if balance is None:
-                        LOG.info('Setting project %s balance to %f', CONF.manager.usage_default_allocated)
-                        r.hset('balance', project_name, CONF.manager.usage_default_allocated)
-                    lease_exception = r.hget('user_exceptions', user_name)
-                except redis.exceptions.ConnectionError:
-                    LOG.exception('Cannot connect to redis server %s', CONF.manager.usage_db_host)
-
-            self._check_lease_duration_limit(lease_values, user_name, project_name, lease_exception=lease_exception)
-
-	    events.append({'event_type': 'start_lease',
-			   'time': start_date,
-			   'status': 'UNDONE'})
-	    events.append({'event_type': 'end_lease',
-			   'time': end_date,
-			   'status': 'UNDONE'})
-
-            before_end_date = lease_values.get('before_end_date', None)
-            if before_end_date:
-                # incoming param. Validation check
-                try:
-                    before_end_date = self._date_from_string(
-                        before_end_date)
-                    self._check_date_within_lease_limits(before_end_date,
-                                                         lease_values)
-                except common_ex.BlazarException as e:
-                    LOG.error("Invalid before_end_date param. %s" % e.message)
-                    raise e
-            elif CONF.manager.minutes_before_end_lease > 0:
-                delta = datetime.timedelta(
-                    minutes=CONF.manager.minutes_before_end_lease)
-                before_end_date = lease_values['end_date'] - delta
+            user_name, project_name = self._prepare_lease(lease_values,
+                                                          events)
 
-            if before_end_date:
-                event = {'event_type': 'before_end_lease',
-                         'status': 'UNDONE'}
-                events.append(event)
-                self._update_before_end_event_date(event, before_end_date,
-                                                   lease_values)
+            if reservations and all(
+                    self.plugins.get(reservation['resource_type'],
+                                     base.BasePlugin).batch_create
+                    for reservation in reservations):
+                if trust_id:
+                    lease_values.update({'trust_id': trust_id})
+                lease = self._create_lease_batch(lease_values, reservations,
+                                                 events, user_name,
+                                                 project_name)
+                self._send_notification(lease, ctx, events=['create'])
+                return lease
 
             try:
                 if trust_id:
@@ -467,13 +843,15 @@ class ManagerService(service_utils.RPCServer):
                 try:
                     for event in events:
                         event['lease_id'] = lease['id']
-                        db_api.event_create(event)
+                        self.event_scheduler.schedule(
+                            db_api.event_create(event))
                 except (exceptions.UnsupportedResourceType,
                         common_ex.BlazarException):
                     LOG.exception("Failed to create event for a lease. "
                                   "Rollback the lease and associated "
                                   "reservations")
                     db_api.lease_destroy(lease_id)
+                    self.event_scheduler.unschedule_lease(lease_id)
                     raise
 
                 else:
@@ -486,11 +864,107 @@ class ManagerService(service_utils.RPCServer):
                     self._send_notification(lease, ctx, events=['create'])
                     return lease
 
-    def update_lease(self, lease_id, values):
+    def _create_lease_batch(self, lease_values, reservations, events,
+                            user_name, project_name):
+        """Create a lease with its reservations in a single transaction.
+
+        The plugins select the resources of the reservations without writing
+        them, all the rows being inserted at once. When hosts were allocated
+        to another lease meanwhile, the resources are selected again.
+        """
+        lease_id = uuidutils.generate_uuid()
+        lease_state = states.LeaseState(id=lease_id, autosave=False,
+                                        action=states.lease.CREATE,
+                                        status=states.lease.COMPLETE,
+                                        status_reason="Successfully created "
+                                                      "lease")
+        lease_values = dict(lease_values, id=lease_id,
+                            **lease_state.current())
+        events_values = [dict(event, id=uuidutils.generate_uuid(),
+                              lease_id=lease_id)
+                         for event in events]
+        plugin_kwargs = {'usage_enforcement': CONF.manager.usage_enforcement,
+                         'usage_db_host': CONF.manager.usage_db_host,
+                         'project_name': project_name}
+
+        retries = CONF.manager.lease_create_retries
+        while True:
+            reserved = []
+            try:
+                reservations_values = []
+                resources_values = {}
+                for reservation in reservations:
+                    reservation_id = uuidutils.generate_uuid()
+                    values = dict(reservation, lease_id=lease_id,
+                                  start_date=lease_values['start_date'],
+                                  end_date=lease_values['end_date'])
+                    plugin = self.plugins[reservation['resource_type']]
+                    resource_id, rows, encumbered = (
+                        plugin.reserve_resource_rows(
+                            reservation_id, values, user_name=user_name,
+                            batch_rows=resources_values, **plugin_kwargs))
+                    reserved.append((plugin, reservation_id, values, rows,
+                                     encumbered))
+                    reservations_values.append(
+                        {'id': reservation_id,
+                         'lease_id': lease_id,
+                         'resource_id': resource_id,
+                         'resource_type': reservation['resource_type'],
+                         'status': 'pending'})
+                    for table, table_rows in rows.items():
+                        resources_values.setdefault(table, []).extend(
+                            table_rows)
+
+                db_api.lease_create_batch(lease_values, reservations_values,
+                                          events_values, resources_values)
+            except db_ex.BlazarDBHostNotFree:
+                self._release_resource_rows(reserved, plugin_kwargs)
+                if retries <= 0:
+                    raise exceptions.NotEnoughHostsAvailable()
+                retries -= 1
+                LOG.info("Hosts were allocated to another lease "
+                         "concurrently, selecting them again")
+            except db_ex.BlazarDBDuplicateEntry:
+                LOG.exception('Cannot create a lease - duplicated lease name')
+                self._release_resource_rows(reserved, plugin_kwargs)
+                raise exceptions.LeaseNameAlreadyExists(
+                    name=lease_values['name'])
+            except Exception:
+                with excutils.save_and_reraise_exception():
+                    LOG.exception("Failed to create a lease. Release the "
+                                  "resources of its reservations")
+                    self._release_resource_rows(reserved, plugin_kwargs)
+            else:
+                break
+
+        for event in events_values:
+            self.event_scheduler.schedule(event)
+        return db_api.lease_get(lease_id)
+
+    def _release_resource_rows(self, reserved, plugin_kwargs):
+        for plugin, reservation_id, values, rows, encumbered in reserved:
+            try:
+                plugin.release_resource_rows(reservation_id, values, rows,
+                                             encumbered=encumbered,
+                                             **plugin_kwargs)
+            except Exception:
+                LOG.exception("Failed to release the resources of "
+                              "reservation %s", reservation_id)
+
+    def update_lease(self, lease_id, values, dry_run=False):
+        """Update a lease and its reservations.
+
+        With dry_run, the update is only checked: the resources the
+        reservations would get are returned with their cost, and nothing is
+        written to the DB, Nova or the usage DB.
+        """
         if not values:
             return db_api.lease_get(lease_id)
 
         if len(values) == 1 and 'name' in values:
+            if dry_run:
+                return dict(db_api.lease_get(lease_id), name=values['name'],
+                            dry_run=True)
             db_api.lease_update(lease_id, values)
             return db_api.lease_get(lease_id)
 
@@ -562,6 +1036,24 @@ class ManagerService(service_utils.RPCServer):
             started = lease['start_date'] < now and now < lease['end_date']
             self._check_lease_duration_limit(values, user_name, project_name, started=started, current_end_date=lease['end_date'])
 
+            if dry_run:
+                checked = []
+                for reservation in (
+                        db_api.reservation_get_all_by_lease_id(lease_id)):
+                    reservation['start_date'] = values['start_date']
+                    reservation['end_date'] = values['end_date']
+                    resource_type = reservation['resource_type']
+                    checked.append(
+                        self.plugins[resource_type].check_reservation_update(
+                            reservation['id'],
+                            reservation,
+                            usage_enforcement=CONF.manager.usage_enforcement,
+                            usage_db_host=CONF.manager.usage_db_host,
+                            project_name=project_name))
+                preview = self._lease_preview(dict(lease, **values), checked)
+                preview['id'] = lease_id
+                return preview
+
             # TODO(frossigneux) rollback if an exception is raised
             for reservation in (
                     db_api.reservation_get_all_by_lease_id(lease_id)):
@@ -586,7 +1078,8 @@ class ManagerService(service_utils.RPCServer):
         if not event:
             raise common_ex.BlazarException(
                 'Start lease event not found')
-        db_api.event_update(event['id'], {'time': values['start_date']})
+        self.event_scheduler.schedule(
+            db_api.event_update(event['id'], {'time': values['start_date']}))
 
         event = db_api.event_get_first_sorted_by_filters(
             'lease_id',
@@ -599,7 +1092,8 @@ class ManagerService(service_utils.RPCServer):
         if not event:
             raise common_ex.BlazarException(
                 'End lease event not found')
-        db_api.event_update(event['id'], {'time': values['end_date']})
+        self.event_scheduler.schedule(
+            db_api.event_update(event['id'], {'time': values['end_date']}))
 
         notifications = ['update']
         self._update_before_end_event(lease, values, notifications,
@@ -632,7 +1126,8 @@ class ManagerService(service_utils.RPCServer):
                 }
             )
             if not start_event or start_event['status'] not in ['DONE',
-                                                                'ERROR']:
+                                                                'ERROR',
+                                                                'DEAD']:
                 raise common_ex.BlazarException('Invalid event status')
             end_event = db_api.event_get_first_sorted_by_filters(
                 'lease_id',
@@ -645,7 +1140,8 @@ class ManagerService(service_utils.RPCServer):
             )
             if not end_event:
                 raise common_ex.BlazarException('Invalid event status')
-            db_api.event_update(end_event['id'], {'status': 'IN_PROGRESS'})
+            self.event_scheduler.schedule(db_api.event_update(
+                end_event['id'], {'status': 'IN_PROGRESS'}))
 
         with trusts.create_ctx_from_trust(lease['trust_id']) as ctx:
             for reservation in lease['reservations']:
@@ -666,20 +1162,21 @@ class ManagerService(service_utils.RPCServer):
                         lease_state.save()
                         raise
             db_api.lease_destroy(lease_id)
+            self.event_scheduler.unschedule_lease(lease_id)
             self._send_notification(lease, ctx, events=['delete'])
 
     def start_lease(self, lease_id, event_id):
         lease = self.get_lease(lease_id)
         with trusts.create_ctx_from_trust(lease['trust_id']):
-            self._basic_action(lease_id, event_id, 'on_start', 'active')
+            self._basic_action(lease_id, event_id, 'on_start', 'active',
+                               lease=lease)
 
     def end_lease(self, lease_id, event_id):
         lease = self.get_lease(lease_id)
-        for reservation in lease['reservations']:
-            db_api.reservation_update(reservation['id'],
-                                      {'status': 'completed'})
         with trusts.create_ctx_from_trust(lease['trust_id']):
-            self._basic_action(lease_id, event_id, 'on_end', 'deleted')
+            self._basic_action(lease_id, event_id, 'on_end', 'deleted',
+                               lease=lease,
+                               action_reservation_status='completed')
 
     def before_end_lease(self, lease_id, event_id):
         lease = self.get_lease(lease_id)
@@ -700,11 +1197,18 @@ class ManagerService(service_utils.RPCServer):
             db_api.event_update(event_id, {'status': 'DONE'})
 
     def _basic_action(self, lease_id, event_id, action_time,
-                      reservation_status=None):
-        """Commits basic lease actions such as starting and ending."""
-        lease = self.get_lease(lease_id)
-
-        event_status = 'DONE'
+                      reservation_status=None, lease=None,
+                      action_reservation_status=None):
+        """Commits basic lease actions such as starting and ending.
+
+        The statuses are written twice: before the plugins act, with the
+        reservations set to action_reservation_status if given, and after,
+        together with the event status. When a plugin fails, the exception
+        is raised for the event to be retried, the plugin actions having to
+        be idempotent.
+        """
+        if lease is None:
+            lease = self.get_lease(lease_id)
 
         if action_time == 'on_start':
             lease_action = states.lease.START
@@ -716,11 +1220,19 @@ class ManagerService(service_utils.RPCServer):
             raise AttributeError("action_time is %s instead of either on_start or on_end"
                                  % action_time)
 
-        lease_state = states.LeaseState(id=lease_id, action=lease_action,
-                status=states.lease.IN_PROGRESS,
-                status_reason=status_reason)
-        lease_state.save()
-
+        lease_state = states.LeaseState(id=lease_id, autosave=False,
+                                        action=lease_action,
+                                        status=states.lease.IN_PROGRESS,
+                                        status_reason=status_reason)
+        reservations_values = {}
+        if action_reservation_status is not None:
+            reservations_values = dict(
+                (reservation['id'], {'status': action_reservation_status})
+                for reservation in lease['reservations'])
+        db_api.lease_transition(lease_id, lease_state.current(),
+                                reservations_values)
+
+        reservations_values = {}
         for reservation in lease['reservations']:
             resource_type = reservation['resource_type']
             try:
@@ -728,48 +1240,53 @@ class ManagerService(service_utils.RPCServer):
                     reservation['resource_id']
                 )
             except common_ex.BlazarException:
-                LOG.exception("Failed to execute action %(action)s "
-                              "for lease %(lease)s"
-                              % {
-                                  'action': action_time,
-                                  'lease': lease_id,
-                              })
-                event_status = 'ERROR'
-                db_api.reservation_update(reservation['id'],
-                                          {'status': 'error'})
-            else:
-                if reservation_status is not None:
-                    db_api.reservation_update(reservation['id'],
-                                              {'status': reservation_status})
-
-        db_api.event_update(event_id, {'status': event_status})
-
-        if event_status == 'DONE':
-            lease_status = states.lease.COMPLETE
-            if action_time ==  'on_start':
-                status_reason = "Successfully started lease"
-            elif action_time == 'on_end':
-                status_reason = "Successfully stopped lease"
-            else:
-                raise AttributeError("action_time is %s instead of either on_start or on_end"
-                                     % action_time)
-        elif event_status == 'ERROR':
-            lease_status = states.lease.FAILED
-            if action_time ==  'on_start':
-                status_reason = "Failed to start lease"
-            elif action_time == 'on_end':
-                status_reason = "Failed to stop lease"
-            else:
-                raise AttributeError("action_time is %s instead of either on_start or on_end"
-                                     % action_time)
-        else:
-            raise AttributeError("event_status is %s instead of either DONE or ERROR"
-                                 % event_status)
+                with excutils.save_and_reraise_exception():
+                    LOG.exception("Failed to execute action %(action)s "
+                                  "for lease %(lease)s"
+                                  % {
+                                      'action': action_time,
+                                      'lease': lease_id,
+                                  })
+            if reservation_status is not None:
+                reservations_values[reservation['id']] = {
+                    'status': reservation_status}
 
+        if action_time == 'on_start':
+            status_reason = "Successfully started lease"
+        else:
+            status_reason = "Successfully stopped lease"
         lease_state.update(action=lease_action,
-                           status=lease_status,
+                           status=states.lease.COMPLETE,
                            status_reason=status_reason)
-        lease_state.save()
+        db_api.lease_transition(lease_id, lease_state.current(),
+                                reservations_values,
+                                event_id, {'status': 'DONE'})
+
+    def _fail_lease_action(self, event, event_values):
+        """Mark the lease of a start or end event which gave up as failed.
+
+        The lease, its reservations and the event are written together.
+        """
+        lease = db_api.lease_get(event['lease_id'])
+        if lease is None:
+            db_api.event_update(event['id'], event_values)
+            return
+
+        if event['event_type'] == 'start_lease':
+            lease_action = states.lease.START
+            status_reason = "Failed to start lease"
+        else:
+            lease_action = states.lease.STOP
+            status_reason = "Failed to stop lease"
+        lease_state = states.LeaseState(id=lease['id'], autosave=False,
+                                        action=lease_action,
+                                        status=states.lease.FAILED,
+                                        status_reason=status_reason)
+        db_api.lease_transition(
+            lease['id'], lease_state.current(),
+            dict((reservation['id'], {'status': 'error'})
+                 for reservation in lease['reservations']),
+            event['id'], event_values)
 
     def _create_reservation(self, values, usage_enforcement=None, usage_db_host=None, user_name=None, project_name=None):
         resource_type = values['resource_type']
@@ -839,7 +1356,8 @@ class ManagerService(service_utils.RPCServer):
                 update_values['status'] = 'UNDONE'
                 notifications.append('event.before_end_lease.stop')
 
-            db_api.event_update(event['id'], update_values)
+            self.event_scheduler.schedule(
+                db_api.event_update(event['id'], update_values))
 
     def __getattr__(self, name):
         """RPC Dispatcher for plugins methods."""
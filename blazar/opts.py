@@ -22,7 +22,10 @@ import blazar.db.migration.cli
 import blazar.manager
 import blazar.manager.service
 import blazar.notification.notifier
+import blazar.plugins.oshosts.availability
+import blazar.plugins.oshosts.capabilities
 import blazar.plugins.oshosts.host_plugin
+import blazar.plugins.oshosts.placement
 import blazar.utils.openstack.keystone
 import blazar.utils.openstack.nova
 
@@ -46,5 +49,9 @@ def list_opts():
         ('notifications', blazar.notification.notifier.notification_opts),
         ('nova', blazar.utils.openstack.nova.nova_opts),
         (blazar.plugins.oshosts.RESOURCE_TYPE,
-         blazar.plugins.oshosts.host_plugin.plugin_opts),
+         itertools.chain(
+             blazar.plugins.oshosts.host_plugin.plugin_opts,
+             blazar.plugins.oshosts.availability.availability_opts,
+             blazar.plugins.oshosts.capabilities.capabilities_opts,
+             blazar.plugins.oshosts.placement.placement_opts)),
     ]
@@ -20,6 +20,7 @@ from oslo_log import log as logging
 import six
 
 from blazar.db import api as db_api
+from blazar.manager import exceptions as manager_ex
 
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
@@ -31,6 +32,8 @@ class BasePlugin(object):
     resource_type = 'none'
     title = None
     description = None
+    # Whether reserve_resource_rows is implemented
+    batch_create = False
 
     def get_plugin_opts(self):
         """Plugin can expose some options that should be specified in conf file
@@ -64,6 +67,25 @@ class BasePlugin(object):
         """Reserve resource."""
         pass
 
+    def reserve_resource_rows(self, reservation_id, values, **kwargs):
+        """Reserve resource without writing it to the DB.
+
+        Used to create a lease with all its reservations in a single
+        transaction, when the plugins of all of them support it. The rows
+        reserved for the previous reservations of the lease are passed as
+        batch_rows.
+
+        :return: a tuple of the resource_id of the reservation, a dict of
+            the rows to insert by table name, with their IDs set, and whether
+            the usage of the reservation was encumbered.
+        """
+        raise NotImplementedError()
+
+    def release_resource_rows(self, reservation_id, values, rows,
+                              encumbered=False, **kwargs):
+        """Undo reserve_resource_rows when the rows could not be inserted."""
+        pass
+
     def update_reservation(self, reservation_id, values):
         """Update reservation."""
         reservation_values = {
@@ -71,6 +93,20 @@ class BasePlugin(object):
         }
         db_api.reservation_update(reservation_id, reservation_values)
 
+    def check_reservation(self, values, **kwargs):
+        """Check that a reservation can be made, without making it.
+
+        :return: a dict describing the resources the reservation would get.
+        """
+        raise manager_ex.DryRunNotSupported(resource_type=self.resource_type)
+
+    def check_reservation_update(self, reservation_id, values, **kwargs):
+        """Check that a reservation can be updated, without updating it.
+
+        :return: a dict describing the resources the reservation would get.
+        """
+        raise manager_ex.DryRunNotSupported(resource_type=self.resource_type)
+
     @abc.abstractmethod
     def on_end(self, resource_id):
         """Delete resource."""
@@ -84,3 +120,12 @@ class BasePlugin(object):
     def before_end(self, resource_id):
         """Take actions before the end of a lease"""
         pass
+
+    def prepare_start(self, resource_id):
+        """Check and prepare a resource shortly before it wakes up.
+
+        Called ahead of on_start when the start of leases is prepared, so
+        that on_start has less to do. It should raise an exception if the
+        resource is unlikely to start.
+        """
+        pass
@@ -12,6 +12,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import bisect
+
 from novaclient import exceptions as nova_exceptions
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -24,6 +26,7 @@ from blazar import exceptions
 from blazar.manager import exceptions as mgr_exceptions
 from blazar.plugins import base
 from blazar.plugins import oshosts
+from blazar.plugins.oshosts import availability
 from blazar.utils.openstack import nova
 from blazar.utils import plugins as plugins_utils
 
@@ -35,6 +38,61 @@ RESERVATION_PREFIX = 'reservation'
 FLAVOR_EXTRA_SPEC = "aggregate_instance_extra_specs:" + RESERVATION_PREFIX
 
 
+class UsageTimeline(object):
+    """Step function of the resources reserved on a host over time.
+
+    The timeline is built from the start_lease and end_lease events of the
+    instance reservations of a host, as returned by
+    db_utils.get_instance_usage_events_by_host. Resources released by a lease
+    ending at the same time another lease starts are reused.
+    """
+
+    # end_lease sorts before start_lease at the same time
+    _EVENT_ORDER = {'end_lease': 0, 'start_lease': 1}
+
+    def __init__(self, events=()):
+        self._times = []
+        self._usages = []
+
+        usage = (0, 0, 0)
+        events = sorted(events, key=lambda e: (
+            e['time'], self._EVENT_ORDER[e['event_type']]))
+        for event in events:
+            sign = 1 if event['event_type'] == 'start_lease' else -1
+            usage = (usage[0] + sign * event['vcpus'],
+                     usage[1] + sign * event['memory_mb'],
+                     usage[2] + sign * event['disk_gb'])
+            if self._times and self._times[-1] == event['time']:
+                self._usages[-1] = usage
+            else:
+                self._times.append(event['time'])
+                self._usages.append(usage)
+
+    def usage_at(self, date):
+        """Return the (vcpus, memory_mb, disk_gb) reserved at a date."""
+        index = bisect.bisect_right(self._times, date)
+        return self._usages[index - 1] if index else (0, 0, 0)
+
+    def peak(self, start_date=None, end_date=None):
+        """Return the peak (vcpus, memory_mb, disk_gb) in [start, end).
+
+        Without dates, the peak of the whole timeline is returned.
+        """
+        first = 0
+        if start_date is not None:
+            first = max(bisect.bisect_right(self._times, start_date) - 1, 0)
+        last = len(self._times)
+        if end_date is not None:
+            last = bisect.bisect_left(self._times, end_date)
+
+        max_vcpus = max_memory = max_disk = 0
+        for vcpus, memory_mb, disk_gb in self._usages[first:last]:
+            max_vcpus = max(max_vcpus, vcpus)
+            max_memory = max(max_memory, memory_mb)
+            max_disk = max(max_disk, disk_gb)
+        return max_vcpus, max_memory, max_disk
+
+
 class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
     """Plugin for virtual instance resources."""
 
@@ -55,10 +113,13 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
         free = []
         non_free = []
 
+        # Only the hosts which may be allocated need to be looked up
+        reserved_host_ids = availability.get_backend().filter_allocated_hosts(
+            [host['id'] for host in hosts], start_date, end_date)
+        reservations_by_host = db_utils.get_reservations_by_host_ids(
+            reserved_host_ids, start_date, end_date)
         for host in hosts:
-            reservations = db_utils.get_reservations_by_host_id(host['id'],
-                                                                start_date,
-                                                                end_date)
+            reservations = reservations_by_host.get(host['id'], [])
             if reservations == []:
                 free.append({'host': host, 'reservations': None})
             elif not filter(lambda x: x['resource_type'] ==
@@ -67,40 +128,15 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
 
         return free, non_free
 
-    def max_usages(self, host, reservations):
-        def resource_usage_by_event(event, resource_type):
-            return event['reservation']['instance_reservations'][resource_type]
+    def usage_timelines(self, host_ids, start_date, end_date):
+        """Return the usage timeline of every host, loaded in one query.
 
-        events_list = []
-        for r in reservations:
-            fetched_events = db_api.event_get_all_sorted_by_filters(
-                sort_key='time', sort_dir='asc',
-                filters={'lease_id': r['lease_id']})
-            events_list.extend([{'event': e, 'reservation': r}
-                                for e in fetched_events])
-
-        events_list.sort(key=lambda x: x['event']['time'])
-
-        max_vcpus = max_memory = max_disk = 0
-        current_vcpus = current_memory = current_disk = 0
-
-        for event in events_list:
-            if event['event']['event_type'] == 'start_lease':
-                current_vcpus += resource_usage_by_event(event, 'vcpus')
-                current_memory += resource_usage_by_event(event, 'memory_mb')
-                current_disk += resource_usage_by_event(event, 'disk_gb')
-                if max_vcpus < current_vcpus:
-                    max_vcpus = current_vcpus
-                if max_memory < current_memory:
-                    max_memory = current_memory
-                if max_disk < current_disk:
-                    max_disk = current_disk
-            elif event['event']['event_type'] == 'end_lease':
-                current_vcpus -= resource_usage_by_event(event, 'vcpus')
-                current_memory -= resource_usage_by_event(event, 'memory_mb')
-                current_disk -= resource_usage_by_event(event, 'disk_gb')
-
-        return max_vcpus, max_memory, max_disk
+        Only the reservations overlapping the period are considered.
+        """
+        events_by_host = db_utils.get_instance_usage_events_by_host(
+            host_ids, start_date, end_date)
+        return dict((host_id, UsageTimeline(events_by_host.get(host_id, ())))
+                    for host_id in host_ids)
 
     def pickup_hosts(self, cpus, memory, disk, amount, start_date, end_date):
         """Checks whether Blazar can accommodate the request.
@@ -130,17 +166,21 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
         free_hosts, reserved_hosts = \
             self.filter_hosts_by_reservation(hosts, start_date, end_date)
 
+        timelines = self.usage_timelines(
+            [host_info['host']['id'] for host_info in reserved_hosts],
+            start_date, end_date)
+
         host_ids = []
         for host_info in reserved_hosts:
             host = host_info['host']
-            reservations = host_info['reservations']
-            max_cpus, max_memory, max_disk = self.max_usages(host,
-                                                             reservations)
+            max_cpus, max_memory, max_disk = timelines[host['id']].peak()
 
             if not (max_cpus + cpus > host['vcpus'] or
                     max_memory + memory > host['memory_mb'] or
                     max_disk + disk > host['local_gb']):
                 host_ids.append(host['id'])
+                if len(host_ids) >= int(amount):
+                    break
 
         if len(host_ids) >= int(amount):
             return host_ids[:int(amount)]
@@ -209,6 +249,23 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
         if missing_attr:
             raise mgr_exceptions.MissingParameter(param=','.join(missing_attr))
 
+    def check_reservation(self, values, **kwargs):
+        """Check that a reservation can be made, without making it.
+
+        :return: a dict with the resource_type and the IDs of the hosts
+            which would accommodate the instances.
+        """
+        self.validate_reservation_param(values)
+
+        if bool_from_string(values['affinity']):
+            raise exceptions.BlazarException('affinity = True is not '
+                                             'supported.')
+
+        host_ids = self.pickup_hosts(values['vcpus'], values['memory_mb'],
+                                     values['disk_gb'], values['amount'],
+                                     values['start_date'], values['end_date'])
+        return {'resource_type': self.resource_type, 'hosts': host_ids}
+
     def reserve_resource(self, reservation_id, values):
         self.validate_reservation_param(values)
 
@@ -233,9 +290,13 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
         instance_reservation = db_api.instance_reservation_create(
             instance_reservation_val)
 
+        backend = availability.get_backend()
         for host_id in host_ids:
-            db_api.host_allocation_create({'compute_host_id': host_id,
-                                          'reservation_id': reservation_id})
+            allocation = db_api.host_allocation_create(
+                {'compute_host_id': host_id,
+                 'reservation_id': reservation_id})
+            backend.add_allocation(allocation['id'], host_id, reservation_id,
+                                   values['start_date'], values['end_date'])
 
         try:
             flavor, group, pool = self._create_resources(instance_reservation)
@@ -288,8 +349,10 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
 
         allocations = db_api.host_allocation_get_all_by_values(
             reservation_id=instance_reservation['reservation_id'])
+        backend = availability.get_backend()
         for allocation in allocations:
             db_api.host_allocation_destroy(allocation['id'])
+            backend.remove_allocation(allocation['id'])
 
         for server in self.nova.servers.list(search_opts={
                 'flavor': instance_reservation['reservation_id'],
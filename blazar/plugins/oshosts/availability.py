@@ -0,0 +1,648 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Backends answering "is this compute host free for [start, end)?"
+
+The ``db`` backend asks the database, which is always accurate: hosts matching
+a set of queries and free during a period are found with a single statement.
+The ``memory`` backend keeps a per-host sorted list of allocated periods in the
+manager process: it is built once from the database and then updated by the
+plugins every time they create, destroy or move an allocation.
+
+The ``bitmap`` backend additionally keeps, for every host, a bitset of the
+time slots allocated over a rolling horizon starting now. Checking whether a
+host is free during a period is then a single AND between its bitset and the
+mask of the period. Each host with allocations uses one bit per slot of the
+horizon, i.e. horizon_days * 1440 / slot_minutes bits: 16 KiB per host for the
+default 90 days with 1 minute slots. Periods which are not entirely within the
+horizon are checked by the ``db`` backend. The allocations can be saved to a
+snapshot file, so that a restarted manager only reads the allocations changed
+since the snapshot was written.
+
+Only one blazar-manager process should modify allocations when the ``memory``
+or ``bitmap`` backend is used, since other processes cannot update its index.
+"""
+
+import abc
+import bisect
+import collections
+import datetime
+import json
+import os
+
+from oslo_config import cfg
+from oslo_log import log as logging
+import six
+
+from blazar.db import api as db_api
+from blazar.db import utils as db_utils
+from blazar.plugins import oshosts as plugin
+from blazar.plugins.oshosts import capabilities
+from blazar.utils import pool
+
+availability_opts = [
+    cfg.StrOpt('availability_backend',
+               default='db',
+               choices=['db', 'memory', 'bitmap'],
+               help='Backend used to find the compute hosts free during a '
+                    'reservation period. "db" queries the database, '
+                    '"memory" keeps an index of the host allocations in the '
+                    'blazar-manager process and "bitmap" also keeps a bitset '
+                    'of the allocated time slots of every host.'),
+    cfg.IntOpt('availability_slot_minutes',
+               default=1,
+               min=1,
+               help='Length in minutes of a time slot of the bitmap '
+                    'availability backend. A slot partially allocated is '
+                    'considered busy.'),
+    cfg.IntOpt('availability_horizon_days',
+               default=90,
+               min=1,
+               help='Number of days covered by the bitsets of the bitmap '
+                    'availability backend. Every host with allocations uses '
+                    'availability_horizon_days * 1440 / '
+                    'availability_slot_minutes bits of memory.'),
+    cfg.StrOpt('availability_snapshot_file',
+               help='File where the bitmap availability backend saves the '
+                    'host allocations, to be reloaded on restart. Snapshots '
+                    'are disabled if not set.'),
+    cfg.IntOpt('availability_snapshot_interval',
+               default=300,
+               min=0,
+               help='Minimum number of seconds between two snapshots of the '
+                    'bitmap availability backend.'),
+    cfg.IntOpt('availability_pool_size',
+               default=1,
+               min=1,
+               help='Maximum number of candidate hosts checked concurrently '
+                    'by green threads when the database is queried host by '
+                    'host. The checks only overlap with a database driver '
+                    'which yields to eventlet, like PyMySQL: sqlite3 and '
+                    'MySQLdb block the whole process during a query.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(availability_opts, group=plugin.RESOURCE_TYPE)
+LOG = logging.getLogger(__name__)
+
+_BACKEND = None
+
+
+@six.add_metaclass(abc.ABCMeta)
+class BaseAvailability(object):
+    """Interface of the host availability backends."""
+
+    name = None
+
+    def load(self):
+        """Initialize the backend."""
+        pass
+
+    def add_allocation(self, allocation_id, host_id, reservation_id,
+                       start_date, end_date):
+        """Record that a host is allocated to a reservation."""
+        pass
+
+    def remove_allocation(self, allocation_id):
+        """Record that an allocation has been destroyed."""
+        pass
+
+    def move_reservation(self, reservation_id, start_date, end_date):
+        """Record that the period of a reservation has changed."""
+        pass
+
+    def filter_allocated_hosts(self, host_ids, start_date, end_date):
+        """Return the hosts which may be allocated during a period.
+
+        The hosts filtered out are known to be free during the period. By
+        default no host is filtered out.
+        """
+        return list(host_ids)
+
+    def find_free_hosts(self, queries, start_date, end_date):
+        """Split the hosts matching the queries free during a period.
+
+        :param queries: array of queries "key op value", as accepted by
+            host_get_all_by_queries.
+        :return: a tuple (not_allocated, allocated) of lists of host IDs, like
+            get_free_hosts.
+        """
+        host_ids = capabilities.match_hosts(queries)
+        if host_ids is None:
+            host_ids = [host['id']
+                        for host in db_api.host_get_all_by_queries(queries)]
+        return self.get_free_hosts(host_ids, start_date, end_date)
+
+    def get_gaps(self, host_ids, start_date, end_date):
+        """Return the free gaps of hosts around a period.
+
+        :param host_ids: hosts free during [start_date, end_date).
+        :return: a dict mapping the host IDs to tuples (before, after), the
+            number of seconds between the previous allocation of the host
+            and start_date, and between end_date and its next allocation.
+            A gap is None when there is no such allocation.
+        """
+        adjacent = self._adjacent_allocations(host_ids, start_date, end_date)
+        gaps = {}
+        for host_id in host_ids:
+            previous_end, next_start = adjacent.get(host_id, (None, None))
+            gaps[host_id] = (
+                None if previous_end is None
+                else (start_date - previous_end).total_seconds(),
+                None if next_start is None
+                else (next_start - end_date).total_seconds())
+        return gaps
+
+    def _adjacent_allocations(self, host_ids, start_date, end_date):
+        """Return the (previous_end, next_start) dates of hosts."""
+        if not host_ids:
+            return {}
+        return db_utils.get_adjacent_allocations_by_host(
+            host_ids, start_date, end_date)
+
+    @abc.abstractmethod
+    def get_free_hosts(self, host_ids, start_date, end_date):
+        """Split the hosts free during [start_date, end_date).
+
+        :return: a tuple (not_allocated, allocated) of lists of host IDs, the
+            first one containing the hosts without any allocation and the
+            second one the allocated hosts which are free during the period.
+            The order of host_ids is kept in both lists.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_busy_hosts(self, host_ids, reservation_id, old_start_date,
+                       old_end_date, start_date, end_date):
+        """Return the hosts which can't keep a reservation on a new period.
+
+        :param host_ids: hosts currently allocated to the reservation.
+        :param old_start_date: current start date of the reservation.
+        :param old_end_date: current end date of the reservation.
+        """
+        pass
+
+
+class DBAvailability(BaseAvailability):
+    """Queries the database for every candidate host."""
+
+    name = 'db'
+
+    def find_free_hosts(self, queries, start_date, end_date):
+        not_allocated = []
+        allocated = []
+        host_ids = capabilities.match_hosts(queries)
+        if host_ids is None:
+            hosts = db_api.host_get_all_free_in_window(queries, start_date,
+                                                       end_date)
+        elif host_ids:
+            hosts = db_api.host_get_all_free_in_window(
+                [], start_date, end_date, host_ids=host_ids)
+        else:
+            hosts = []
+        for host, is_allocated in hosts:
+            if is_allocated:
+                allocated.append(host['id'])
+            else:
+                not_allocated.append(host['id'])
+        return not_allocated, allocated
+
+    def get_free_hosts(self, host_ids, start_date, end_date):
+        def host_state(host_id):
+            if not db_api.host_allocation_get_all_by_values(
+                    compute_host_id=host_id):
+                return 'not_allocated'
+            elif db_utils.get_free_periods(
+                host_id,
+                start_date,
+                end_date,
+                end_date - start_date,
+            ) == [
+                (start_date, end_date),
+            ]:
+                return 'allocated'
+            return None
+
+        not_allocated = []
+        allocated = []
+        for host_id, state in pool.evaluate(
+                host_state, host_ids,
+                CONF[plugin.RESOURCE_TYPE].availability_pool_size):
+            if state == 'not_allocated':
+                not_allocated.append(host_id)
+            elif state == 'allocated':
+                allocated.append(host_id)
+        return not_allocated, allocated
+
+    def get_busy_hosts(self, host_ids, reservation_id, old_start_date,
+                       old_end_date, start_date, end_date):
+        busy = []
+        max_start = max(old_start_date, start_date)
+        min_end = min(old_end_date, end_date)
+        full_periods_by_host = db_utils.get_full_periods_by_host(
+            host_ids, start_date, end_date, datetime.timedelta(seconds=1))
+        for host_id in host_ids:
+            full_periods = full_periods_by_host[host_id]
+            if not (len(full_periods) == 0 or
+                    (len(full_periods) == 1 and
+                     full_periods[0][0] == max_start and
+                     full_periods[0][1] == min_end)):
+                busy.append(host_id)
+        return busy
+
+
+class MemoryAvailability(BaseAvailability):
+    """Keeps the allocated periods of every host in memory.
+
+    Periods of a host are kept sorted by start date, so that checking a host
+    only looks at the periods starting before the end of the requested
+    window and ending after its start.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._allocations = {}
+        self._reservations = {}
+        self._reservation_allocations = collections.defaultdict(set)
+        self._periods = collections.defaultdict(list)
+        self._longest = collections.defaultdict(datetime.timedelta)
+
+    def load(self):
+        self._reset()
+        periods = db_utils.get_host_allocation_periods()
+        for allocation_id, host_id, reservation_id, start, end in periods:
+            self.add_allocation(allocation_id, host_id, reservation_id,
+                                start, end)
+        LOG.info('Loaded %d host allocations in the availability index',
+                 len(self._allocations))
+
+    def add_allocation(self, allocation_id, host_id, reservation_id,
+                       start_date, end_date):
+        if allocation_id in self._allocations:
+            self.remove_allocation(allocation_id)
+        if self._reservations.get(reservation_id,
+                                  (start_date, end_date)) != (start_date,
+                                                              end_date):
+            self.move_reservation(reservation_id, start_date, end_date)
+        self._allocations[allocation_id] = (host_id, reservation_id)
+        self._reservations[reservation_id] = (start_date, end_date)
+        self._reservation_allocations[reservation_id].add(allocation_id)
+        self._insert(host_id, start_date, end_date, allocation_id)
+
+    def remove_allocation(self, allocation_id):
+        try:
+            host_id, reservation_id = self._allocations.pop(allocation_id)
+        except KeyError:
+            return
+        start_date, end_date = self._reservations[reservation_id]
+        allocations = self._reservation_allocations[reservation_id]
+        allocations.discard(allocation_id)
+        if not allocations:
+            del self._reservation_allocations[reservation_id]
+            del self._reservations[reservation_id]
+        periods = self._periods[host_id]
+        periods.remove((start_date, end_date, allocation_id))
+        if not periods:
+            del self._periods[host_id]
+            self._longest.pop(host_id, None)
+
+    def move_reservation(self, reservation_id, start_date, end_date):
+        if reservation_id not in self._reservations:
+            return
+        old_start, old_end = self._reservations[reservation_id]
+        self._reservations[reservation_id] = (start_date, end_date)
+        for allocation_id in self._reservation_allocations[reservation_id]:
+            host_id = self._allocations[allocation_id][0]
+            self._periods[host_id].remove((old_start, old_end,
+                                           allocation_id))
+            self._insert(host_id, start_date, end_date, allocation_id)
+
+    def _insert(self, host_id, start_date, end_date, allocation_id):
+        bisect.insort(self._periods[host_id],
+                      (start_date, end_date, allocation_id))
+        self._longest[host_id] = max(self._longest[host_id],
+                                     end_date - start_date)
+
+    def _overlapping(self, host_id, start_date, end_date):
+        """Yield the allocations of a host overlapping the period."""
+        periods = self._periods.get(host_id)
+        if not periods:
+            return
+        # Periods starting at or after end_date can't overlap, and periods
+        # starting before start_date - longest can't reach start_date.
+        lowest = start_date - self._longest[host_id]
+        index = bisect.bisect_left(periods, (end_date,))
+        while index > 0:
+            index -= 1
+            start, end, allocation_id = periods[index]
+            if start < lowest:
+                break
+            if end > start_date:
+                yield allocation_id
+
+    def filter_allocated_hosts(self, host_ids, start_date, end_date):
+        return [host_id for host_id in host_ids
+                if next(self._overlapping(host_id, start_date, end_date),
+                        None) is not None]
+
+    def _adjacent_allocations(self, host_ids, start_date, end_date):
+        adjacent = {}
+        for host_id in host_ids:
+            periods = self._periods.get(host_id)
+            if not periods:
+                continue
+            index = bisect.bisect_left(periods, (end_date,))
+            next_start = periods[index][0] if index < len(periods) else None
+            # Periods starting before end_date end before start_date since
+            # the host is free, the latest end is within longest of the
+            # latest start.
+            previous_end = None
+            while index > 0:
+                index -= 1
+                start, end = periods[index][:2]
+                if (previous_end is not None and
+                        start + self._longest[host_id] <= previous_end):
+                    break
+                if end <= start_date and (previous_end is None or
+                                          end > previous_end):
+                    previous_end = end
+            adjacent[host_id] = (previous_end, next_start)
+        return adjacent
+
+    def get_free_hosts(self, host_ids, start_date, end_date):
+        not_allocated = []
+        allocated = []
+        for host_id in host_ids:
+            if host_id not in self._periods:
+                not_allocated.append(host_id)
+            elif next(self._overlapping(host_id, start_date, end_date),
+                      None) is None:
+                allocated.append(host_id)
+        return not_allocated, allocated
+
+    def get_busy_hosts(self, host_ids, reservation_id, old_start_date,
+                       old_end_date, start_date, end_date):
+        busy = []
+        for host_id in host_ids:
+            for allocation_id in self._overlapping(host_id, start_date,
+                                                   end_date):
+                if self._allocations[allocation_id][1] != reservation_id:
+                    busy.append(host_id)
+                    break
+        return busy
+
+
+class BitmapAvailability(MemoryAvailability):
+    """Keeps a bitset of the allocated time slots of every host.
+
+    Bit i of the bitset of a host is set if the host is allocated during the
+    slot starting at origin + i * slot. The origin follows the current time
+    and is moved forward once a day, the bitsets being rebuilt from the
+    allocated periods kept by MemoryAvailability.
+    """
+
+    name = 'bitmap'
+
+    SNAPSHOT_VERSION = 1
+    SNAPSHOT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+    def __init__(self):
+        conf = CONF[plugin.RESOURCE_TYPE]
+        self._slot = datetime.timedelta(minutes=conf.availability_slot_minutes)
+        self._slots = (conf.availability_horizon_days * 24 * 60 //
+                       conf.availability_slot_minutes)
+        self._snapshot_file = conf.availability_snapshot_file
+        self._snapshot_interval = datetime.timedelta(
+            seconds=conf.availability_snapshot_interval)
+        self._db = DBAvailability()
+        super(BitmapAvailability, self).__init__()
+
+    def _reset(self):
+        super(BitmapAvailability, self)._reset()
+        self._bitmaps = {}
+        self._origin = self._current_origin()
+        self._snapshot_date = None
+
+    def _current_origin(self):
+        now = datetime.datetime.utcnow()
+        epoch = datetime.datetime(1970, 1, 1)
+        return now - datetime.timedelta(
+            seconds=(now - epoch).total_seconds() %
+            self._slot.total_seconds())
+
+    def _mask(self, start_date, end_date):
+        """Return the mask of the slots overlapping [start, end)."""
+        slot = self._slot.total_seconds()
+        first = int((start_date - self._origin).total_seconds() // slot)
+        last = -int(-(end_date - self._origin).total_seconds() // slot)
+        first = max(first, 0)
+        last = min(last, self._slots)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def _bitmap(self, host_id, reservation_id=None):
+        """Build the bitset of a host, ignoring a reservation."""
+        bitmap = 0
+        for start_date, end_date, allocation_id in self._periods.get(host_id,
+                                                                     ()):
+            if self._allocations[allocation_id][1] != reservation_id:
+                bitmap |= self._mask(start_date, end_date)
+        return bitmap
+
+    def _rebuild(self, host_id):
+        bitmap = self._bitmap(host_id)
+        if bitmap:
+            self._bitmaps[host_id] = bitmap
+        else:
+            self._bitmaps.pop(host_id, None)
+
+    def _roll(self):
+        """Move the origin forward once it is a day old."""
+        origin = self._current_origin()
+        if origin - self._origin >= datetime.timedelta(days=1):
+            self._origin = origin
+            self._bitmaps = {}
+            for host_id in self._periods:
+                self._rebuild(host_id)
+
+    def _in_horizon(self, start_date, end_date):
+        self._roll()
+        return (self._origin <= start_date and
+                end_date <= self._origin + self._slots * self._slot)
+
+    def _insert(self, host_id, start_date, end_date, allocation_id):
+        super(BitmapAvailability, self)._insert(host_id, start_date,
+                                                end_date, allocation_id)
+        mask = self._mask(start_date, end_date)
+        if mask:
+            self._bitmaps[host_id] = self._bitmaps.get(host_id, 0) | mask
+
+    def add_allocation(self, allocation_id, host_id, reservation_id,
+                       start_date, end_date):
+        super(BitmapAvailability, self).add_allocation(
+            allocation_id, host_id, reservation_id, start_date, end_date)
+        self._changed()
+
+    def remove_allocation(self, allocation_id):
+        if allocation_id not in self._allocations:
+            return
+        host_id = self._allocations[allocation_id][0]
+        super(BitmapAvailability, self).remove_allocation(allocation_id)
+        self._rebuild(host_id)
+        self._changed()
+
+    def move_reservation(self, reservation_id, start_date, end_date):
+        host_ids = set(self._allocations[allocation_id][0]
+                       for allocation_id in
+                       self._reservation_allocations.get(reservation_id, ()))
+        super(BitmapAvailability, self).move_reservation(
+            reservation_id, start_date, end_date)
+        for host_id in host_ids:
+            self._rebuild(host_id)
+        self._changed()
+
+    def filter_allocated_hosts(self, host_ids, start_date, end_date):
+        if not self._in_horizon(start_date, end_date):
+            return super(BitmapAvailability, self).filter_allocated_hosts(
+                host_ids, start_date, end_date)
+        mask = self._mask(start_date, end_date)
+        return [host_id for host_id in host_ids
+                if self._bitmaps.get(host_id, 0) & mask]
+
+    def get_free_hosts(self, host_ids, start_date, end_date):
+        if not self._in_horizon(start_date, end_date):
+            return self._db.get_free_hosts(host_ids, start_date, end_date)
+        mask = self._mask(start_date, end_date)
+        not_allocated = []
+        allocated = []
+        for host_id in host_ids:
+            if host_id not in self._periods:
+                not_allocated.append(host_id)
+            elif not self._bitmaps.get(host_id, 0) & mask:
+                allocated.append(host_id)
+        return not_allocated, allocated
+
+    def get_busy_hosts(self, host_ids, reservation_id, old_start_date,
+                       old_end_date, start_date, end_date):
+        if not self._in_horizon(start_date, end_date):
+            return self._db.get_busy_hosts(host_ids, reservation_id,
+                                           old_start_date, old_end_date,
+                                           start_date, end_date)
+        mask = self._mask(start_date, end_date)
+        return [host_id for host_id in host_ids
+                if self._bitmap(host_id, reservation_id) & mask]
+
+    def load(self):
+        if self._snapshot_file and os.path.exists(self._snapshot_file):
+            try:
+                self._load_snapshot()
+            except Exception:
+                LOG.exception('Unable to load the availability snapshot %s, '
+                              'loading host allocations from the database.',
+                              self._snapshot_file)
+            else:
+                return
+        super(BitmapAvailability, self).load()
+        self._save_snapshot()
+
+    def _load_snapshot(self):
+        with open(self._snapshot_file) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        if snapshot['version'] != self.SNAPSHOT_VERSION:
+            raise ValueError('Unsupported snapshot version %s' %
+                             snapshot['version'])
+
+        def to_date(value):
+            return datetime.datetime.strptime(value,
+                                              self.SNAPSHOT_DATE_FORMAT)
+
+        self._reset()
+        watermark = to_date(snapshot['watermark'])
+        for allocation_id, host_id, reservation_id, start, end in (
+                snapshot['allocations']):
+            self.add_allocation(allocation_id, host_id, reservation_id,
+                                to_date(start), to_date(end))
+
+        # Catch up with the changes made after the snapshot was written
+        changes = db_utils.get_host_allocation_changes(watermark)
+        for (allocation_id, host_id, reservation_id, start_date, end_date,
+             deleted) in changes:
+            if deleted:
+                self.remove_allocation(allocation_id)
+            else:
+                self.add_allocation(allocation_id, host_id, reservation_id,
+                                    start_date, end_date)
+        # Allocations can also be deleted without leaving a row
+        current = set(db_utils.get_host_allocation_ids())
+        for allocation_id in set(self._allocations) - current:
+            self.remove_allocation(allocation_id)
+        LOG.info('Loaded %d host allocations from the availability snapshot '
+                 '%s, %d changed since then', len(self._allocations),
+                 self._snapshot_file, len(changes))
+        self._save_snapshot()
+
+    def _changed(self):
+        # No snapshot is written while loading
+        if (self._snapshot_date is not None and
+                datetime.datetime.utcnow() - self._snapshot_date >=
+                self._snapshot_interval):
+            self._save_snapshot()
+
+    def _save_snapshot(self):
+        if not self._snapshot_file:
+            return
+        now = datetime.datetime.utcnow()
+        date_format = self.SNAPSHOT_DATE_FORMAT
+        allocations = []
+        for allocation_id, (host_id, reservation_id) in six.iteritems(
+                self._allocations):
+            start_date, end_date = self._reservations[reservation_id]
+            allocations.append([allocation_id, host_id, reservation_id,
+                                start_date.strftime(date_format),
+                                end_date.strftime(date_format)])
+        snapshot = {'version': self.SNAPSHOT_VERSION,
+                    'watermark': now.strftime(date_format),
+                    'allocations': allocations}
+        tmp_file = self._snapshot_file + '.tmp'
+        try:
+            with open(tmp_file, 'w') as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+            os.rename(tmp_file, self._snapshot_file)
+        except (IOError, OSError):
+            LOG.exception('Unable to write the availability snapshot %s',
+                          self._snapshot_file)
+        self._snapshot_date = now
+
+
+_BACKENDS = dict((cls.name, cls)
+                 for cls in (DBAvailability, MemoryAvailability,
+                             BitmapAvailability))
+
+
+def get_backend():
+    """Return the availability backend set in the configuration."""
+    global _BACKEND
+
+    backend_name = CONF[plugin.RESOURCE_TYPE].availability_backend
+    if _BACKEND is None or _BACKEND.name != backend_name:
+        backend = _BACKENDS[backend_name]()
+        backend.load()
+        _BACKEND = backend
+    return _BACKEND
@@ -0,0 +1,284 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory index of the compute host capabilities.
+
+The index maps every (capability, value) pair to the bitset of the hosts
+having this value, the bit of a host being its position in the index. The
+numeric values of a capability are also kept sorted, along with the running
+union of their bitsets, so that a range operator is answered with a bisection
+and two bitsets. Host columns and extra capabilities are indexed alike.
+
+Queries are evaluated with the semantics of host_get_all_by_queries: values
+are compared as numbers when both operands are numeric and as strings
+otherwise, and a host without the capability never matches. The index is
+built from the database on first use and dropped by the physical host plugin
+whenever a host or its capabilities change. Queries it cannot answer, such as
+"like" filters or unknown capabilities, are left to the database.
+"""
+
+import bisect
+import decimal
+import operator
+import re
+
+from oslo_config import cfg
+from oslo_log import log as logging
+import six
+
+from blazar.db import api as db_api
+from blazar.plugins import oshosts as plugin
+
+capabilities_opts = [
+    cfg.BoolOpt('capability_index',
+                default=False,
+                help='Match the host requirements of reservations against '
+                     'an index of the host capabilities kept in the '
+                     'blazar-manager process instead of querying the '
+                     'database.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(capabilities_opts, group=plugin.RESOURCE_TYPE)
+LOG = logging.getLogger(__name__)
+
+# Same definition as the SQL filters of host_get_all_by_queries
+NUMERIC_RE = re.compile(r'^[-+]?[0-9]+(\.[0-9]+)?$')
+
+OPERATORS = {
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+_INDEX = None
+
+
+def _to_number(value):
+    try:
+        number = decimal.Decimal(value)
+    except (decimal.InvalidOperation, TypeError):
+        return None
+    return number if number.is_finite() else None
+
+
+class _Capability(object):
+    """Values of one capability and the hosts having them."""
+
+    def __init__(self):
+        self.hosts = 0
+        self.values = {}
+        self.numeric = set()
+        self.strings = {}
+        self.numbers = []
+        self.number_bits = []
+        self.prefix = [0]
+
+    def add(self, value, bit, numeric):
+        self.hosts |= bit
+        self.values[value] = self.values.get(value, 0) | bit
+        if numeric:
+            self.numeric.add(value)
+
+    def freeze(self):
+        numbers = {}
+        for value, bits in six.iteritems(self.values):
+            if value in self.numeric:
+                number = decimal.Decimal(value)
+                numbers[number] = numbers.get(number, 0) | bits
+            else:
+                self.strings[value] = bits
+        self.numbers = sorted(numbers)
+        self.number_bits = [numbers[n] for n in self.numbers]
+        for bits in self.number_bits:
+            self.prefix.append(self.prefix[-1] | bits)
+
+    def _compare_numbers(self, op, number):
+        count = len(self.numbers)
+        left = bisect.bisect_left(self.numbers, number)
+        right = bisect.bisect_right(self.numbers, number)
+        if op == '==':
+            return self.number_bits[left] if left < right else 0
+        elif op == '<':
+            return self.prefix[left]
+        elif op == '<=':
+            return self.prefix[right]
+        # Hosts have a single value per capability, so the numbers above
+        # are the complement of the numbers below
+        below = self.prefix[left] if op == '>=' else self.prefix[right]
+        return self.prefix[count] & ~below
+
+    def _compare_strings(self, op, value, values):
+        bits = 0
+        for stored, stored_bits in six.iteritems(values):
+            if OPERATORS[op](stored, value):
+                bits |= stored_bits
+        return bits
+
+    def match(self, op, value):
+        """Return the bitset of the hosts matching "op value"."""
+        if op == 'in':
+            items = value.split(',')
+            if all(_to_number(item) is not None for item in items):
+                bits = 0
+                for item in items:
+                    bits |= self.match('==', item)
+                return bits
+            return self._in_strings(items)
+        if op == '!=':
+            return self.hosts & ~self.match('==', value)
+
+        number = _to_number(value)
+        if number is None:
+            return self._compare_strings(op, value, self.values)
+        return (self._compare_numbers(op, number) |
+                self._compare_strings(op, value, self.strings))
+
+    def _in_strings(self, items):
+        bits = 0
+        for item in items:
+            bits |= self.values.get(item, 0)
+        return bits
+
+
+class CapabilityIndex(object):
+    """Inverted index from host capabilities to bitsets of hosts."""
+
+    def __init__(self):
+        self._hosts = []
+        self._all = 0
+        self._capabilities = {}
+
+    def load(self):
+        """Build the index from the database."""
+        positions = {}
+        capabilities = {}
+
+        def add(host_id, name, value, numeric):
+            capability = capabilities.setdefault(name, _Capability())
+            capability.add(six.text_type(value), 1 << positions[host_id],
+                           numeric)
+
+        hosts = db_api.host_list()
+        columns = set()
+        for position, host in enumerate(hosts):
+            positions[host['id']] = position
+            for name, value in six.iteritems(host):
+                columns.add(name)
+                # Columns are compared with their own type, like in SQL
+                if isinstance(value, six.string_types):
+                    add(host['id'], name, value, False)
+                elif (isinstance(value, six.integer_types) and
+                        not isinstance(value, bool)):
+                    add(host['id'], name, value, True)
+        # A query on a host column never looks at the extra capabilities
+        for capability in db_api.host_extra_capability_list():
+            if (capability['capability_name'] not in columns and
+                    capability['computehost_id'] in positions):
+                value = capability['capability_value']
+                add(capability['computehost_id'],
+                    capability['capability_name'], value,
+                    bool(NUMERIC_RE.match(value)))
+
+        for capability in six.itervalues(capabilities):
+            capability.freeze()
+        self._hosts = [host['id'] for host in hosts]
+        self._all = (1 << len(hosts)) - 1
+        self._capabilities = capabilities
+        LOG.debug("Indexed %d capabilities of %d hosts",
+                  len(capabilities), len(hosts))
+
+    def _match(self, query):
+        """Return the bitset of the hosts matching a query, or None."""
+        children = getattr(query, 'children', None)
+        if children is not None:
+            results = [self._match(child) for child in children]
+            if None in results:
+                return None
+            bits = 0 if query.operator == 'or' else self._all
+            for result in results:
+                if query.operator == 'or':
+                    bits |= result
+                else:
+                    bits &= result
+            return bits
+
+        if hasattr(query, 'key'):
+            key, op, value = query.key, query.op, query.value
+        else:
+            try:
+                key, op, value = query.split(' ', 3)
+            except ValueError:
+                return None
+        capability = self._capabilities.get(key)
+        if (capability is None or value == 'null' or
+                (op not in OPERATORS and op != 'in')):
+            return None
+        return capability.match(op, value)
+
+    def match(self, queries):
+        """Return the IDs of the hosts matching all the queries.
+
+        :param queries: array of queries, as accepted by
+            host_get_all_by_queries.
+        :return: a list of host IDs, or None if the index cannot answer
+            the queries.
+        """
+        bits = self._all
+        for query in queries:
+            result = self._match(query)
+            if result is None:
+                return None
+            bits &= result
+
+        host_ids = []
+        while bits:
+            lowest = bits & -bits
+            host_ids.append(self._hosts[lowest.bit_length() - 1])
+            bits ^= lowest
+        return host_ids
+
+
+def get_index():
+    """Return the capability index, or None if it is disabled."""
+    global _INDEX
+    if not CONF[plugin.RESOURCE_TYPE].capability_index:
+        return None
+    if _INDEX is None:
+        index = CapabilityIndex()
+        index.load()
+        _INDEX = index
+    return _INDEX
+
+
+def invalidate():
+    """Drop the index, it is rebuilt on next use."""
+    global _INDEX
+    _INDEX = None
+
+
+def match_hosts(queries):
+    """Return the IDs of the hosts matching the queries using the index.
+
+    :return: a list of host IDs, or None if the index is disabled or cannot
+        answer the queries.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    return index.match(queries)
@@ -15,13 +15,16 @@
 # under the License.
 
 import datetime
+import heapq
 import shlex
 import subprocess
 
 from novaclient import exceptions as nova_exceptions
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import excutils
 from oslo_utils import strutils
+from oslo_utils import uuidutils
 import redis
 
 from blazar import exceptions as common_ex
@@ -31,7 +34,10 @@ from blazar.db import utils as db_utils
 from blazar.manager import exceptions as manager_ex
 from blazar.plugins import base
 from blazar.plugins import oshosts as plugin
+from blazar.plugins.oshosts import availability
 from blazar.plugins.oshosts import billrate
+from blazar.plugins.oshosts import capabilities as capability_index
+from blazar.plugins.oshosts import placement
 from blazar.utils.openstack import nova
 from blazar.utils import plugins as plugins_utils
 from blazar.utils import trusts
@@ -56,7 +62,18 @@ plugin_opts = [
     cfg.StrOpt('before_end',
                default='',
                help='Actions which we will be taken before the end of '
-                    'the lease')
+                    'the lease'),
+    cfg.IntOpt('allocation_retries',
+               default=3,
+               min=0,
+               help='Number of times new hosts are looked for when hosts '
+                    'selected for a reservation are allocated concurrently '
+                    'to another reservation'),
+    cfg.IntOpt('earliest_window_horizon',
+               default=30,
+               min=1,
+               help='Number of days searched for the earliest window where '
+                    'a host reservation fits, when no end date is given'),
 ]
 
 CONF = cfg.CONF
@@ -65,9 +82,48 @@ LOG = logging.getLogger(__name__)
 
 
 before_end_options = ['', 'snapshot', 'default', 'email']
+LEASE_DATE_FORMAT = "%Y-%m-%d %H:%M"
 BillingError = common_ex.NotAuthorized
 
 
+def _earliest_window(host_ids, free_periods, duration, count):
+    """Find the earliest date when at least count hosts are free for duration.
+
+    Every free period (start, end) of a host gives the interval of dates
+    [start, end - duration] when a reservation could start on it. The
+    intervals of each host are already sorted, so their bounds are merged
+    across hosts with a k-way merge and swept once.
+
+    :return: a tuple (start_date, host_ids) with all the hosts free from
+        start_date for duration, or None if there is no such date.
+    """
+    def bounds(index, periods):
+        for start, end in periods:
+            if end - start >= duration:
+                yield start, 0, index
+                yield end - duration, 1, index
+
+    free = set()
+    window_start = None
+    for date, bound, index in heapq.merge(
+            *[bounds(index, free_periods.get(host_id, []))
+              for index, host_id in enumerate(host_ids)]):
+        # The start bounds of a date come before its end bounds: once count
+        # hosts are free, the other hosts becoming free at the same date are
+        # still added before the sweep stops.
+        if window_start is not None and (date > window_start or bound):
+            break
+        if bound == 0:
+            free.add(index)
+            if len(free) >= count:
+                window_start = date
+        else:
+            free.discard(index)
+    if window_start is None:
+        return None
+    return window_start, [host_ids[i] for i in sorted(free)]
+
+
 def dt_hours(dt):
     return dt.total_seconds() / 3600.0
 
@@ -84,6 +140,7 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
     description = 'This plugin starts and shutdowns the hosts.'
     freepool_name = CONF.nova.aggregate_freepool_name
     pool = None
+    batch_create = True
 
     def _setup_redis(self, usage_db_host):
         if not usage_db_host:
@@ -114,11 +171,112 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
             user_domain_name=CONF.os_admin_user_domain_name,
             project_name=CONF.os_admin_project_name,
             project_domain_name=CONF.os_admin_user_domain_name)
+        # Hypervisor host names resolved by prepare_start, by reservation ID
+        # and host ID. They are dropped when the reservation starts, ends or
+        # is updated.
+        self._hypervisor_hostnames = {}
+
+    def setup(self, conf):
+        # Build the availability and capability indexes when the manager
+        # starts rather than during the first lease creation.
+        availability.get_backend()
+        capability_index.get_index()
 
     def reserve_resource(self, reservation_id, values, usage_enforcement=False, usage_db_host=None, user_name=None, project_name=None):
         """Create reservation."""
+        r, host_ids = self._select_hosts(values, usage_enforcement,
+                                         usage_db_host, project_name)
+
+        allocations = self._claim_hosts(
+            reservation_id, values, host_ids,
+            int(values['count_range'].split('-')[0]),
+            values['hypervisor_properties'], values['resource_properties'])
+        host_ids = [allocation['compute_host_id']
+                    for allocation in allocations]
+
+        try:
+            self._encumber_usage(r, values, host_ids, user_name,
+                                 project_name)
+            host_rsrv_values = self._create_pool(reservation_id, values)
+            host_reservation = db_api.host_reservation_create(host_rsrv_values)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._release_allocations(allocations)
+
+        backend = availability.get_backend()
+        for allocation in allocations:
+            backend.add_allocation(allocation['id'],
+                                   allocation['compute_host_id'],
+                                   reservation_id, values['start_date'],
+                                   values['end_date'])
+        return host_reservation['id']
+
+    def reserve_resource_rows(self, reservation_id, values,
+                              usage_enforcement=False, usage_db_host=None,
+                              user_name=None, project_name=None,
+                              batch_rows=None):
+        """Select the hosts of a reservation without allocating them.
+
+        The allocations are inserted with the lease, in the transaction
+        which checks that the hosts are still free.
+
+        :param batch_rows: rows reserved for the other reservations of the
+            lease, whose hosts are not selected again.
+        """
+        batch_rows = batch_rows or {}
+        exclude = set(allocation['compute_host_id'] for allocation
+                      in batch_rows.get('computehost_allocations', []))
+        r, host_ids = self._select_hosts(values, usage_enforcement,
+                                         usage_db_host, project_name,
+                                         exclude=exclude)
+        encumbered = self._encumber_usage(r, values, host_ids, user_name,
+                                          project_name)
+        try:
+            host_reservation = self._create_pool(reservation_id, values)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if encumbered:
+                    self._release_usage(r, values, host_ids, project_name)
+        host_reservation['id'] = uuidutils.generate_uuid()
+
+        allocations = []
+        backend = availability.get_backend()
+        for host_id in host_ids:
+            allocation = {'id': uuidutils.generate_uuid(),
+                          'compute_host_id': host_id,
+                          'reservation_id': reservation_id}
+            allocations.append(allocation)
+            backend.add_allocation(allocation['id'], host_id, reservation_id,
+                                   values['start_date'], values['end_date'])
+        return host_reservation['id'], {
+            'computehost_reservations': [host_reservation],
+            'computehost_allocations': allocations}, encumbered
+
+    def release_resource_rows(self, reservation_id, values, rows,
+                              encumbered=False, usage_enforcement=False,
+                              usage_db_host=None, project_name=None):
+        """Undo reserve_resource_rows, the rows not being inserted."""
+        allocations = rows.get('computehost_allocations', [])
+        backend = availability.get_backend()
+        for allocation in allocations:
+            backend.remove_allocation(allocation['id'])
+
+        pool = nova.ReservationPool()
+        for host_reservation in rows.get('computehost_reservations', []):
+            pool.delete(host_reservation['aggregate_id'])
+
+        if encumbered:
+            self._release_usage(self._setup_redis(usage_db_host), values,
+                                [allocation['compute_host_id']
+                                 for allocation in allocations],
+                                project_name)
+
+    def _select_hosts(self, values, usage_enforcement, usage_db_host,
+                      project_name, exclude=None):
+        """Return the usage DB client, or None, and the matching hosts."""
         self._check_params(values)
 
+        r = None
         if usage_enforcement:
             r = self._setup_redis(usage_db_host)
             self._init_usage_values(r, project_name)
@@ -127,10 +285,7 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
             try:
                 balance = float(r.hget('balance', project_name))
                 encumbered = float(r.hget('encumbered', project_name))
-                start_date = values['start_date']
-                end_date = values['end_date']
-                duration = end_date - start_date
-                hours = (duration.days * 86400 + duration.seconds) / 3600.0
+                hours = dt_hours(values['end_date'] - values['start_date'])
                 requested = hours * float(values['max'])
                 left = balance - encumbered
                 if left - requested < 0:
@@ -145,20 +300,25 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
             values['count_range'],
             values['start_date'],
             values['end_date'],
+            exclude=exclude,
         )
         if not host_ids:
             raise manager_ex.NotEnoughHostsAvailable()
+        return r, host_ids
 
+    def _encumber_usage(self, r, values, host_ids, user_name, project_name):
+        """Encumber the usage of the reservation.
+
+        :return: whether the encumbered usage of the project was increased.
+        """
+        encumbered = False
         # Check if we have enough available SUs for this reservation
-        if usage_enforcement:
+        if r is not None:
             total_su_factor = sum(billrate.computehost_billrate(host_id) for host_id in host_ids)
             try:
                 balance = float(r.hget('balance', project_name))
                 encumbered = float(r.hget('encumbered', project_name))
-                start_date = values['start_date']
-                end_date = values['end_date']
-                duration = end_date - start_date
-                hours = duration.total_seconds() / 3600.0
+                hours = dt_hours(values['end_date'] - values['start_date'])
                 requested = hours * total_su_factor
                 left = balance - encumbered
                 if left - requested < 0:
@@ -167,6 +327,7 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                 LOG.info("Increasing encumbered for project {} by {:.2f} ({:.2f} hours @ {:.2f} SU/hr)"
                     .format(project_name, requested, hours, total_su_factor))
                 r.hincrbyfloat('encumbered', project_name, str(requested))
+                encumbered = True
                 LOG.info("Usage encumbered for project %s now %s", project_name, r.hget('encumbered', project_name))
                 LOG.info("Removing lease exception for user %s", user_name)
                 r.hdel('user_exceptions', user_name)
@@ -174,13 +335,34 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                 LOG.exception("cannot connect to redis host %s", CONF.manager.usage_db_host)
         else:
             LOG.info("Usage enforcement not in effect")
+        return encumbered
 
+    def _release_usage(self, r, values, host_ids, project_name):
+        if r is None:
+            return
+        total_su_factor = sum(billrate.computehost_billrate(host_id)
+                              for host_id in host_ids)
+        requested = (dt_hours(values['end_date'] - values['start_date']) *
+                     total_su_factor)
+        try:
+            LOG.info("Decreasing encumbered for project {} by {:.2f}"
+                     .format(project_name, requested))
+            r.hincrbyfloat('encumbered', project_name, str(-requested))
+        except redis.exceptions.ConnectionError:
+            LOG.exception("cannot connect to redis host %s",
+                          CONF.manager.usage_db_host)
+
+    def _create_pool(self, reservation_id, values):
+        """Create the aggregate of a reservation.
+
+        :return: the values of the host reservation, without ID.
+        """
         pool = nova.ReservationPool()
         pool_name = reservation_id
         az_name = "%s%s" % (CONF[self.resource_type].blazar_az_prefix,
                             pool_name)
         pool_instance = pool.create(name=pool_name, az=az_name)
-        host_rsrv_values = {
+        return {
             'reservation_id': reservation_id,
             'aggregate_id': pool_instance.id,
             'resource_properties': values['resource_properties'],
@@ -189,11 +371,172 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
             'status': 'pending',
             'before_end': values['before_end']
         }
-        host_reservation = db_api.host_reservation_create(host_rsrv_values)
-        for host_id in host_ids:
-            db_api.host_allocation_create({'compute_host_id': host_id,
-                                          'reservation_id': reservation_id})
-        return host_reservation['id']
+
+    def _claim_hosts(self, reservation_id, values, host_ids, min_hosts,
+                     hypervisor_properties, resource_properties):
+        """Allocate hosts to a reservation, replacing hosts taken meanwhile.
+
+        Every host is claimed with an atomic check and insert in the
+        database. A host allocated to another reservation since it was
+        selected, e.g. by another blazar-manager worker, is replaced by a
+        new candidate, up to allocation_retries times.
+
+        :return: the allocations created, at least min_hosts of them.
+        """
+        allocations = []
+        tried = set()
+        candidates = host_ids
+        retries = CONF[self.resource_type].allocation_retries
+        while True:
+            missing = 0
+            for host_id in candidates:
+                tried.add(host_id)
+                try:
+                    allocations.append(db_api.host_allocation_claim(
+                        {'compute_host_id': host_id,
+                         'reservation_id': reservation_id},
+                        values['start_date'], values['end_date']))
+                except db_ex.BlazarDBHostNotFree:
+                    LOG.info("Host %s was allocated to another reservation "
+                             "concurrently", host_id)
+                    missing += 1
+            if not missing or retries <= 0:
+                break
+            retries -= 1
+            candidates = self._matching_hosts(
+                hypervisor_properties, resource_properties,
+                '1-' + str(missing), values['start_date'],
+                values['end_date'], exclude=tried)
+            if not candidates:
+                break
+
+        if len(allocations) < min_hosts:
+            self._release_allocations(allocations)
+            raise manager_ex.NotEnoughHostsAvailable()
+        return allocations
+
+    def _release_allocations(self, allocations):
+        for allocation in allocations:
+            db_api.host_allocation_destroy(allocation['id'], soft_delete=False)
+
+    def _usage_left(self, usage_db_host, project_name):
+        """Return the SUs left to a project without initializing its usage.
+
+        Return None if the usage DB cannot be reached.
+        """
+        r = self._setup_redis(usage_db_host)
+        try:
+            balance = r.hget('balance', project_name)
+            encumbered = r.hget('encumbered', project_name)
+        except redis.exceptions.ConnectionError:
+            LOG.exception("cannot connect to redis host %s",
+                          CONF.manager.usage_db_host)
+            return None
+        if balance is None:
+            balance = CONF.manager.usage_default_allocated
+        if encumbered is None:
+            encumbered = 0.0
+        return float(balance) - float(encumbered)
+
+    def check_reservation(self, values, usage_enforcement=False,
+                          usage_db_host=None, user_name=None,
+                          project_name=None):
+        """Check that a reservation can be made, without making it.
+
+        Hosts are selected as reserve_resource would select them, but no
+        aggregate, allocation or usage encumbrance is created.
+
+        :return: a dict with the resource_type, the IDs of the selected hosts
+            and the SUs the reservation would cost.
+        """
+        self._check_params(values)
+
+        host_ids = self._matching_hosts(
+            values['hypervisor_properties'],
+            values['resource_properties'],
+            values['count_range'],
+            values['start_date'],
+            values['end_date'],
+        )
+        if not host_ids:
+            raise manager_ex.NotEnoughHostsAvailable()
+
+        total_su_factor = sum(billrate.computehost_billrate(host_id)
+                              for host_id in host_ids)
+        requested = (dt_hours(values['end_date'] - values['start_date']) *
+                     total_su_factor)
+        if usage_enforcement:
+            left = self._usage_left(usage_db_host, project_name)
+            if left is not None and left - requested < 0:
+                raise BillingError(
+                    'Reservation for project {} would spend {:.2f} SUs, '
+                    'only {:.2f} left'.format(project_name, requested, left))
+
+        return {'resource_type': self.resource_type,
+                'hosts': host_ids,
+                'cost': requested}
+
+    def check_reservation_update(self, reservation_id, values,
+                                 usage_enforcement=False, usage_db_host=None,
+                                 project_name=None):
+        """Check that a reservation can be updated, without updating it.
+
+        Busy hosts are replaced as update_reservation would replace them, but
+        no aggregate, allocation or usage encumbrance is changed.
+
+        :return: a dict with the resource_type, the IDs of the hosts the
+            reservation would have and the SUs it would cost in total.
+        """
+        reservation = db_api.reservation_get(reservation_id)
+        lease = db_api.lease_get(reservation['lease_id'])
+        host_ids = [allocation['compute_host_id'] for allocation
+                    in db_api.host_allocation_get_all_by_values(
+                        reservation_id=reservation_id)]
+        old_su_factor = sum(billrate.computehost_billrate(host_id)
+                            for host_id in host_ids)
+
+        # if the time period is growing
+        if (values['start_date'] < lease['start_date'] or
+                values['end_date'] > lease['end_date']):
+            busy_host_ids = availability.get_backend().get_busy_hosts(
+                host_ids, reservation_id,
+                lease['start_date'], lease['end_date'],
+                values['start_date'], values['end_date'])
+            if busy_host_ids:
+                if reservation['status'] == 'active':
+                    raise manager_ex.NotEnoughHostsAvailable()
+                host_reservation = db_api.host_reservation_get(
+                    reservation['resource_id'])
+                new_host_ids = self._matching_hosts(
+                    host_reservation['hypervisor_properties'],
+                    host_reservation['resource_properties'],
+                    str(len(busy_host_ids)) + '-' + str(len(busy_host_ids)),
+                    values['start_date'],
+                    values['end_date'])
+                if not new_host_ids:
+                    raise manager_ex.NotEnoughHostsAvailable()
+                host_ids = [host_id for host_id in host_ids
+                            if host_id not in busy_host_ids] + new_host_ids
+
+        new_su_factor = sum(billrate.computehost_billrate(host_id)
+                            for host_id in host_ids)
+        old_cost = (dt_hours(lease['end_date'] - lease['start_date']) *
+                    old_su_factor)
+        new_cost = (dt_hours(values['end_date'] - values['start_date']) *
+                    new_su_factor)
+        if usage_enforcement:
+            if not isclose(new_su_factor, old_su_factor, rel_tol=1e-5):
+                raise BillingError("Modifying a reservation that changes the "
+                                   "SU cost is prohibited")
+            left = self._usage_left(usage_db_host, project_name)
+            if left is not None and new_cost - old_cost > left:
+                raise BillingError(
+                    'Update reservation would spend {:.2f} more SUs, '
+                    'only {:.2f} left'.format(new_cost - old_cost, left))
+
+        return {'resource_type': self.resource_type,
+                'hosts': host_ids,
+                'cost': new_cost}
 
     def update_reservation(self, reservation_id, values, usage_enforcement=False, usage_db_host=None, project_name=None):
         """Update reservation."""
@@ -201,6 +544,9 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
             r = self._setup_redis(usage_db_host)
             self._init_usage_values(r, project_name)
 
+        # The hosts may change, they are resolved again by on_start
+        self._hypervisor_hostnames.pop(reservation_id, None)
+
         reservation = db_api.reservation_get(reservation_id)
         lease = db_api.lease_get(reservation['lease_id'])
 
@@ -233,24 +579,20 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
         else:
             old_su_factor = new_su_factor = None
 
+        backend = availability.get_backend()
         # if the time period is growing
         if (values['start_date'] < lease['start_date'] or
                 values['end_date'] > lease['end_date']):
-            allocations = [] # allocations to destroy
             hosts_in_pool = []
-            for allocation in host_allocations:
-                full_periods = db_utils.get_full_periods(
-                    allocation['compute_host_id'],
-                    values['start_date'],
-                    values['end_date'],
-                    datetime.timedelta(seconds=1))
-                max_start = max(lease['start_date'], values['start_date'])
-                min_end = min(lease['end_date'], values['end_date'])
-                if not (len(full_periods) == 0 or
-                        (len(full_periods) == 1 and
-                         full_periods[0][0] == max_start and
-                         full_periods[0][1] == min_end)):
-                    allocations.append(allocation)
+            busy_host_ids = backend.get_busy_hosts(
+                [allocation['compute_host_id']
+                 for allocation in host_allocations],
+                reservation_id,
+                lease['start_date'], lease['end_date'],
+                values['start_date'], values['end_date'])
+            # allocations to destroy
+            allocations = [allocation for allocation in host_allocations
+                           if allocation['compute_host_id'] in busy_host_ids]
             if allocations:
                 if reservation['status'] == 'active':
                     raise manager_ex.NotEnoughHostsAvailable()
@@ -267,6 +609,12 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                     values['end_date'])
                 if not host_ids:
                     raise manager_ex.NotEnoughHostsAvailable()
+                new_allocations = self._claim_hosts(
+                    reservation_id, values, host_ids, len(allocations),
+                    host_reservation['hypervisor_properties'],
+                    host_reservation['resource_properties'])
+                host_ids = [allocation['compute_host_id']
+                            for allocation in new_allocations]
 
                 if usage_enforcement:
                     for allocation in allocations:
@@ -278,6 +626,7 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                         LOG.warning("SU factor changing from {} to {}"
                                     .format(old_su_factor, new_su_factor))
                         LOG.warning("Refusing factor change!")
+                        self._release_allocations(new_allocations)
                         # XXX easier for usage-reporting, but could probably allow
                         # not-yet-started reservations to be modified without much trouble.
                         raise BillingError("Modifying a reservation that changes the SU cost is prohibited")
@@ -294,12 +643,15 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                 for allocation in allocations:
                     LOG.debug("Dropping host {} from reservation {}".format(allocation['compute_host_id'], reservation_id))
                     db_api.host_allocation_destroy(allocation['id'], soft_delete=False)
+                    backend.remove_allocation(allocation['id'])
 
-                for host_id in host_ids:
+                for allocation in new_allocations:
+                    host_id = allocation['compute_host_id']
                     LOG.debug("Adding host {} to reservation {}".format(host_id, reservation_id))
-                    db_api.host_allocation_create(
-                        {'compute_host_id': host_id,
-                         'reservation_id': reservation_id})
+                    backend.add_allocation(allocation['id'], host_id,
+                                           reservation_id,
+                                           values['start_date'],
+                                           values['end_date'])
                     if hosts_in_pool:
                         host = db_api.host_get(host_id)
                         pool.add_computehost(host_reservation['aggregate_id'],
@@ -330,18 +682,37 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
             LOG.info("Usage encumbered for project {} now {:.2f}"
                      .format(project_name, new_encumbered))
 
+        backend.move_reservation(reservation_id, values['start_date'],
+                                 values['end_date'])
+
     def on_start(self, resource_id):
-        """Add the hosts in the pool."""
+        """Add the hosts in the pool.
+
+        Hosts already in the pool, added by a previous attempt to start the
+        reservation, are skipped.
+        """
         host_reservation = db_api.host_reservation_get(resource_id)
         pool = nova.ReservationPool()
+        pool_hosts = pool.get_computehosts(host_reservation['aggregate_id'])
+        hypervisor_hostnames = self._hypervisor_hostnames.pop(
+            host_reservation['reservation_id'], {})
         added_hosts = []
         for allocation in db_api.host_allocation_get_all_by_values(
                 reservation_id=host_reservation['reservation_id']):
             try:
-                host = db_api.host_get(allocation['compute_host_id'])
-                pool.add_computehost(host_reservation['aggregate_id'],
-                                     host['hypervisor_hostname'])
-                added_hosts.append(host['hypervisor_hostname'])
+                hypervisor_hostname = hypervisor_hostnames.get(
+                    allocation['compute_host_id'])
+                if hypervisor_hostname is None:
+                    hypervisor_hostname = db_api.host_get(
+                        allocation['compute_host_id'])['hypervisor_hostname']
+                if hypervisor_hostname in pool_hosts:
+                    continue
+                try:
+                    pool.add_computehost(host_reservation['aggregate_id'],
+                                         hypervisor_hostname)
+                except manager_ex.AggregateAlreadyHasHost:
+                    continue
+                added_hosts.append(hypervisor_hostname)
             except Exception:
                 if added_hosts:
                     LOG.warn('Removing hosts added to aggregate %s: %s',
@@ -351,6 +722,32 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                             host_reservation['aggregate_id'], host)
                 raise
 
+    def prepare_start(self, resource_id):
+        """Check the aggregate and the hosts of a reservation to start.
+
+        The hypervisor host names are kept for on_start. Hosts which are not
+        in the freepool yet are only reported, since they may be released
+        by a lease ending before this one starts.
+        """
+        host_reservation = db_api.host_reservation_get(resource_id)
+        pool = nova.ReservationPool()
+        pool.get_aggregate_from_name_or_id(host_reservation['aggregate_id'])
+        freepool_hosts = pool.get_computehosts(pool.freepool_name)
+
+        hypervisor_hostnames = {}
+        not_free = []
+        for allocation in db_api.host_allocation_get_all_by_values(
+                reservation_id=host_reservation['reservation_id']):
+            host = db_api.host_get(allocation['compute_host_id'])
+            hypervisor_hostnames[host['id']] = host['hypervisor_hostname']
+            if host['hypervisor_hostname'] not in freepool_hosts:
+                not_free.append(host['hypervisor_hostname'])
+        self._hypervisor_hostnames[host_reservation['reservation_id']] = (
+            hypervisor_hostnames)
+        if not_free:
+            LOG.warning('Hosts of reservation %s not in the freepool yet: '
+                        '%s', host_reservation['reservation_id'], not_free)
+
     def before_end(self, resource_id):
         """Take an action before the end of a lease."""
         host_reservation = db_api.host_reservation_get(resource_id)
@@ -402,12 +799,17 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
             self._init_usage_values(r, project_name)
 
         host_reservation = db_api.host_reservation_get(resource_id)
+        # Leases deleted before starting end here too
+        self._hypervisor_hostnames.pop(host_reservation['reservation_id'],
+                                       None)
         db_api.host_reservation_update(host_reservation['id'],
                                        {'status': 'completed'})
         allocations = db_api.host_allocation_get_all_by_values(
             reservation_id=host_reservation['reservation_id'])
+        backend = availability.get_backend()
         for allocation in allocations:
             db_api.host_allocation_destroy(allocation['id'])
+            backend.remove_allocation(allocation['id'])
         pool = nova.ReservationPool()
         for host in pool.get_computehosts(host_reservation['aggregate_id']):
             for server in self.nova.servers.list(
@@ -530,6 +932,7 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                         db_api.host_extra_capability_create(values)
                     except db_ex.BlazarDBException:
                         cantaddextracapability.append(key)
+            capability_index.invalidate()
             if cantaddextracapability:
                 raise manager_ex.CantAddExtraCapability(
                     keys=cantaddextracapability,
@@ -570,6 +973,7 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                     except (db_ex.BlazarDBException, RuntimeError):
                         cant_update_extra_capability.append(
                             new_capability['capability_name'])
+            capability_index.invalidate()
             if cant_update_extra_capability:
                 raise manager_ex.CantAddExtraCapability(
                     host=host_id,
@@ -598,50 +1002,130 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                 # NOTE(sbauza): Extracapabilities will be destroyed thanks to
                 #  the DB FK.
                 db_api.host_destroy(host_id)
+                capability_index.invalidate()
             except db_ex.BlazarDBException:
                 # Nothing so bad, but we need to advert the admin
                 # he has to rerun
                 raise manager_ex.CantRemoveHost(host=host_id,
                                                 pool=self.freepool_name)
 
-    def _matching_hosts(self, hypervisor_properties, resource_properties,
-                        count_range, start_date, end_date):
-        """Return the matching hosts (preferably not allocated)
-
-        """
-        count_range = count_range.split('-')
-        min_host = count_range[0]
-        max_host = count_range[1]
-        allocated_host_ids = []
-        not_allocated_host_ids = []
+    def _host_queries(self, hypervisor_properties, resource_properties):
+        """Return the host queries matching the properties."""
         filter_array = []
-        # TODO(frossigneux) support "or" operator
         if hypervisor_properties:
             filter_array = plugins_utils.convert_requirements(
                 hypervisor_properties)
         if resource_properties:
             filter_array += plugins_utils.convert_requirements(
                 resource_properties)
-        for host in db_api.host_get_all_by_queries(filter_array):
-            if not db_api.host_allocation_get_all_by_values(
-                    compute_host_id=host['id']):
-                not_allocated_host_ids.append(host['id'])
-            elif db_utils.get_free_periods(
-                host['id'],
-                start_date,
-                end_date,
-                end_date - start_date,
-            ) == [
-                (start_date, end_date),
-            ]:
-                allocated_host_ids.append(host['id'])
-        if len(not_allocated_host_ids) >= int(min_host):
-            return not_allocated_host_ids[:int(max_host)]
-        all_host_ids = allocated_host_ids + not_allocated_host_ids
-        if len(all_host_ids) >= int(min_host):
-            return all_host_ids[:int(max_host)]
+        return filter_array
+
+    def _matching_hosts(self, hypervisor_properties, resource_properties,
+                        count_range, start_date, end_date, exclude=None):
+        """Return the matching hosts (preferably not allocated)
+
+        :param exclude: IDs of hosts which must not be returned.
+        """
+        count_range = count_range.split('-')
+        min_host = count_range[0]
+        max_host = count_range[1]
+        filter_array = self._host_queries(hypervisor_properties,
+                                          resource_properties)
+        backend = availability.get_backend()
+        not_allocated_host_ids, allocated_host_ids = (
+            backend.find_free_hosts(filter_array, start_date, end_date))
+        if exclude:
+            not_allocated_host_ids = [host_id for host_id
+                                      in not_allocated_host_ids
+                                      if host_id not in exclude]
+            allocated_host_ids = [host_id for host_id in allocated_host_ids
+                                  if host_id not in exclude]
+        strategy = placement.get_strategy()
+        gaps = {}
+        if strategy.uses_gaps:
+            gaps = backend.get_gaps(allocated_host_ids, start_date, end_date)
+        return strategy.select(not_allocated_host_ids, allocated_host_ids,
+                               gaps, int(min_host), int(max_host))
+
+    def _date_from_string(self, date_string, date_format=LEASE_DATE_FORMAT):
+        try:
+            return datetime.datetime.strptime(date_string, date_format)
+        except (TypeError, ValueError):
+            raise manager_ex.InvalidDate(date=date_string,
+                                         date_format=date_format)
+
+    def find_earliest_window(self, values):
+        """Find the earliest period where a host reservation would fit.
+
+        :param values: dict with the hypervisor_properties,
+            resource_properties, min and max of a physical:host reservation,
+            its duration in minutes and optionally the start_date ('now' by
+            default) and end_date bounding the search.
+        :return: a dict with the start_date and end_date of the earliest
+            window and the IDs of up to max hosts free during it.
+        """
+        min_hosts = self._convert_int_param(values.get('min'), 'min')
+        max_hosts = self._convert_int_param(values.get('max'), 'max')
+        if not 0 <= min_hosts <= max_hosts:
+            raise manager_ex.InvalidRange()
+        duration = self._convert_int_param(values.get('duration'),
+                                           'duration')
+        if duration <= 0:
+            raise manager_ex.MalformedParameter(param='duration')
+        duration = datetime.timedelta(minutes=duration)
+
+        start_date = values.get('start_date', 'now')
+        if start_date == 'now':
+            start_date = datetime.datetime.utcnow().replace(second=0,
+                                                            microsecond=0)
         else:
-            return []
+            start_date = self._date_from_string(start_date)
+        if values.get('end_date'):
+            end_date = self._date_from_string(values['end_date'])
+        else:
+            end_date = start_date + datetime.timedelta(
+                days=CONF[plugin.RESOURCE_TYPE].earliest_window_horizon)
+
+        filter_array = self._host_queries(
+            values.get('hypervisor_properties'),
+            values.get('resource_properties'))
+        host_ids = [host['id']
+                    for host in db_api.host_get_all_by_queries(filter_array)]
+        free_periods = db_utils.get_free_periods_by_host(
+            host_ids, start_date, end_date, duration)
+
+        window = _earliest_window(host_ids, free_periods, duration,
+                                  max(min_hosts, 1))
+        if window is None:
+            raise manager_ex.NotEnoughHostsAvailable()
+        window_start, window_hosts = window
+        return {
+            'start_date': window_start.strftime(LEASE_DATE_FORMAT),
+            'end_date': (window_start + duration).strftime(LEASE_DATE_FORMAT),
+            'hosts': window_hosts[:max_hosts],
+        }
+
+    def get_utilization_report(self, values):
+        """Return the utilization metrics of hosts during a period.
+
+        :param values: dict with the start_date and end_date of the period
+            and optionally the IDs of the hosts to report on, every host
+            being reported on by default.
+        :return: a list of dicts with the host_id, reservation_time and
+            availability_time (in seconds), reservation_ratio,
+            number_of_reservations, longest_lease and shortest_lease of
+            every host.
+        """
+        for param in ('start_date', 'end_date'):
+            if not values.get(param):
+                raise manager_ex.MissingParameter(param=param)
+        start_date = self._date_from_string(values['start_date'])
+        end_date = self._date_from_string(values['end_date'])
+        if start_date >= end_date:
+            raise manager_ex.InvalidPeriod(start_date=values['start_date'],
+                                           end_date=values['end_date'])
+        return list(db_utils.get_host_utilization(values.get('hosts'),
+                                                  start_date, end_date))
 
     def _convert_int_param(self, param, name):
         """Checks that the parameter is present and can be converted to int."""
@@ -0,0 +1,156 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Strategies choosing the compute hosts allocated to a reservation.
+
+A strategy gets the hosts matching the reservation requirements and free
+during its period, and picks between min and max of them. Strategies are
+loaded with stevedore from the blazar.oshosts.placement namespace.
+
+Strategies which need them get the free gaps of the candidate hosts around
+the requested period: the time between the end of the previous allocation
+of a host and the start of the period, and the time between the end of the
+period and the start of the next allocation. A gap is None when there is no
+such allocation. The gaps are computed by the availability backend for all
+candidates at once.
+"""
+
+import abc
+
+from oslo_config import cfg
+from oslo_log import log as logging
+import six
+from stevedore import driver
+
+from blazar.plugins import oshosts as plugin
+
+placement_opts = [
+    cfg.StrOpt('placement_strategy',
+               default='first_fit',
+               help='Strategy choosing the compute hosts of a reservation '
+                    'among the free ones, loaded from the '
+                    'blazar.oshosts.placement namespace. "first_fit" picks '
+                    'hosts without any allocation first, "best_fit_by_gap" '
+                    'picks the hosts leaving the smallest free gaps around '
+                    'the reservation and "spread" the hosts leaving the '
+                    'largest ones.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(placement_opts, group=plugin.RESOURCE_TYPE)
+LOG = logging.getLogger(__name__)
+
+NAMESPACE = 'blazar.oshosts.placement'
+
+_STRATEGY = None
+
+
+@six.add_metaclass(abc.ABCMeta)
+class BasePlacement(object):
+    """Interface of the placement strategies."""
+
+    # Whether select() needs the free gaps around the period
+    uses_gaps = False
+
+    def select(self, not_allocated, allocated, gaps, min_hosts, max_hosts):
+        """Pick the hosts of a reservation.
+
+        :param not_allocated: IDs of the candidate hosts without any
+            allocation.
+        :param allocated: IDs of the candidate hosts with allocations
+            outside of the period.
+        :param gaps: dict of host ID to a tuple (before, after) of free gaps
+            in seconds, or None. Empty if uses_gaps is False.
+        :return: a list of at least min_hosts and at most max_hosts host
+            IDs, or an empty list if there are not enough candidates.
+        """
+        candidates = not_allocated + allocated
+        if len(candidates) < min_hosts:
+            return []
+        scores = self.scores(candidates, gaps)
+        ranked = sorted(six.moves.range(len(candidates)),
+                        key=scores.__getitem__)
+        return [candidates[i] for i in ranked[:max_hosts]]
+
+    @abc.abstractmethod
+    def scores(self, host_ids, gaps):
+        """Return the scores of the hosts, lower being better."""
+        pass
+
+
+class FirstFit(BasePlacement):
+    """Picks hosts without allocations first, in database order."""
+
+    def select(self, not_allocated, allocated, gaps, min_hosts, max_hosts):
+        if len(not_allocated) >= min_hosts:
+            return not_allocated[:max_hosts]
+        all_host_ids = allocated + not_allocated
+        if len(all_host_ids) >= min_hosts:
+            return all_host_ids[:max_hosts]
+        return []
+
+    def scores(self, host_ids, gaps):
+        return list(six.moves.range(len(host_ids)))
+
+
+def _gap_lengths(host_ids, gaps):
+    """Return the (before, after) gaps of the hosts, None being infinite."""
+    infinite = float('inf')
+    lengths = []
+    for host_id in host_ids:
+        before, after = gaps.get(host_id, (None, None))
+        lengths.append((infinite if before is None else before,
+                        infinite if after is None else after))
+    return lengths
+
+
+class BestFitByGap(BasePlacement):
+    """Picks the hosts leaving the smallest free gaps around the period.
+
+    Reservations are packed next to existing ones, which keeps long free
+    periods available for large or long reservations.
+    """
+
+    uses_gaps = True
+
+    def scores(self, host_ids, gaps):
+        return [(min(before, after), before + after)
+                for before, after in _gap_lengths(host_ids, gaps)]
+
+
+class Spread(BasePlacement):
+    """Picks the hosts leaving the largest free gaps around the period.
+
+    Reservations are spread over the hosts, which leaves room to extend
+    them.
+    """
+
+    uses_gaps = True
+
+    def scores(self, host_ids, gaps):
+        return [(-min(before, after), -(before + after))
+                for before, after in _gap_lengths(host_ids, gaps)]
+
+
+def get_strategy():
+    """Return the configured placement strategy."""
+    global _STRATEGY
+    name = CONF[plugin.RESOURCE_TYPE].placement_strategy
+    if _STRATEGY is None or _STRATEGY[0] != name:
+        manager = driver.DriverManager(namespace=NAMESPACE, name=name,
+                                       invoke_on_load=True)
+        LOG.info('Using the %s placement strategy', name)
+        _STRATEGY = (name, manager.driver)
+    return _STRATEGY[1]
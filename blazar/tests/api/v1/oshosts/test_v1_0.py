@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from werkzeug import datastructures
+
 from blazar.api.v1.oshosts import service as service_api
 from blazar.api.v1.oshosts import v1_0 as api
 from blazar.api.v1 import utils as utils_api
@@ -36,6 +38,10 @@ class RESTApiTestCase(tests.TestCase):
                                              'update_computehost')
         self.delete_computehost = self.patch(self.s_api.API,
                                              'delete_computehost')
+        self.find_earliest_window = self.patch(self.s_api.API,
+                                               'find_earliest_window')
+        self.get_utilization_report = self.patch(self.s_api.API,
+                                                 'get_utilization_report')
 
         self.fake_id = '1'
 
@@ -58,3 +64,30 @@ class RESTApiTestCase(tests.TestCase):
     def test_computehosts_delete(self):
         self.api.computehosts_delete(host_id=self.fake_id)
         self.render.assert_called_once_with()
+
+    def test_computehosts_find_earliest_window(self):
+        self.api.computehosts_find_earliest_window(data=None)
+        self.render.assert_called_once_with(
+            window=self.find_earliest_window())
+
+    def test_computehosts_utilization_report(self):
+        self.patch(self.u_api, 'get_request_args').return_value = (
+            datastructures.MultiDict([('start_date', '2030-01-01 00:00'),
+                                      ('end_date', '2030-02-01 00:00'),
+                                      ('hosts', '1'), ('hosts', '2')]))
+        self.api.computehosts_utilization_report()
+        self.get_utilization_report.assert_called_once_with(
+            {'start_date': '2030-01-01 00:00',
+             'end_date': '2030-02-01 00:00',
+             'hosts': ['1', '2']})
+        self.render.assert_called_once_with(
+            utilization=self.get_utilization_report())
+
+    def test_computehosts_utilization_report_every_host(self):
+        self.patch(self.u_api, 'get_request_args').return_value = (
+            datastructures.MultiDict([('start_date', '2030-01-01 00:00'),
+                                      ('end_date', '2030-02-01 00:00')]))
+        self.api.computehosts_utilization_report()
+        self.get_utilization_report.assert_called_once_with(
+            {'start_date': '2030-01-01 00:00',
+             'end_date': '2030-02-01 00:00'})
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from werkzeug import datastructures
+
 from blazar.api.v1 import service as service_api
 from blazar.api.v1 import utils as utils_api
 from blazar.api.v1 import v1_0 as api
@@ -32,6 +34,8 @@ class RESTApiTestCase(tests.TestCase):
         self.get_lease = self.patch(self.s_api.API, 'get_lease')
         self.update_lease = self.patch(self.s_api.API, 'update_lease')
         self.delete_lease = self.patch(self.s_api.API, 'delete_lease')
+        self.get_lease_statistics = self.patch(self.s_api.API,
+                                               'get_lease_statistics')
 
         self.fake_id = '1'
 
@@ -54,3 +58,13 @@ class RESTApiTestCase(tests.TestCase):
     def test_leases_delete(self):
         self.api.leases_delete(lease_id=self.fake_id)
         self.render.assert_called_once_with()
+
+    def test_leases_statistics(self):
+        self.patch(self.u_api, 'get_request_args').return_value = (
+            datastructures.MultiDict([('start_date', '2030-01-01 00:00'),
+                                      ('project_id', 'project')]))
+        self.api.leases_statistics()
+        self.get_lease_statistics.assert_called_once_with(
+            {'start_date': '2030-01-01 00:00', 'project_id': 'project'})
+        self.render.assert_called_once_with(
+            statistics=self.get_lease_statistics())
@@ -106,6 +106,17 @@ class TestListLeases(api.APITest):
         response = self.get_json(self.path)
         self.assertEqual([self.fake_lease], response)
 
+    def test_one_with_events(self):
+        event = {u'id': u'1', u'event_type': u'start_lease',
+                 u'status': u'UNDONE', u'attempts': 2,
+                 u'next_attempt_at': u'2014-01-01T01:25:00.000000',
+                 u'claim_expires_at': None, u'owner': None}
+        self.patch(self.rpcapi, 'list_leases').return_value = [
+            fake_lease(events=[dict(event)])]
+        response = self.get_json(self.path)
+        event[u'attempts'] = u'2'
+        self.assertEqual([fake_lease(events=[event])], response)
+
     def test_multiple(self):
         id1 = six.text_type(uuidutils.generate_uuid())
         id2 = six.text_type(uuidutils.generate_uuid())
@@ -196,6 +207,30 @@ class TestCreateLease(api.APITest):
         self.assertEqual('application/json', response.content_type)
         self.assertEqual(self.fake_lease, response.json)
 
+    def test_create_dry_run(self):
+        preview = {u'name': self.fake_lease['name'],
+                   u'start_date': self.fake_lease['start_date'],
+                   u'end_date': self.fake_lease['end_date'],
+                   u'reservations': [{u'resource_type': u'physical:host',
+                                      u'hosts': [u'1', u'2'],
+                                      u'cost': 4.0}],
+                   u'cost': 4.0,
+                   u'dry_run': True}
+        create_lease = self.patch(self.rpcapi, 'create_lease')
+        create_lease.return_value = preview
+        self.fake_lease_body['dry_run'] = True
+
+        response = self.post_json(self.path, self.fake_lease_body)
+
+        self.assertEqual(202, response.status_int)
+        self.assertEqual([{u'resource_type': u'physical:host',
+                           u'hosts': u'1,2',
+                           u'cost': u'4.0'}],
+                         response.json['reservations'])
+        self.assertEqual(4.0, response.json['cost'])
+        self.assertFalse(self.trusts.create_trust.called)
+        self.assertTrue(create_lease.call_args[1]['dry_run'])
+
     def test_create_wrong_attr(self):
         expected = {
             "error_name": 400,
@@ -181,3 +181,21 @@ class TestMigrations(migration.BaseWalkMigrationTestCase,
                               engine.execute,
                               computehosts_table.insert(),
                               data)
+
+    def _check_3e4bd1c25c1a(self, engine, data):
+        self.assertIndexMembers(engine, 'computehost_extra_capabilities',
+                                'ix_extra_capabilities_name_host',
+                                ['capability_name', 'computehost_id'])
+
+    def _check_b1f2c6d9e4a7(self, engine, data):
+        self.assertIndexMembers(engine, 'events',
+                                'ix_events_status_deleted_time',
+                                ['status', 'deleted', 'time'])
+
+    def _check_5c3e8d1a9f20(self, engine, data):
+        self.assertColumnsExists(engine, 'events',
+                                 ['owner', 'claim_expires_at'])
+
+    def _check_e7a4b2c90d13(self, engine, data):
+        self.assertColumnsExists(engine, 'events',
+                                 ['attempts', 'next_attempt_at'])
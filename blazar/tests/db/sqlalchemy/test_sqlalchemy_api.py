@@ -23,6 +23,7 @@ from blazar.db.sqlalchemy import api as db_api
 from blazar.db.sqlalchemy import models
 from blazar.plugins import oshosts as host_plugin
 from blazar import tests
+from blazar.utils import plugins as plugins_utils
 
 
 def _get_fake_random_uuid():
@@ -215,6 +216,19 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
                           db_api.lease_create,
                           _get_fake_phys_lease_values())
 
+    def test_create_phys_lease_not_read_again(self):
+        values = _get_fake_phys_lease_values(id=_get_fake_random_uuid())
+        values['events'] = [_get_fake_event_values(id='1',
+                                                   lease_id=values['id'])]
+        lease_get = self.patch(db_api, 'lease_get')
+
+        result = db_api.lease_create(values)
+
+        lease_get.assert_not_called()
+        self.assertEqual(
+            db_api._lease_get(db_api.get_session(), values['id']).to_dict(),
+            result.to_dict())
+
     def test_create_leases_with_duplicated_reservation(self):
         """Check duplicated reservation create
 
@@ -322,6 +336,144 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
         self.assertEqual(_get_datetime('2014-02-01 00:00'),
                          result['start_date'])
 
+    def _get_batch_values(self, lease_id, name, host_id):
+        lease_values = _get_fake_phys_lease_values(id=lease_id, name=name)
+        reservation_id = _get_fake_random_uuid()
+        reservations = [{'id': reservation_id,
+                         'lease_id': lease_id,
+                         'resource_id': 'host-reservation-' + lease_id,
+                         'resource_type': host_plugin.RESOURCE_TYPE,
+                         'status': 'pending'}]
+        del lease_values['reservations']
+        del lease_values['events']
+        del lease_values['trust']
+        events = [_get_fake_event_values(id='event-' + lease_id,
+                                         lease_id=lease_id)]
+        resources = {
+            'computehost_reservations': [
+                {'id': 'host-reservation-' + lease_id,
+                 'reservation_id': reservation_id,
+                 'aggregate_id': 1,
+                 'resource_properties': '',
+                 'hypervisor_properties': '',
+                 'count_range': '1-1',
+                 'status': 'pending',
+                 'before_end': 'default'}],
+            'computehost_allocations': [
+                {'id': 'allocation-' + lease_id,
+                 'compute_host_id': host_id,
+                 'reservation_id': reservation_id}]}
+        return lease_values, reservations, events, resources
+
+    def test_lease_create_batch(self):
+        db_api.host_create(_get_fake_host_values(id='1'))
+
+        db_api.lease_create_batch(
+            *self._get_batch_values('lease-1', 'lease1', '1'))
+
+        lease = db_api.lease_get('lease-1')
+        self.assertEqual(1, len(lease['reservations']))
+        self.assertEqual(['event-lease-1'],
+                         [event['id'] for event in lease['events']])
+        self.assertEqual(
+            'allocation-lease-1',
+            db_api.host_allocation_get_all_by_values(
+                compute_host_id='1')[0]['id'])
+        self.assertTrue(
+            db_api.host_reservation_get('host-reservation-lease-1'))
+
+    def test_lease_create_batch_host_not_free(self):
+        db_api.host_create(_get_fake_host_values(id='1'))
+        db_api.lease_create_batch(
+            *self._get_batch_values('lease-1', 'lease1', '1'))
+
+        self.assertRaises(db_exceptions.BlazarDBHostNotFree,
+                          db_api.lease_create_batch,
+                          *self._get_batch_values('lease-2', 'lease2', '1'))
+        self.assertIsNone(db_api.lease_get('lease-2'))
+        self.assertIsNone(db_api.event_get('event-lease-2'))
+
+    def _add_batch_reservation(self, values, host_id):
+        lease_values, reservations, events, resources = values
+        reservation_id = _get_fake_random_uuid()
+        reservations.append({'id': reservation_id,
+                             'lease_id': lease_values['id'],
+                             'resource_id': 'host-reservation-2',
+                             'resource_type': host_plugin.RESOURCE_TYPE,
+                             'status': 'pending'})
+        resources['computehost_reservations'].append(
+            dict(resources['computehost_reservations'][0],
+                 id='host-reservation-2', reservation_id=reservation_id))
+        resources['computehost_allocations'].append(
+            {'id': 'allocation-2',
+             'compute_host_id': host_id,
+             'reservation_id': reservation_id})
+
+    def test_lease_create_batch_two_host_reservations(self):
+        db_api.host_create(_get_fake_host_values(id='1'))
+        db_api.host_create(_get_fake_host_values(id='2'))
+        values = self._get_batch_values('lease-1', 'lease1', '1')
+        self._add_batch_reservation(values, '2')
+
+        db_api.lease_create_batch(*values)
+
+        self.assertEqual(2, len(db_api.lease_get('lease-1')['reservations']))
+        self.assertEqual(
+            ['allocation-2'],
+            [allocation['id'] for allocation
+             in db_api.host_allocation_get_all_by_values(
+                 compute_host_id='2')])
+
+    def test_lease_create_batch_host_allocated_twice(self):
+        db_api.host_create(_get_fake_host_values(id='1'))
+        values = self._get_batch_values('lease-1', 'lease1', '1')
+        self._add_batch_reservation(values, '1')
+
+        self.assertRaises(db_exceptions.BlazarDBHostNotFree,
+                          db_api.lease_create_batch, *values)
+        self.assertIsNone(db_api.lease_get('lease-1'))
+        self.assertEqual([], db_api.host_allocation_get_all_by_values(
+            compute_host_id='1'))
+
+    def test_lease_create_batch_duplicated_lease(self):
+        db_api.host_create(_get_fake_host_values(id='1'))
+        db_api.host_create(_get_fake_host_values(id='2'))
+        db_api.lease_create_batch(
+            *self._get_batch_values('lease-1', 'lease1', '1'))
+        values = self._get_batch_values('lease-1', 'lease2', '2')
+        values[3]['computehost_allocations'][0]['id'] = 'allocation-2'
+
+        self.assertRaises(db_exceptions.BlazarDBDuplicateEntry,
+                          db_api.lease_create_batch, *values)
+        self.assertEqual([], db_api.host_allocation_get_all_by_values(
+            compute_host_id='2'))
+
+    def test_lease_transition(self):
+        lease = _create_physical_lease()
+        reservation_id = lease['reservations'][0]['id']
+        db_api.event_create(_get_fake_event_values(id='1',
+                                                   lease_id=lease['id']))
+
+        db_api.lease_transition(
+            lease['id'], {'status': 'COMPLETE'},
+            {reservation_id: {'status': 'active'}},
+            '1', {'status': 'DONE'})
+
+        self.assertEqual('COMPLETE', db_api.lease_get(lease['id'])['status'])
+        self.assertEqual('active',
+                         db_api.reservation_get(reservation_id)['status'])
+        self.assertEqual('DONE', db_api.event_get('1')['status'])
+
+    def test_lease_transition_for_lease_not_found(self):
+        db_api.event_create(_get_fake_event_values(id='1'))
+
+        self.assertRaises(db_exceptions.BlazarDBNotFound,
+                          db_api.lease_transition, 'fake',
+                          {'status': 'COMPLETE'}, None,
+                          '1', {'status': 'DONE'})
+        self.assertEqual('fake_event_status',
+                         db_api.event_get('1')['status'])
+
     # Reservations
 
     def test_create_reservation(self):
@@ -504,6 +656,51 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
         self.assertRaises(db_exceptions.BlazarDBNotFound,
                           db_api.host_get_all_by_queries, ['apples < 2048'])
 
+    def test_search_for_hosts_by_numeric_extra_capability(self):
+        """Compare extra capabilities as numbers when possible."""
+        for host_id, value in [(1, '9'), (2, '10'), (3, 'ten')]:
+            db_api.host_create(_get_fake_host_values(id=host_id))
+            values = _get_fake_host_extra_capabilities(
+                id=str(host_id), computehost_id=host_id)
+            values['capability_value'] = value
+            db_api.host_extra_capability_create(values)
+
+        def host_ids(queries):
+            return sorted(host['id'] for host in
+                          db_api.host_get_all_by_queries(queries))
+
+        # 'ten' is not a number and is compared as a string
+        self.assertEqual(['2', '3'], host_ids(['vgpu > 9']))
+        self.assertEqual(['1', '2'], host_ids(['vgpu <= 10.0']))
+        self.assertEqual(['1'], host_ids(['vgpu == 9.0']))
+        # Non numeric values are compared as strings
+        self.assertEqual(['3'], host_ids(['vgpu >= t']))
+        self.assertEqual(['1', '3'], host_ids(['vgpu in 9,ten']))
+        self.assertEqual(['2'], host_ids(['vgpu in 10',
+                                          'cpu_info like %Westmere%']))
+        self.assertRaises(NotImplementedError,
+                          db_api.host_get_all_by_queries, ['vgpu like 9'])
+
+    def test_search_for_hosts_by_grouped_queries(self):
+        """Search hosts with requirements combined with "or"."""
+        db_api.host_create(_get_fake_host_values(id=1, mem=2048))
+        db_api.host_create(_get_fake_host_values(id=2, mem=4096))
+        db_api.host_create(_get_fake_host_values(id=3, mem=8192))
+        db_api.host_extra_capability_create(
+            _get_fake_host_extra_capabilities(id='1', computehost_id=1))
+
+        queries = plugins_utils.convert_requirements(
+            '["or", ["=", "$vgpu", "2"], ["and", [">", "$memory_mb", "2048"],'
+            ' ["<", "$memory_mb", "8192"]]]')
+        self.assertEqual(['1', '2'],
+                         sorted(host['id'] for host in
+                                db_api.host_get_all_by_queries(queries)))
+        self.assertRaises(db_exceptions.BlazarDBNotFound,
+                          db_api.host_get_all_by_queries,
+                          plugins_utils.convert_requirements(
+                              '["or", ["=", "$vgpu", "2"], '
+                              '["=", "$apples", "2"]]'))
+
     def test_search_for_hosts_by_composed_queries(self):
         """Create one host and test composed queries."""
 
@@ -526,6 +723,43 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
         self.assertEqual(1, len(
             db_api.host_get_all_by_queries(['memory_mb != null'])))
 
+    def test_search_for_free_hosts_in_window(self):
+        """Create three hosts, allocate two of them and search free ones."""
+        db_api.host_create(_get_fake_host_values(id=1, mem=2048))
+        db_api.host_create(_get_fake_host_values(id=2, mem=4096))
+        db_api.host_create(_get_fake_host_values(id=3, mem=4096))
+        _create_physical_lease(values=_get_fake_phys_lease_values(
+            id='lease1', name='lease1',
+            start_date=_get_datetime('2030-01-01 09:00'),
+            end_date=_get_datetime('2030-01-01 10:00'),
+            resource_id='2'))
+        _create_physical_lease(values=_get_fake_phys_lease_values(
+            id='lease2', name='lease2',
+            start_date=_get_datetime('2030-01-01 12:00'),
+            end_date=_get_datetime('2030-01-01 13:00'),
+            resource_id='3'))
+
+        def free_hosts(queries, start, end):
+            return sorted((host['id'], allocated) for host, allocated in
+                          db_api.host_get_all_free_in_window(
+                              queries, _get_datetime(start),
+                              _get_datetime(end)))
+
+        self.assertEqual([('1', False), ('2', True), ('3', True)],
+                         free_hosts([], '2030-01-01 10:00',
+                                    '2030-01-01 12:00'))
+        self.assertEqual([('1', False), ('3', True)],
+                         free_hosts([], '2030-01-01 09:30',
+                                    '2030-01-01 12:00'))
+        self.assertEqual([('2', True)],
+                         free_hosts(['memory_mb >= 4096'],
+                                    '2030-01-01 11:00', '2030-01-01 14:00'))
+        free = db_api.host_get_all_free_in_window(
+            [], _get_datetime('2030-01-01 09:30'),
+            _get_datetime('2030-01-01 12:00'), host_ids=['2', '3'])
+        self.assertEqual([('3', True)],
+                         [(host['id'], allocated) for host, allocated in free])
+
     def test_list_hosts(self):
         db_api.host_create(_get_fake_host_values(id=1))
         db_api.host_create(_get_fake_host_values(id=2))
@@ -576,6 +810,15 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
         res = db_api.host_extra_capability_get_all_per_host('1')
         self.assertEqual(2, len(res))
 
+    def test_host_extra_capability_list(self):
+        db_api.host_extra_capability_create(
+            _get_fake_host_extra_capabilities(id='1', computehost_id='1'))
+        db_api.host_extra_capability_create(
+            _get_fake_host_extra_capabilities(id='2', computehost_id='2'))
+        res = db_api.host_extra_capability_list()
+        self.assertEqual(['1', '2'],
+                         sorted(c['computehost_id'] for c in res))
+
     def test_update_host_extra_capability(self):
         db_api.host_extra_capability_create(
             _get_fake_host_extra_capabilities(id='1'))
@@ -681,6 +924,41 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
                           db_api.host_allocation_create,
                           _get_fake_host_allocation_values(id='1'))
 
+    def test_host_allocation_claim(self):
+        db_api.host_create(_get_fake_host_values(id=1))
+        lease = _create_physical_lease(values=_get_fake_phys_lease_values(
+            id='lease1', name='lease1',
+            start_date=_get_datetime('2030-01-01 09:00'),
+            end_date=_get_datetime('2030-01-01 10:00'),
+            resource_id='1'))
+        reservation_id = lease['reservations'][0]['id']
+
+        allocation = db_api.host_allocation_claim(
+            _get_fake_host_allocation_values(compute_host_id='1',
+                                             reservation_id='other'),
+            _get_datetime('2030-01-01 10:00'),
+            _get_datetime('2030-01-01 11:00'))
+        self.assertEqual('1', allocation['compute_host_id'])
+
+        self.assertRaises(db_exceptions.BlazarDBHostNotFree,
+                          db_api.host_allocation_claim,
+                          _get_fake_host_allocation_values(
+                              compute_host_id='1', reservation_id='other'),
+                          _get_datetime('2030-01-01 09:30'),
+                          _get_datetime('2030-01-01 11:00'))
+        # The allocations of the claiming reservation are ignored
+        db_api.host_allocation_claim(
+            _get_fake_host_allocation_values(compute_host_id='1',
+                                             reservation_id=reservation_id),
+            _get_datetime('2030-01-01 08:00'),
+            _get_datetime('2030-01-01 10:00'))
+        self.assertRaises(db_exceptions.BlazarDBNotFound,
+                          db_api.host_allocation_claim,
+                          _get_fake_host_allocation_values(
+                              compute_host_id='2', reservation_id='other'),
+                          _get_datetime('2030-01-01 09:30'),
+                          _get_datetime('2030-01-01 11:00'))
+
     def test_host_allocation_update_for_host(self):
         host_allocation = db_api.host_allocation_create(
             _get_fake_host_allocation_values(
@@ -757,6 +1035,16 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
 
         self.assertEqual('changed', test_event.status)
 
+    def test_event_update_not_read_again(self):
+        db_api.event_create(_get_fake_event_values(id='1'))
+        event_get = self.patch(db_api, 'event_get')
+
+        result = db_api.event_update('1', {'status': 'changed'})
+
+        event_get.assert_not_called()
+        self.assertEqual('changed', result.status)
+        self.assertEqual(0, result.attempts)
+
     def test_event_destroy(self):
         self.assertFalse(db_api.event_get('1'))
 
@@ -973,6 +1261,87 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
                                                    sort_key=sort_key,
                                                    sort_dir=sort_dir))
 
+    def test_event_claim(self):
+        db_api.event_create(_get_fake_event_values(id='1', status='UNDONE'))
+        db_api.event_create(_get_fake_event_values(id='2', status='UNDONE'))
+        expires_at = _get_datetime('2030-03-01 00:05')
+
+        self.assertEqual(['1'], db_api.event_claim(['1'], 'manager1',
+                                                   expires_at))
+        self.assertEqual(['2'], sorted(db_api.event_claim(
+            ['1', '2'], 'manager2', expires_at)))
+
+        event = db_api.event_get('1')
+        self.assertEqual('IN_PROGRESS', event['status'])
+        self.assertEqual('manager1', event['owner'])
+        self.assertEqual(expires_at, event['claim_expires_at'])
+
+    def test_event_release_expired_claims(self):
+        db_api.event_create(_get_fake_event_values(id='1', status='UNDONE'))
+        db_api.event_create(_get_fake_event_values(id='2', status='UNDONE'))
+        db_api.event_create(_get_fake_event_values(id='3',
+                                                   status='IN_PROGRESS'))
+        db_api.event_claim(['1'], 'manager1',
+                           _get_datetime('2030-03-01 00:05'))
+        db_api.event_claim(['2'], 'manager2',
+                           _get_datetime('2030-03-01 00:05'))
+        self.assertEqual(1, db_api.event_renew_claims(
+            'manager2', _get_datetime('2030-03-01 00:15')))
+
+        self.assertEqual(1, db_api.event_release_expired_claims(
+            _get_datetime('2030-03-01 00:10')))
+
+        self.assertEqual('UNDONE', db_api.event_get('1')['status'])
+        self.assertIsNone(db_api.event_get('1')['owner'])
+        self.assertEqual('IN_PROGRESS', db_api.event_get('2')['status'])
+        self.assertEqual('IN_PROGRESS', db_api.event_get('3')['status'])
+
+    def test_event_get_sorted_by_time_filter(self):
+        for i, time in enumerate(['2030-03-01 00:00', '2030-03-02 00:00',
+                                  '2030-03-03 00:00']):
+            db_api.event_create(_get_fake_event_values(
+                id=str(i), time=_get_datetime(time), status='UNDONE'))
+
+        filtered_events = db_api.event_get_all_sorted_by_filters(
+            sort_key='time',
+            sort_dir='asc',
+            filters={'status': 'UNDONE',
+                     'time': {'op': 'le',
+                              'border': _get_datetime('2030-03-02 00:00')}}
+        )
+        self.assertEqual(['0', '1'], [e['id'] for e in filtered_events])
+
+        filtered_events = db_api.event_get_all_sorted_by_filters(
+            sort_key='time',
+            sort_dir='asc',
+            filters={'time': {'op': 'gt',
+                              'border': _get_datetime('2030-03-01 00:00')}},
+            limit=1
+        )
+        self.assertEqual(['1'], [e['id'] for e in filtered_events])
+
+    def test_event_get_sorted_by_next_attempt_filter(self):
+        db_api.event_create(_get_fake_event_values(id='1', status='UNDONE'))
+        db_api.event_create(_get_fake_event_values(id='2', status='UNDONE'))
+        db_api.event_update('2', {
+            'attempts': 1,
+            'next_attempt_at': _get_datetime('2030-03-01 00:10')})
+
+        filtered_events = db_api.event_get_all_sorted_by_filters(
+            sort_key='time',
+            sort_dir='asc',
+            filters={'next_attempt_before': _get_datetime('2030-03-01 00:05')}
+        )
+        self.assertEqual(['1'], [e['id'] for e in filtered_events])
+
+    def test_event_get_sorted_by_invalid_time_filter(self):
+        self.assertRaises(db_exceptions.BlazarDBInvalidFilterOperator,
+                          db_api.event_get_all_sorted_by_filters,
+                          sort_key='time',
+                          sort_dir='asc',
+                          filters={'time': {'op': 'eq',
+                                            'border': _get_datetime()}})
+
     def test_event_get_sorted_desc_by_lease_id_filter(self):
         fake_lease_id = '1234'
         sort_dir = 'desc'
@@ -190,6 +190,225 @@ class SQLAlchemyDBUtilsTestCase(tests.DBTestCase):
         self.assertEqual(full_periods[0][1].strftime('%Y-%m-%d %H:%M'),
                          '2030-01-01 14:00')
 
+    def test_get_full_periods_by_host(self):
+        """Find the full periods of several hosts at once."""
+        self._setup_leases()
+        start_date = _get_datetime('2030-01-01 09:30')
+        end_date = _get_datetime('2030-01-01 13:30')
+        duration = datetime.timedelta(minutes=10)
+
+        full_periods = db_utils.get_full_periods_by_host(
+            ['r1', 'r2', 'r3'], start_date, end_date, duration)
+        self.assertEqual(
+            {'r1': [(start_date, _get_datetime('2030-01-01 10:30')),
+                    (_get_datetime('2030-01-01 13:00'), end_date)],
+             'r2': [(_get_datetime('2030-01-01 11:00'),
+                     _get_datetime('2030-01-01 12:45'))],
+             'r3': []},
+            full_periods)
+        self.assertEqual(
+            dict((host_id, full_periods[host_id]) for host_id in ('r1', 'r2')),
+            db_utils.get_full_periods_by_host(None, start_date, end_date,
+                                              duration))
+        self.assertEqual({'r3': [(start_date, end_date)]},
+                         db_utils.get_full_periods_by_host(
+                             ['r3'], start_date, end_date,
+                             datetime.timedelta(hours=5)))
+
+    def test_get_free_periods_by_host(self):
+        """Find the free periods of several hosts at once."""
+        self._setup_leases()
+        start_date = _get_datetime('2030-01-01 09:30')
+        end_date = _get_datetime('2030-01-01 13:30')
+        duration = datetime.timedelta(minutes=10)
+
+        self.assertEqual(
+            {'r1': [(_get_datetime('2030-01-01 10:30'),
+                     _get_datetime('2030-01-01 13:00'))],
+             'r2': [(start_date, _get_datetime('2030-01-01 11:00')),
+                    (_get_datetime('2030-01-01 12:45'), end_date)],
+             'r3': [(start_date, end_date)]},
+            db_utils.get_free_periods_by_host(['r1', 'r2', 'r3'], start_date,
+                                              end_date, duration))
+
+    def test_get_host_allocation_periods(self):
+        """Find the period of every host allocation."""
+        self._setup_leases()
+        periods = sorted(db_utils.get_host_allocation_periods(),
+                         key=lambda p: p[3])
+        self.assertEqual(
+            [('r1', _get_datetime('2030-01-01 09:00'),
+              _get_datetime('2030-01-01 10:30')),
+             ('r2', _get_datetime('2030-01-01 11:00'),
+              _get_datetime('2030-01-01 12:45')),
+             ('r1', _get_datetime('2030-01-01 13:00'),
+              _get_datetime('2030-01-01 14:00'))],
+            [(host_id, start, end)
+             for _, host_id, _, start, end in periods])
+
+    def test_get_host_allocation_changes(self):
+        """Find the host allocations changed after a date."""
+        self._setup_leases()
+        watermark = datetime.datetime.utcnow()
+        self.assertEqual([], db_utils.get_host_allocation_changes(watermark))
+
+        allocation_id = db_utils.get_host_allocation_ids()[0]
+        db_api.host_allocation_destroy(allocation_id)
+        changes = db_utils.get_host_allocation_changes(watermark)
+        self.assertEqual([allocation_id], [c[0] for c in changes])
+        self.assertTrue(changes[0][5])
+        self.assertNotIn(allocation_id, db_utils.get_host_allocation_ids())
+        self.assertEqual(2, len(db_utils.get_host_allocation_ids()))
+
+    def test_get_adjacent_allocations_by_host(self):
+        """Find the allocations of the hosts around a period."""
+        self._setup_leases()
+        self.assertEqual(
+            {'r1': (_get_datetime('2030-01-01 10:30'),
+                    _get_datetime('2030-01-01 13:00')),
+             'r2': (None, _get_datetime('2030-01-01 11:00'))},
+            db_utils.get_adjacent_allocations_by_host(
+                ['r1', 'r2', 'r3'], _get_datetime('2030-01-01 10:30'),
+                _get_datetime('2030-01-01 11:00')))
+
+    def test_get_host_ids_by_lease(self):
+        """Find the hosts of several leases with a single query."""
+        self._setup_leases()
+        self.assertEqual(
+            {'lease1': set(['r1']), 'lease3': set(['r1'])},
+            db_utils.get_host_ids_by_lease(['lease1', 'lease3', 'lease4']))
+        self.assertEqual({}, db_utils.get_host_ids_by_lease([]))
+
+    def test_get_host_utilization(self):
+        """Compute the utilization of every host in one pass."""
+        self._setup_leases()
+        for host_id in ('r1', 'r2', 'r3'):
+            db_api.host_create({'id': host_id, 'vcpus': 1, 'cpu_info': 'cpu',
+                                'hypervisor_type': 'QEMU',
+                                'hypervisor_version': 1, 'memory_mb': 8192,
+                                'local_gb': 10, 'trust_id': 'trust'})
+        start_date = _get_datetime('2030-01-01 09:15')
+        end_date = _get_datetime('2030-01-02 13:45')
+
+        report = list(db_utils.get_host_utilization(None, start_date,
+                                                    end_date))
+
+        self.assertEqual(['r1', 'r2', 'r3'], [r['host_id'] for r in report])
+        for host_report in report[:2]:
+            host_id = host_report['host_id']
+            self.assertEqual(
+                db_utils.reservation_time(
+                    host_id, start_date, end_date).total_seconds(),
+                host_report['reservation_time'])
+            self.assertEqual(
+                db_utils.availability_time(
+                    host_id, start_date, end_date).total_seconds(),
+                host_report['availability_time'])
+            self.assertEqual(
+                db_utils.reservation_ratio(host_id, start_date, end_date),
+                host_report['reservation_ratio'])
+            self.assertEqual(
+                db_utils.number_of_reservations(host_id, start_date,
+                                                end_date),
+                host_report['number_of_reservations'])
+        self.assertEqual('lease3', report[0]['longest_lease'])
+        self.assertEqual('lease3', report[0]['shortest_lease'])
+        self.assertEqual({'host_id': 'r3',
+                          'reservation_time': 0.0,
+                          'availability_time': 102600.0,
+                          'reservation_ratio': 0.0,
+                          'number_of_reservations': 0,
+                          'longest_lease': None,
+                          'shortest_lease': None}, report[2])
+        self.assertEqual(['r2'], [r['host_id'] for r in
+                                  db_utils.get_host_utilization(
+                                      ['r2'], start_date, end_date)])
+
+    def test_get_host_utilization_ended_lease(self):
+        """Report on ended leases like the functions of a single host."""
+        self._setup_leases()
+        db_api.host_create({'id': 'r1', 'vcpus': 1, 'cpu_info': 'cpu',
+                            'hypervisor_type': 'QEMU',
+                            'hypervisor_version': 1, 'memory_mb': 8192,
+                            'local_gb': 10, 'trust_id': 'trust'})
+        # The allocations of a lease are deleted when it ends
+        for allocation in db_api.host_allocation_get_all_by_values(
+                compute_host_id='r1'):
+            if db_api.reservation_get(
+                    allocation['reservation_id'])['lease_id'] == 'lease1':
+                db_api.host_allocation_destroy(allocation['id'])
+        start_date = _get_datetime('2030-01-01 08:00')
+        end_date = _get_datetime('2030-01-02 00:00')
+
+        report, = db_utils.get_host_utilization(['r1'], start_date, end_date)
+
+        self.assertEqual(
+            db_utils.reservation_time(
+                'r1', start_date, end_date).total_seconds(),
+            report['reservation_time'])
+        self.assertEqual(
+            db_utils.availability_time(
+                'r1', start_date, end_date).total_seconds(),
+            report['availability_time'])
+        self.assertEqual(
+            db_utils.reservation_ratio('r1', start_date, end_date),
+            report['reservation_ratio'])
+        self.assertEqual(2, report['number_of_reservations'])
+        self.assertEqual(
+            db_utils.number_of_reservations('r1', start_date, end_date),
+            report['number_of_reservations'])
+        self.assertEqual('lease1', report['longest_lease'])
+        self.assertEqual(
+            db_utils.longest_lease('r1', start_date, end_date),
+            report['longest_lease'])
+        self.assertEqual(
+            db_utils.shortest_lease('r1', start_date, end_date),
+            report['shortest_lease'])
+
+    def test_get_host_utilization_deleted_lease(self):
+        """Do not report on the leases deleted before they started."""
+        self._setup_leases()
+        db_api.host_create({'id': 'r1', 'vcpus': 1, 'cpu_info': 'cpu',
+                            'hypervisor_type': 'QEMU',
+                            'hypervisor_version': 1, 'memory_mb': 8192,
+                            'local_gb': 10, 'trust_id': 'trust'})
+        # Deleting a lease ends its reservations, then deletes it
+        for allocation in db_api.host_allocation_get_all_by_values(
+                compute_host_id='r1'):
+            if db_api.reservation_get(
+                    allocation['reservation_id'])['lease_id'] == 'lease1':
+                db_api.host_allocation_destroy(allocation['id'])
+        db_api.lease_destroy('lease1')
+        # The host is booked again over the period of the deleted lease
+        _create_physical_lease(values=_get_fake_phys_lease_values(
+            id='lease4',
+            name='fake_phys_lease_r4',
+            start_date=_get_datetime('2030-01-01 09:00'),
+            end_date=_get_datetime('2030-01-01 10:00'),
+            resource_id='r1'))
+        start_date = _get_datetime('2030-01-01 09:00')
+        end_date = _get_datetime('2030-01-01 10:30')
+
+        report, = db_utils.get_host_utilization(['r1'], start_date, end_date)
+
+        self.assertEqual(1, report['number_of_reservations'])
+        self.assertEqual(3600.0, report['reservation_time'])
+        self.assertEqual(1800.0, report['availability_time'])
+        self.assertEqual('lease4', report['longest_lease'])
+        self.assertEqual(
+            db_utils.number_of_reservations('r1', start_date, end_date),
+            report['number_of_reservations'])
+        self.assertEqual(
+            db_utils.reservation_time(
+                'r1', start_date, end_date).total_seconds(),
+            report['reservation_time'])
+        self.assertEqual(
+            db_utils.reservation_ratio('r1', start_date, end_date),
+            report['reservation_ratio'])
+        self.assertEqual(
+            db_utils.longest_lease('r1', start_date, end_date),
+            report['longest_lease'])
+
     def test_availability_time(self):
         """Find the total availability time."""
         self._setup_leases()
@@ -337,6 +556,51 @@ class SQLAlchemyDBUtilsTestCase(tests.DBTestCase):
                 end_date=_get_datetime('2030-01-01 13:00')),
             'lease1')
 
+    def test_get_lease_statistics(self):
+        self._setup_leases()
+        values = _get_fake_phys_lease_values(
+            id='lease4',
+            name='fake_phys_lease_r4',
+            start_date=_get_datetime('2030-01-02 00:00'),
+            end_date=_get_datetime('2030-01-04 00:00'),
+            resource_id='r2')
+        values['project_id'] = 'project1'
+        _create_physical_lease(values=values)
+
+        statistics = db_utils.get_lease_statistics()
+        projects = statistics.pop('projects')
+        self.assertEqual({'count': 4,
+                          'mean_duration': 47025.0,
+                          'min_duration': 3600,
+                          'max_duration': 172800,
+                          'p50_duration': 5400,
+                          'p95_duration': 172800}, statistics)
+        self.assertEqual({'count': 3,
+                          'mean_duration': 5100.0,
+                          'min_duration': 3600,
+                          'max_duration': 6300}, projects[None])
+        self.assertEqual({'count': 1,
+                          'mean_duration': 172800.0,
+                          'min_duration': 172800,
+                          'max_duration': 172800}, projects['project1'])
+
+        statistics = db_utils.get_lease_statistics(
+            start_date=_get_datetime('2030-01-01 10:00'),
+            end_date=_get_datetime('2030-01-01 15:00'))
+        self.assertEqual(2, statistics['count'])
+        self.assertEqual(4950.0, statistics['mean_duration'])
+        self.assertEqual(3600, statistics['p50_duration'])
+        self.assertEqual(6300, statistics['p95_duration'])
+
+        statistics = db_utils.get_lease_statistics(project_id='project2')
+        self.assertEqual({'count': 0,
+                          'mean_duration': None,
+                          'min_duration': None,
+                          'max_duration': None,
+                          'p50_duration': None,
+                          'p95_duration': None,
+                          'projects': {}}, statistics)
+
     def test_get_reservations_by_host_id(self):
         self._setup_leases()
 
@@ -355,6 +619,53 @@ class SQLAlchemyDBUtilsTestCase(tests.DBTestCase):
         self.check_reservation([], 'r4',
                                '2030-01-01 07:00', '2030-01-01 15:00')
 
+    def test_get_reservations_by_host_ids(self):
+        self._setup_leases()
+
+        ret = db_utils.get_reservations_by_host_ids(
+            ['r1', 'r2', 'r4'], '2030-01-01 10:00', '2030-01-01 11:30')
+        self.assertEqual(['r1', 'r2'], sorted(ret))
+        self.assertEqual(['lease1'], [r['lease_id'] for r in ret['r1']])
+        self.assertEqual(['lease2'], [r['lease_id'] for r in ret['r2']])
+
+        self.assertEqual({}, db_utils.get_reservations_by_host_ids(
+            [], '2030-01-01 10:00', '2030-01-01 11:30'))
+
+    def test_get_instance_usage_events_by_host(self):
+        values = _get_fake_phys_lease_values(
+            id='lease-vm',
+            name='fake_vm_lease',
+            start_date=_get_datetime('2030-01-01 09:00'),
+            end_date=_get_datetime('2030-01-01 10:00'),
+            resource_id='r1')
+        values['reservations'][0]['resource_type'] = 'virtual:instance'
+        values['events'] = [
+            {'event_type': event_type, 'time': _get_datetime(time),
+             'status': 'UNDONE'}
+            for event_type, time in (('start_lease', '2030-01-01 09:00'),
+                                     ('before_end_lease', '2030-01-01 09:30'),
+                                     ('end_lease', '2030-01-01 10:00'))]
+        lease = _create_physical_lease(values=values)
+        reservation = db_api.reservation_get_all_by_lease_id(lease['id'])[0]
+        db_api.instance_reservation_create({
+            'reservation_id': reservation['id'], 'vcpus': 2,
+            'memory_mb': 1024, 'disk_gb': 10, 'amount': 1,
+            'affinity': False})
+
+        ret = db_utils.get_instance_usage_events_by_host(
+            ['r1', 'r2'], '2030-01-01 08:00', '2030-01-01 12:00')
+        self.assertEqual(['r1'], list(ret))
+        self.assertEqual(
+            [('end_lease', _get_datetime('2030-01-01 10:00')),
+             ('start_lease', _get_datetime('2030-01-01 09:00'))],
+            sorted((e['event_type'], e['time']) for e in ret['r1']))
+        self.assertEqual(set([(2, 1024, 10)]),
+                         set((e['vcpus'], e['memory_mb'], e['disk_gb'])
+                             for e in ret['r1']))
+
+        self.assertEqual({}, db_utils.get_instance_usage_events_by_host(
+            ['r1'], '2030-01-01 11:00', '2030-01-01 12:00'))
+
     def test_get_reservations_by_host_id_with_multi_reservation(self):
         self._setup_leases()
 
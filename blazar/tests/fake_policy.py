@@ -28,12 +28,15 @@ policy_data = """
     "blazar:leases:create": "rule:admin_or_owner",
     "blazar:leases:delete": "rule:admin_or_owner",
     "blazar:leases:update": "rule:admin_or_owner",
+    "blazar:leases:statistics": "rule:admin_api",
 
     "blazar:plugins:get": "@",
 
     "blazar:oshosts:get": "rule:admin_api",
     "blazar:oshosts:create": "rule:admin_api",
     "blazar:oshosts:delete": "rule:admin_api",
-    "blazar:oshosts:update": "rule:admin_api"
+    "blazar:oshosts:update": "rule:admin_api",
+    "blazar:oshosts:find_window": "rule:admin_or_owner",
+    "blazar:oshosts:utilization": "rule:admin_api"
 }
 """
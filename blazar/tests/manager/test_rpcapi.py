@@ -40,14 +40,21 @@ class RPCAPITestCase(tests.TestCase):
 
     def test_create_lease(self):
         self.manager.create_lease(self.fake_values)
-        self.call.assert_called_once_with('create_lease', lease_values={})
+        self.call.assert_called_once_with('create_lease', lease_values={},
+                                          dry_run=False)
+
+    def test_create_lease_dry_run(self):
+        self.manager.create_lease(self.fake_values, dry_run=True)
+        self.call.assert_called_once_with('create_lease', lease_values={},
+                                          dry_run=True)
 
     def test_update_lease(self):
         self.manager.update_lease(self.fake_id,
                                   self.fake_values)
         self.call.assert_called_once_with('update_lease',
                                           lease_id=1,
-                                          values={})
+                                          values={},
+                                          dry_run=False)
 
     def test_delete_lease(self):
         self.manager.delete_lease(self.fake_id)
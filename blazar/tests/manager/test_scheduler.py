@@ -0,0 +1,81 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+from blazar.manager import scheduler
+from blazar import tests
+
+
+def _event(event_id, time, lease_id='lease1', status='UNDONE',
+           next_attempt_at=None):
+    return {'id': event_id, 'time': time, 'lease_id': lease_id,
+            'status': status, 'next_attempt_at': next_attempt_at}
+
+
+class EventSchedulerTestCase(tests.TestCase):
+
+    def setUp(self):
+        super(EventSchedulerTestCase, self).setUp()
+        self.scheduler = scheduler.EventScheduler()
+        self.past = datetime.datetime(2020, 1, 1, 10)
+        self.future = datetime.datetime(2100, 1, 1, 10)
+
+    def test_pop_due_by_time(self):
+        self.scheduler.reset([_event('e2', self.past + datetime.timedelta(1)),
+                              _event('e1', self.past),
+                              _event('e3', self.future)])
+
+        self.assertEqual(['e1', 'e2'], self.scheduler.pop_due())
+        self.assertEqual(self.future, self.scheduler.next_time())
+        self.assertEqual(1, len(self.scheduler))
+
+    def test_move_event(self):
+        self.scheduler.schedule(_event('e1', self.past))
+        self.scheduler.schedule(_event('e1', self.future))
+
+        self.assertEqual([], self.scheduler.pop_due())
+        self.assertEqual(self.future, self.scheduler.next_time())
+
+    def test_schedule_done_event(self):
+        self.scheduler.schedule(_event('e1', self.past))
+        self.scheduler.schedule(_event('e1', self.past, status='DONE'))
+
+        self.assertIsNone(self.scheduler.next_time())
+        self.assertEqual([], self.scheduler.pop_due())
+
+    def test_schedule_retried_event(self):
+        self.scheduler.schedule(_event('e1', self.past,
+                                       next_attempt_at=self.future))
+
+        self.assertEqual(self.future, self.scheduler.next_time())
+        self.assertEqual([], self.scheduler.pop_due())
+
+    def test_unschedule_lease(self):
+        self.scheduler.reset([_event('e1', self.past),
+                              _event('e2', self.past, lease_id='lease2')])
+        self.scheduler.unschedule_lease('lease1')
+
+        self.assertEqual(['e2'], self.scheduler.pop_due())
+
+    def test_wait_due(self):
+        self.scheduler.schedule(_event('e1', self.past))
+
+        self.assertTrue(self.scheduler.wait(timeout=10))
+
+    def test_wait_timeout(self):
+        self.scheduler.schedule(_event('e1', self.future))
+
+        self.assertFalse(self.scheduler.wait(timeout=0.01))
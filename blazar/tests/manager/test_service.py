@@ -26,6 +26,7 @@ import testtools
 from blazar import context
 from blazar.db import api as db_api
 from blazar.db import exceptions as db_ex
+from blazar.db import utils as db_utils
 from blazar import exceptions
 from blazar.manager import exceptions as manager_ex
 from blazar.manager import service
@@ -38,6 +39,10 @@ from blazar.utils.openstack import base as base_utils
 from blazar.utils import trusts
 
 
+# The DB API wrapper, before it is mocked by the tests
+db_api_event_update = db_api.event_update
+
+
 class FakeExtension():
     def __init__(self, name, plugin):
         self.name = name
@@ -92,6 +97,7 @@ class ServiceTestCase(tests.TestCase):
         self.base_utils = base_utils
 
         self.fake_plugin = self.patch(self.dummy_plugin, 'DummyVMPlugin')
+        self.fake_plugin.batch_create = False
 
         self.host_plugin = host_plugin
         self.fake_phys_plugin = self.patch(self.host_plugin,
@@ -143,6 +149,7 @@ class ServiceTestCase(tests.TestCase):
         self.lease_create = self.patch(self.db_api, 'lease_create')
         self.lease_update = self.patch(self.db_api, 'lease_update')
         self.lease_destroy = self.patch(self.db_api, 'lease_destroy')
+        self.lease_transition = self.patch(self.db_api, 'lease_transition')
         self.reservation_create = self.patch(self.db_api, 'reservation_create')
         self.reservation_update = self.patch(self.db_api, 'reservation_update')
         self.event_create = self.patch(self.db_api, 'event_create')
@@ -202,6 +209,280 @@ class ServiceTestCase(tests.TestCase):
                     'before_end': self.fake_plugin.before_end}}
         self.assertEqual(actions, self.manager._setup_actions())
 
+    def test_setup_actions_with_plugin_concurrency(self):
+        cfg.CONF.set_override('events_plugin_concurrency',
+                              ['virtual:instance:2'], group='manager')
+        self.addCleanup(cfg.CONF.clear_override, 'events_plugin_concurrency',
+                        group='manager')
+        self.fake_plugin.on_start.return_value = 'started'
+
+        actions = self.manager._setup_actions()
+
+        self.assertEqual('started',
+                         actions['virtual:instance']['on_start']('111'))
+        self.fake_plugin.on_start.assert_called_once_with('111')
+
+    def test_setup_actions_with_invalid_plugin_concurrency(self):
+        cfg.CONF.set_override('events_plugin_concurrency',
+                              ['virtual:instance'], group='manager')
+        self.addCleanup(cfg.CONF.clear_override, 'events_plugin_concurrency',
+                        group='manager')
+
+        self.assertRaises(manager_ex.ConfigurationError,
+                          self.manager._setup_actions)
+
+    def test_process_events_concurrently_claimed_only(self):
+        events = [{'id': '1', 'lease_id': 'lease1', 'time': self.good_date,
+                   'event_type': 'start_lease'},
+                  {'id': '2', 'lease_id': 'lease2', 'time': self.good_date,
+                   'event_type': 'start_lease'}]
+        event_claim = self.patch(self.db_api, 'event_claim')
+        event_claim.return_value = ['2']
+        exec_event = self.patch(self.manager, '_exec_event')
+
+        self.manager._process_events_concurrently(events)
+
+        event_claim.assert_called_once_with(['1', '2'], self.manager.owner,
+                                            mock.ANY)
+        exec_event.assert_called_once_with(events[1])
+
+    def test_reconcile_events_releases_expired_claims(self):
+        release = self.patch(self.db_api, 'event_release_expired_claims')
+        release.return_value = 1
+        self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+
+        self.manager._reconcile_events()
+
+        release.assert_called_once_with(mock.ANY)
+
+    def test_exec_event_failure_retried(self):
+        event = {'id': '111-222-333', 'time': self.good_date,
+                 'event_type': 'end_lease', 'lease_id': self.lease_id,
+                 'status': 'IN_PROGRESS', 'attempts': 1}
+        self.patch(self.manager, 'end_lease').side_effect = Exception
+        self.event_update.return_value = dict(event, status='UNDONE')
+        now = datetime.datetime(2030, 1, 1)
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = now
+            self.manager._exec_event(event)
+
+        self.event_update.assert_called_once_with(
+            '111-222-333', {'status': 'UNDONE',
+                            'attempts': 2,
+                            'next_attempt_at':
+                            now + datetime.timedelta(seconds=60),
+                            'owner': None,
+                            'claim_expires_at': None})
+
+    def test_exec_event_failure_dead(self):
+        event = {'id': '111-222-333', 'time': self.good_date,
+                 'event_type': 'end_lease', 'lease_id': self.lease_id,
+                 'status': 'IN_PROGRESS', 'attempts': 4}
+        self.patch(self.manager, 'end_lease').side_effect = Exception
+
+        self.manager._exec_event(event)
+
+        self.lease_transition.assert_called_once_with(
+            self.lease_id,
+            {'action': 'STOP', 'status': 'FAILED',
+             'status_reason': 'Failed to stop lease'},
+            {'111': {'status': 'error'}},
+            '111-222-333', {'status': 'DEAD', 'attempts': 5})
+        self.event_update.assert_not_called()
+
+    def test_exec_event_failure_dead_before_end(self):
+        event = {'id': '111-222-333', 'time': self.good_date,
+                 'event_type': 'before_end_lease', 'lease_id': self.lease_id,
+                 'status': 'IN_PROGRESS', 'attempts': 4}
+        self.patch(self.manager, 'before_end_lease').side_effect = Exception
+
+        self.manager._exec_event(event)
+
+        self.event_update.assert_called_once_with(
+            '111-222-333', {'status': 'DEAD', 'attempts': 5})
+        self.lease_transition.assert_not_called()
+
+    def test_exec_event_start_lease_failure_retried(self):
+        event = {'id': '111-222-333', 'time': self.good_date,
+                 'event_type': 'start_lease', 'lease_id': self.lease_id,
+                 'status': 'IN_PROGRESS', 'attempts': 0}
+        self.fake_plugin.on_start.side_effect = [
+            exceptions.BlazarException('111'), None]
+        retried_event = dict(event, status='UNDONE', attempts=1,
+                             next_attempt_at=self.good_date)
+        self.event_update.return_value = retried_event
+
+        self.manager._exec_event(event)
+        self.manager._exec_event(retried_event)
+
+        self.assertEqual(2, self.fake_plugin.on_start.call_count)
+        self.event_update.assert_called_once_with(
+            '111-222-333', {'status': 'UNDONE',
+                            'attempts': 1,
+                            'next_attempt_at': mock.ANY,
+                            'owner': None,
+                            'claim_expires_at': None})
+        for args, _kwargs in self.lease_transition.call_args_list:
+            self.assertNotIn({'status': 'error'}, args[2].values())
+        self.lease_transition.assert_called_with(
+            self.lease_id,
+            {'action': 'START', 'status': 'COMPLETE',
+             'status_reason': 'Successfully started lease'},
+            {'111': {'status': 'active'}}, '111-222-333', {'status': 'DONE'})
+
+    def test_prepare_start_events(self):
+        cfg.CONF.set_override('start_lease_lookahead', 300, group='manager')
+        self.addCleanup(cfg.CONF.clear_override, 'start_lease_lookahead',
+                        group='manager')
+        now = datetime.datetime(2013, 12, 20, 12, 58)
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.return_value = [{'id': '111-222-333',
+                                'time': self.lease['start_date'],
+                                'event_type': 'start_lease',
+                                'lease_id': self.lease_id,
+                                'status': 'UNDONE'}]
+        prefetch = self.patch(self.trusts, 'prefetch_ctx_from_trust')
+
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = now
+            self.manager._prepare_start_events()
+            self.manager._prepare_start_events()
+
+        events.assert_called_with(
+            sort_key='time', sort_dir='asc',
+            filters={'status': 'UNDONE',
+                     'event_type': 'start_lease',
+                     'time': {'op': 'le',
+                              'border': now +
+                              datetime.timedelta(seconds=300)}})
+        prefetch.assert_called_once_with(
+            'exxee111qwwwwe',
+            self.lease['start_date'] + datetime.timedelta(seconds=300))
+        self.fake_plugin.prepare_start.assert_called_once_with('111')
+
+    def test_get_event_dependencies(self):
+        later_date = self.good_date + datetime.timedelta(hours=1)
+        events = [
+            {'id': '1', 'lease_id': 'lease1', 'time': self.good_date,
+             'event_type': 'end_lease'},
+            {'id': '2', 'lease_id': 'lease2', 'time': self.good_date,
+             'event_type': 'before_end_lease'},
+            {'id': '3', 'lease_id': 'lease2', 'time': self.good_date,
+             'event_type': 'start_lease'},
+            {'id': '4', 'lease_id': 'lease3', 'time': self.good_date,
+             'event_type': 'start_lease'},
+            {'id': '5', 'lease_id': 'lease2', 'time': later_date,
+             'event_type': 'end_lease'},
+        ]
+        get_host_ids = self.patch(db_utils, 'get_host_ids_by_lease')
+        get_host_ids.return_value = {'lease1': set(['host1', 'host2']),
+                                     'lease2': set(['host2']),
+                                     'lease3': set(['host3'])}
+
+        dependencies = self.manager._get_event_dependencies(events)
+
+        self.assertEqual([set(), set([2]), set([0]), set(), set([1])],
+                         dependencies)
+
+    def test_get_event_dependencies_backlog(self):
+        # 50k overdue events of back to back one hour leases on 17 hosts
+        events = []
+        host_ids = {}
+        for host in range(17):
+            for hour in range(1000):
+                lease_id = 'lease-%d-%d' % (host, hour)
+                host_ids[lease_id] = set(['host%d' % host])
+                start = self.good_date + datetime.timedelta(hours=hour)
+                end = start + datetime.timedelta(hours=1)
+                events.extend([
+                    {'lease_id': lease_id, 'time': start,
+                     'event_type': 'start_lease'},
+                    {'lease_id': lease_id,
+                     'time': end - datetime.timedelta(minutes=10),
+                     'event_type': 'before_end_lease'},
+                    {'lease_id': lease_id, 'time': end,
+                     'event_type': 'end_lease'}])
+        events.sort(key=lambda event: event['time'])
+        self.patch(db_utils, 'get_host_ids_by_lease').return_value = host_ids
+
+        dependencies = self.manager._get_event_dependencies(events)
+
+        # Every start_lease event only waits for the previous start_lease
+        # and end_lease events of its host, instead of all the earlier ones.
+        self.assertTrue(sum(len(deps) for deps in dependencies) <
+                        2 * len(events))
+        index = events.index({'lease_id': 'lease-3-10',
+                              'time': self.good_date +
+                              datetime.timedelta(hours=10),
+                              'event_type': 'start_lease'})
+        self.assertEqual(
+            [('lease-3-9', 'end_lease'), ('lease-3-9', 'start_lease')],
+            sorted((events[dep]['lease_id'], events[dep]['event_type'])
+                   for dep in dependencies[index]))
+
+    def test_get_event_dependencies_without_start_and_end(self):
+        events = [
+            {'id': '1', 'lease_id': 'lease1', 'time': self.good_date,
+             'event_type': 'start_lease'},
+            {'id': '2', 'lease_id': 'lease2', 'time': self.good_date,
+             'event_type': 'start_lease'},
+        ]
+        get_host_ids = self.patch(db_utils, 'get_host_ids_by_lease')
+
+        dependencies = self.manager._get_event_dependencies(events)
+
+        self.assertEqual([set(), set()], dependencies)
+        self.assertFalse(get_host_ids.called)
+
+    def test_reconcile_events(self):
+        self.patch(self.db_api, 'event_release_expired_claims')
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.return_value = [{'id': '111-222-333',
+                                'time': self.good_date,
+                                'event_type': 'start_lease',
+                                'lease_id': self.lease_id,
+                                'status': 'UNDONE'}]
+
+        self.manager._reconcile_events()
+
+        events.assert_called_once_with(sort_key='time', sort_dir='asc',
+                                       filters={'status': 'UNDONE'})
+        self.assertEqual(self.good_date,
+                         self.manager.event_scheduler.next_time())
+
+    def test_get_due_events_full_batch(self):
+        cfg.CONF.set_override('events_batch_size', 3, group='manager')
+        self.addCleanup(cfg.CONF.clear_override, 'events_batch_size',
+                        group='manager')
+        later_date = self.good_date + datetime.timedelta(minutes=1)
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.return_value = [{'id': '1', 'time': self.good_date},
+                               {'id': '2', 'time': later_date},
+                               {'id': '3', 'time': later_date}]
+
+        result = self.manager._get_due_events(later_date)
+
+        events.assert_called_once_with(
+            sort_key='time', sort_dir='asc',
+            filters={'status': 'UNDONE',
+                     'time': {'op': 'le', 'border': later_date}},
+            limit=3)
+        self.assertEqual(([{'id': '1', 'time': self.good_date}], True),
+                         result)
+
+    def test_get_due_events_last_batch(self):
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.return_value = [{'id': '1', 'time': self.good_date}]
+
+        result = self.manager._get_due_events(self.good_date)
+
+        self.assertEqual(([{'id': '1', 'time': self.good_date}], False),
+                         result)
+
     def test_no_events(self):
         events = self.patch(self.db_api, 'event_get_first_sorted_by_filters')
         event_update = self.patch(self.db_api, 'event_update')
@@ -258,6 +539,25 @@ class ServiceTestCase(tests.TestCase):
         self.lease_get.assert_called_once_with('11-22-33')
         self.assertEqual(lease, self.lease)
 
+    def test_get_lease_statistics(self):
+        get_lease_statistics = self.patch(db_utils, 'get_lease_statistics')
+
+        statistics = self.manager.get_lease_statistics(
+            {'start_date': '2030-01-01 00:00', 'project_id': 'project1'})
+
+        self.assertEqual(get_lease_statistics.return_value, statistics)
+        get_lease_statistics.assert_called_once_with(
+            start_date=datetime.datetime(2030, 1, 1), project_id='project1')
+
+    def test_get_lease_statistics_invalid_period(self):
+        self.assertRaises(manager_ex.InvalidPeriod,
+                          self.manager.get_lease_statistics,
+                          {'start_date': '2030-01-02 00:00',
+                           'end_date': '2030-01-01 00:00'})
+        self.assertRaises(manager_ex.InvalidDate,
+                          self.manager.get_lease_statistics,
+                          {'end_date': '2030-01-01'})
+
     @testtools.skip('incorrect decorator')
     def test_list_leases(self):
         # NOTE(starodubcevna): This func works incorrect, and we need to skip
@@ -309,6 +609,196 @@ class ServiceTestCase(tests.TestCase):
         self.lease_create.assert_called_once_with(lease_values)
         self.assertEqual(lease, self.lease)
 
+    def test_create_lease_batch(self):
+        self.patch(self.manager, '_get_user_name').return_value = 'user'
+        self.patch(self.manager, '_get_project_name').return_value = 'project'
+        self.fake_plugin.batch_create = True
+        self.fake_plugin.reserve_resource_rows.return_value = (
+            'resource-1', {'computehost_allocations': [
+                {'id': 'allocation-1', 'compute_host_id': 'host-1',
+                 'reservation_id': 'reservation-1'}]}, False)
+        lease_create_batch = self.patch(self.db_api, 'lease_create_batch')
+        schedule = self.patch(self.manager.event_scheduler, 'schedule')
+        lease_values = {
+            'name': 'lease',
+            'user_id': self.user_id,
+            'reservations': [{'resource_type': 'virtual:instance'}],
+            'start_date': '2026-11-13 13:13',
+            'end_date': '2026-12-13 13:13',
+            'trust_id': 'exxee111qwwwwe'}
+
+        lease = self.manager.create_lease(lease_values)
+
+        self.assertEqual(self.lease, lease)
+        self.lease_create.assert_not_called()
+        self.reservation_create.assert_not_called()
+        self.event_create.assert_not_called()
+        self.lease_update.assert_not_called()
+
+        (new_lease, reservations, events,
+         resources), _kwargs = lease_create_batch.call_args
+        self.assertEqual('COMPLETE', new_lease['status'])
+        self.assertEqual('exxee111qwwwwe', new_lease['trust_id'])
+        self.assertEqual([{'id': reservations[0]['id'],
+                           'lease_id': new_lease['id'],
+                           'resource_id': 'resource-1',
+                           'resource_type': 'virtual:instance',
+                           'status': 'pending'}], reservations)
+        self.assertEqual(['start_lease', 'end_lease', 'before_end_lease'],
+                         [event['event_type'] for event in events])
+        self.assertEqual([new_lease['id']] * 3,
+                         [event['lease_id'] for event in events])
+        self.assertEqual({'computehost_allocations': [
+            {'id': 'allocation-1', 'compute_host_id': 'host-1',
+             'reservation_id': 'reservation-1'}]}, resources)
+        self.assertEqual(3, schedule.call_count)
+        self.lease_get.assert_called_once_with(new_lease['id'])
+
+    def test_create_lease_batch_two_reservations(self):
+        self.patch(self.manager, '_get_user_name').return_value = 'user'
+        self.patch(self.manager, '_get_project_name').return_value = 'project'
+        self.fake_plugin.batch_create = True
+        seen_rows = []
+
+        def fake_reserve_resource_rows(reservation_id, values,
+                                       batch_rows=None, **kwargs):
+            seen_rows.append(copy.deepcopy(batch_rows))
+            host_id = 'host-%d' % len(seen_rows)
+            return 'resource-' + host_id, {'computehost_allocations': [
+                {'id': 'allocation-' + host_id, 'compute_host_id': host_id,
+                 'reservation_id': reservation_id}]}, False
+
+        self.fake_plugin.reserve_resource_rows.side_effect = (
+            fake_reserve_resource_rows)
+        lease_create_batch = self.patch(self.db_api, 'lease_create_batch')
+        lease_values = {
+            'name': 'lease',
+            'user_id': self.user_id,
+            'reservations': [{'resource_type': 'virtual:instance'},
+                             {'resource_type': 'virtual:instance'}],
+            'start_date': '2026-11-13 13:13',
+            'end_date': '2026-12-13 13:13',
+            'trust_id': 'exxee111qwwwwe'}
+
+        self.manager.create_lease(lease_values)
+
+        (_lease, reservations, _events,
+         resources), _kwargs = lease_create_batch.call_args
+        self.assertEqual(['resource-host-1', 'resource-host-2'],
+                         [reservation['resource_id']
+                          for reservation in reservations])
+        self.assertEqual(['host-1', 'host-2'],
+                         [allocation['compute_host_id'] for allocation
+                          in resources['computehost_allocations']])
+        self.assertEqual({}, seen_rows[0])
+        self.assertEqual(['host-1'],
+                         [allocation['compute_host_id'] for allocation
+                          in seen_rows[1]['computehost_allocations']])
+
+    def test_create_lease_batch_hosts_not_free(self):
+        self.patch(self.manager, '_get_user_name').return_value = 'user'
+        self.patch(self.manager, '_get_project_name').return_value = 'project'
+        self.fake_plugin.batch_create = True
+        self.fake_plugin.reserve_resource_rows.return_value = (
+            'resource-1', {}, True)
+        lease_create_batch = self.patch(self.db_api, 'lease_create_batch')
+        lease_create_batch.side_effect = [
+            db_ex.BlazarDBHostNotFree(host='host-1'), None]
+        lease_values = {
+            'name': 'lease',
+            'user_id': self.user_id,
+            'reservations': [{'resource_type': 'virtual:instance'}],
+            'start_date': '2026-11-13 13:13',
+            'end_date': '2026-12-13 13:13',
+            'trust_id': 'exxee111qwwwwe'}
+
+        self.manager.create_lease(lease_values)
+
+        self.assertEqual(2, lease_create_batch.call_count)
+        self.assertEqual(2, self.fake_plugin.reserve_resource_rows.call_count)
+        self.fake_plugin.release_resource_rows.assert_called_once_with(
+            mock.ANY, mock.ANY, {}, encumbered=True, usage_enforcement=False,
+            usage_db_host=self.cfg.CONF.manager.usage_db_host,
+            project_name='project')
+
+    def test_create_lease_batch_hosts_never_free(self):
+        cfg.CONF.set_override('lease_create_retries', 0, group='manager')
+        self.addCleanup(cfg.CONF.clear_override, 'lease_create_retries',
+                        group='manager')
+        self.patch(self.manager, '_get_user_name').return_value = 'user'
+        self.patch(self.manager, '_get_project_name').return_value = 'project'
+        self.fake_plugin.batch_create = True
+        self.fake_plugin.reserve_resource_rows.return_value = (
+            'resource-1', {}, True)
+        self.patch(self.db_api, 'lease_create_batch').side_effect = (
+            db_ex.BlazarDBHostNotFree(host='host-1'))
+        lease_values = {
+            'name': 'lease',
+            'user_id': self.user_id,
+            'reservations': [{'resource_type': 'virtual:instance'}],
+            'start_date': '2026-11-13 13:13',
+            'end_date': '2026-12-13 13:13',
+            'trust_id': 'exxee111qwwwwe'}
+
+        self.assertRaises(manager_ex.NotEnoughHostsAvailable,
+                          self.manager.create_lease, lease_values)
+        self.assertEqual(1,
+                         self.fake_plugin.release_resource_rows.call_count)
+
+    def test_create_lease_dry_run(self):
+        self.patch(self.manager, '_get_user_name').return_value = 'user'
+        self.patch(self.manager, '_get_project_name').return_value = 'project'
+        self.fake_plugin.check_reservation.return_value = {
+            'resource_type': 'virtual:instance',
+            'hosts': ['host1'],
+            'cost': 2.0}
+        lease_values = {
+            'name': 'lease_test',
+            'user_id': self.user_id,
+            'project_id': self.project_id,
+            'reservations': [{'resource_type': 'virtual:instance'}],
+            'start_date': '2026-11-13 13:13',
+            'end_date': '2026-12-13 13:13'}
+
+        lease = self.manager.create_lease(lease_values, dry_run=True)
+
+        self.assertEqual(
+            {'name': 'lease_test',
+             'user_id': self.user_id,
+             'project_id': self.project_id,
+             'start_date': datetime.datetime(2026, 11, 13, 13, 13),
+             'end_date': datetime.datetime(2026, 12, 13, 13, 13),
+             'reservations': [{'resource_type': 'virtual:instance',
+                               'hosts': ['host1'],
+                               'cost': 2.0}],
+             'cost': 2.0,
+             'dry_run': True}, lease)
+        self.fake_plugin.check_reservation.assert_called_once_with(
+            {'resource_type': 'virtual:instance',
+             'start_date': datetime.datetime(2026, 11, 13, 13, 13),
+             'end_date': datetime.datetime(2026, 12, 13, 13, 13)},
+            usage_enforcement=False,
+            usage_db_host=self.cfg.CONF.manager.usage_db_host,
+            user_name='user',
+            project_name='project')
+        self.assertFalse(self.trust_ctx.called)
+        self.assertFalse(self.lease_create.called)
+        self.assertFalse(self.reservation_create.called)
+        self.assertFalse(self.event_create.called)
+        self.assertFalse(self.fake_plugin.reserve_resource.called)
+        self.assertFalse(self.fake_notifier.called)
+
+    def test_create_lease_dry_run_without_project_id(self):
+        lease_values = {
+            'user_id': self.user_id,
+            'reservations': [{'resource_type': 'virtual:instance'}],
+            'start_date': '2026-11-13 13:13',
+            'end_date': '2026-12-13 13:13'}
+
+        self.assertRaises(manager_ex.ProjectIdNotFound,
+                          self.manager.create_lease, lease_values,
+                          dry_run=True)
+
     def test_create_lease_validate_created_events(self):
         lease_values = {
             'id': self.lease_id,
@@ -1060,6 +1550,54 @@ class ServiceTestCase(tests.TestCase):
         self.lease_update.assert_called_once_with(self.lease_id, lease_values)
         self.assertEqual(lease, self.lease)
 
+    def test_update_lease_dry_run(self):
+        self.patch(self.manager, '_get_user_name').return_value = 'user'
+        self.patch(self.manager, '_get_project_name').return_value = 'project'
+        self.fake_plugin.check_reservation_update.return_value = {
+            'resource_type': 'virtual:instance',
+            'hosts': ['host1'],
+            'cost': 3.0}
+        reservation_get_all = (
+            self.patch(self.db_api, 'reservation_get_all_by_lease_id'))
+        reservation_get_all.return_value = [
+            {
+                'id': u'593e7028-c0d1-4d76-8642-2ffd890b324c',
+                'resource_type': 'virtual:instance',
+                'start_date': datetime.datetime(2013, 12, 20, 13, 00),
+                'end_date': datetime.datetime(2013, 12, 20, 15, 00)
+            }
+        ]
+        event_get = self.patch(db_api, 'event_get_first_sorted_by_filters')
+        lease_values = {'end_date': '2013-12-20 16:00'}
+        target = datetime.datetime(2013, 12, 15)
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = target
+            lease = self.manager.update_lease(self.lease_id, lease_values,
+                                              dry_run=True)
+
+        self.assertEqual(self.lease_id, lease['id'])
+        self.assertEqual(datetime.datetime(2013, 12, 20, 16, 00),
+                         lease['end_date'])
+        self.assertEqual(3.0, lease['cost'])
+        self.assertTrue(lease['dry_run'])
+        self.fake_plugin.check_reservation_update.assert_called_once_with(
+            u'593e7028-c0d1-4d76-8642-2ffd890b324c',
+            {
+                'id': u'593e7028-c0d1-4d76-8642-2ffd890b324c',
+                'resource_type': 'virtual:instance',
+                'start_date': datetime.datetime(2013, 12, 20, 13, 00),
+                'end_date': datetime.datetime(2013, 12, 20, 16, 00)
+            },
+            usage_enforcement=False,
+            usage_db_host=self.cfg.CONF.manager.usage_db_host,
+            project_name='project')
+        self.assertFalse(self.fake_plugin.update_reservation.called)
+        self.assertFalse(event_get.called)
+        self.assertFalse(self.event_update.called)
+        self.assertFalse(self.lease_update.called)
+
     def test_update_lease_not_started_modify_dates(self):
         def fake_event_get(sort_key, sort_dir, filters):
             if filters['event_type'] == 'start_lease':
@@ -1117,6 +1655,51 @@ class ServiceTestCase(tests.TestCase):
         self.event_update.assert_has_calls(calls)
         self.lease_update.assert_called_once_with(self.lease_id, lease_values)
 
+    def _use_db_api_event_update(self):
+        """Run the DB API wrapper of event_update on a fake driver."""
+        def fake_event_update(event_id, values):
+            event = {'id': event_id,
+                     'lease_id': self.lease_id,
+                     'time': datetime.datetime(2015, 12, 1, 20, 00),
+                     'status': 'UNDONE'}
+            event.update(values)
+            return mock.Mock(to_dict=mock.Mock(return_value=event))
+
+        self.patch(self.db_api.IMPL, 'event_update').side_effect = (
+            fake_event_update)
+        self.event_update.side_effect = db_api_event_update
+
+    def test_update_lease_schedules_updated_events(self):
+        def fake_event_get(sort_key, sort_dir, filters):
+            if filters['event_type'] == 'start_lease':
+                return {'id': 'start'}
+            elif filters['event_type'] == 'end_lease':
+                return {'id': 'end'}
+            elif filters['event_type'] == 'before_end_lease':
+                return {'id': 'before_end',
+                        'time': self.lease['end_date'],
+                        'status': 'UNDONE'}
+
+        self._use_db_api_event_update()
+        self.patch(self.db_api, 'reservation_get_all_by_lease_id'
+                   ).return_value = []
+        self.patch(db_api, 'event_get_first_sorted_by_filters'
+                   ).side_effect = fake_event_get
+        lease_values = {
+            'start_date': '2015-12-01 20:00',
+            'end_date': '2015-12-01 22:00'
+        }
+        target = datetime.datetime(2013, 12, 15)
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = target
+            self.manager.update_lease(self.lease_id, lease_values)
+
+        self.assertEqual(3, len(self.manager.event_scheduler))
+        self.assertEqual(datetime.datetime(2015, 12, 1, 20, 00),
+                         self.manager.event_scheduler.next_time())
+
     def test_update_lease_started_modify_end_date_without_before_end(self):
         def fake_event_get(sort_key, sort_dir, filters):
             if filters['event_type'] == 'start_lease':
@@ -1595,6 +2178,31 @@ class ServiceTestCase(tests.TestCase):
         self.fake_plugin.on_end.assert_called_with('111')
         self.lease_destroy.assert_called_once_with(self.lease_id)
 
+    def test_delete_lease_unschedules_end_event(self):
+        def fake_event_get(sort_key, sort_dir, filters):
+            if filters['event_type'] == 'start_lease':
+                return {'id': 'start', 'status': 'DONE'}
+            elif filters['event_type'] == 'end_lease':
+                return {'id': 'end', 'status': 'UNDONE'}
+
+        self._use_db_api_event_update()
+        self.patch(db_api, 'event_get_first_sorted_by_filters'
+                   ).side_effect = fake_event_get
+        self.patch(self.manager, 'get_lease').return_value = self.lease
+        self.manager.event_scheduler.schedule(
+            {'id': 'end', 'lease_id': self.lease_id,
+             'time': datetime.datetime(2013, 12, 20, 15, 00),
+             'status': 'UNDONE'})
+        target = datetime.datetime(2013, 12, 20, 13, 30)
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = target
+            self.manager.delete_lease(self.lease_id)
+
+        self.assertEqual(0, len(self.manager.event_scheduler))
+        self.lease_destroy.assert_called_once_with(self.lease_id)
+
     def test_delete_lease_after_starting_date_with_error_status(self):
         def fake_event_get(sort_key, sort_dir, filters):
             if filters['event_type'] == 'start_lease':
@@ -1626,20 +2234,17 @@ class ServiceTestCase(tests.TestCase):
 
         self.trust_ctx.assert_called_once_with(self.lease['trust_id'])
         basic_action.assert_called_once_with(self.lease_id, '1', 'on_start',
-                                             'active')
+                                             'active', lease=self.lease)
 
     def test_end_lease(self):
         basic_action = self.patch(self.manager, '_basic_action')
 
         self.manager.end_lease(self.lease_id, '1')
 
-        self.reservation_update.assert_called_with(
-            self.lease['reservations'][0]['id'],
-            {'status': 'completed'}
-        )
         self.trust_ctx.assert_called_once_with(self.lease['trust_id'])
-        basic_action.assert_called_once_with(self.lease_id, '1', 'on_end',
-                                             'deleted')
+        basic_action.assert_called_once_with(
+            self.lease_id, '1', 'on_end', 'deleted', lease=self.lease,
+            action_reservation_status='completed')
 
     def test_before_end_lease(self):
         basic_action = self.patch(self.manager, '_basic_action')
@@ -1651,7 +2256,34 @@ class ServiceTestCase(tests.TestCase):
 
         self.manager._basic_action(self.lease_id, '1', 'on_end')
 
-        self.event_update.assert_called_once_with('1', {'status': 'DONE'})
+        self.lease_transition.assert_has_calls([
+            mock.call(self.lease_id,
+                      {'action': 'STOP', 'status': 'IN_PROGRESS',
+                       'status_reason': 'Stopping lease...'},
+                      {}),
+            mock.call(self.lease_id,
+                      {'action': 'STOP', 'status': 'COMPLETE',
+                       'status_reason': 'Successfully stopped lease'},
+                      {}, '1', {'status': 'DONE'})])
+        self.reservation_update.assert_not_called()
+        self.event_update.assert_not_called()
+
+    def test_basic_action_with_action_res_status(self):
+        self.manager._basic_action(self.lease_id, '1', 'on_end', 'deleted',
+                                   lease=self.lease,
+                                   action_reservation_status='completed')
+
+        self.lease_get.assert_not_called()
+        self.lease_transition.assert_has_calls([
+            mock.call(self.lease_id,
+                      {'action': 'STOP', 'status': 'IN_PROGRESS',
+                       'status_reason': 'Stopping lease...'},
+                      {'111': {'status': 'completed'}}),
+            mock.call(self.lease_id,
+                      {'action': 'STOP', 'status': 'COMPLETE',
+                       'status_reason': 'Successfully stopped lease'},
+                      {'111': {'status': 'deleted'}},
+                      '1', {'status': 'DONE'})])
 
     def test_basic_action_with_res_status(self):
         self.patch(self.manager, 'get_lease').return_value = self.lease
@@ -1659,9 +2291,11 @@ class ServiceTestCase(tests.TestCase):
         self.manager._basic_action(self.lease_id, '1', 'on_end',
                                    reservation_status='IN_USE')
 
-        self.reservation_update.assert_called_once_with(
-            '111', {'status': 'IN_USE'})
-        self.event_update.assert_called_once_with('1', {'status': 'DONE'})
+        self.lease_transition.assert_called_with(
+            self.lease_id,
+            {'action': 'STOP', 'status': 'COMPLETE',
+             'status_reason': 'Successfully stopped lease'},
+            {'111': {'status': 'IN_USE'}}, '1', {'status': 'DONE'})
 
     def test_basic_action_raise_exception(self):
         def raiseBlazarException(resource_id):
@@ -1674,12 +2308,15 @@ class ServiceTestCase(tests.TestCase):
 
         self.patch(self.manager, 'get_lease').return_value = self.lease
 
-        self.manager._basic_action(self.lease_id, '1', 'on_end',
-                                   reservation_status='done')
+        self.assertRaises(exceptions.BlazarException,
+                          self.manager._basic_action, self.lease_id, '1',
+                          'on_end', reservation_status='done')
 
-        self.reservation_update.assert_called_once_with(
-            '111', {'status': 'error'})
-        self.event_update.assert_called_once_with('1', {'status': 'ERROR'})
+        self.lease_transition.assert_called_once_with(
+            self.lease_id,
+            {'action': 'STOP', 'status': 'IN_PROGRESS',
+             'status_reason': 'Stopping lease...'},
+            {})
 
     def test_basic_action_raise_exception_no_reservation_status(self):
         def raiseBlazarException(resource_id):
@@ -1692,11 +2329,16 @@ class ServiceTestCase(tests.TestCase):
 
         self.patch(self.manager, 'get_lease').return_value = self.lease
 
-        self.manager._basic_action(self.lease_id, '1', 'on_end')
-
-        self.reservation_update.assert_called_once_with(
-            '111', {'status': 'error'})
-        self.event_update.assert_called_once_with('1', {'status': 'ERROR'})
+        self.assertRaises(exceptions.BlazarException,
+                          self.manager._basic_action, self.lease_id, '1',
+                          'on_end', action_reservation_status='completed')
+
+        self.lease_transition.assert_called_once_with(
+            self.lease_id,
+            {'action': 'STOP', 'status': 'IN_PROGRESS',
+             'status_reason': 'Stopping lease...'},
+            {'111': {'status': 'completed'}})
+        self.event_update.assert_not_called()
 
     def test_getattr_with_correct_plugin_and_method(self):
         self.fake_list_computehosts = (
@@ -69,6 +69,23 @@ class TestVirtualInstancePlugin(tests.TestCase):
                                                            '%Y-%m-%d %H:%M')),
             ]
 
+    def generate_usage_events(self, lease_id, start, before_end, end,
+                              vcpus, memory, disk):
+        return [dict(event, vcpus=vcpus, memory_mb=memory, disk_gb=disk)
+                for event in self.generate_basic_events(lease_id, start,
+                                                        before_end, end)
+                if event['event_type'] != 'before_end_lease']
+
+    def patch_max_usages(self, plugin, fake_max_usages):
+        def fake_usage_timelines(host_ids, start_date, end_date):
+            return dict((host_id, mock.Mock(**{
+                'peak.return_value': fake_max_usages(host_id)}))
+                for host_id in host_ids)
+
+        mock_usage_timelines = self.patch(plugin, 'usage_timelines')
+        mock_usage_timelines.side_effect = fake_usage_timelines
+        return mock_usage_timelines
+
     def test_reserve_resource(self):
         plugin = instance_plugin.VirtualInstancePlugin()
         mock_pickup_hosts = self.patch(plugin, 'pickup_hosts')
@@ -125,8 +142,8 @@ class TestVirtualInstancePlugin(tests.TestCase):
                           'reservation_id', inputs)
 
     def test_pickup_host_from_reserved_hosts(self):
-        def fake_max_usages(host, reservations):
-            if host['id'] == 'host-1':
+        def fake_max_usages(host_id):
+            if host_id == 'host-1':
                 return 4, 4096, 2000
             else:
                 return 0, 0, 0
@@ -145,10 +162,13 @@ class TestVirtualInstancePlugin(tests.TestCase):
         mock_host_get_query.return_value = hosts_list
 
         mock_get_reservations = self.patch(db_utils,
-                                           'get_reservations_by_host_id')
+                                           'get_reservations_by_host_ids')
 
-        mock_get_reservations.side_effect = fake_get_reservation_by_host
-        plugin.max_usages = fake_max_usages
+        mock_get_reservations.side_effect = (
+            lambda host_ids, start, end: dict(
+                (host_id, fake_get_reservation_by_host(host_id, start, end))
+                for host_id in host_ids))
+        self.patch_max_usages(plugin, fake_max_usages)
         expected = ['host-2', 'host-3']
         ret = plugin.pickup_hosts(1, 1024, 20, 2,
                                   '2030-01-01 08:00', '2030-01-01 12:00')
@@ -170,9 +190,12 @@ class TestVirtualInstancePlugin(tests.TestCase):
         mock_host_get_query.return_value = hosts_list
 
         mock_get_reservations = self.patch(db_utils,
-                                           'get_reservations_by_host_id')
+                                           'get_reservations_by_host_ids')
 
-        mock_get_reservations.side_effect = fake_get_reservation_by_host
+        mock_get_reservations.side_effect = (
+            lambda host_ids, start, end: dict(
+                (host_id, fake_get_reservation_by_host(host_id, start, end))
+                for host_id in host_ids))
 
         expected = ['host-1', 'host-2']
         ret = plugin.pickup_hosts(1, 1024, 20, 2,
@@ -203,12 +226,14 @@ class TestVirtualInstancePlugin(tests.TestCase):
         mock_host_get_query.return_value = hosts_list
 
         mock_get_reservations = self.patch(db_utils,
-                                           'get_reservations_by_host_id')
+                                           'get_reservations_by_host_ids')
 
-        mock_get_reservations.side_effect = fake_get_reservation_by_host
+        mock_get_reservations.side_effect = (
+            lambda host_ids, start, end: dict(
+                (host_id, fake_get_reservation_by_host(host_id, start, end))
+                for host_id in host_ids))
 
-        mock_max_usages = self.patch(plugin, 'max_usages')
-        mock_max_usages.return_value = (0, 0, 0)
+        self.patch_max_usages(plugin, lambda host_id: (0, 0, 0))
 
         expected = ['host-1', 'host-3']
         ret = plugin.pickup_hosts(1, 1024, 20, 2,
@@ -244,153 +269,118 @@ class TestVirtualInstancePlugin(tests.TestCase):
         mock_host_get_query.return_value = hosts_list
 
         mock_get_reservations = self.patch(db_utils,
-                                           'get_reservations_by_host_id')
+                                           'get_reservations_by_host_ids')
 
-        mock_get_reservations.side_effect = fake_get_reservation_by_host
+        mock_get_reservations.side_effect = (
+            lambda host_ids, start, end: dict(
+                (host_id, fake_get_reservation_by_host(host_id, start, end))
+                for host_id in host_ids))
 
-        mock_max_usages = self.patch(plugin, 'max_usages')
-        mock_max_usages.return_value = (1, 1024, 100)
+        self.patch_max_usages(plugin, lambda host_id: (1, 1024, 100))
 
         self.assertRaises(mgr_exceptions.HostNotFound, plugin.pickup_hosts,
                           1, 1024, 20, 2,
                           '2030-01-01 08:00', '2030-01-01 12:00')
 
-    def test_max_usage_with_serial_reservation(self):
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['lease_id'] == 'lease-1':
-                return self.generate_basic_events('lease-1',
-                                                  '2030-01-01 08:00',
-                                                  '2030-01-01 10:00',
-                                                  '2030-01-01 11:00')
-            elif filters['lease_id'] == 'lease-2':
-                return self.generate_basic_events('lease-2',
-                                                  '2030-01-01 12:00',
-                                                  '2030-01-01 13:00',
-                                                  '2030-01-01 14:00')
-
-        plugin = instance_plugin.VirtualInstancePlugin()
-        reservations = [
-            {
-                'lease_id': 'lease-1',
-                'instance_reservations': {
-                    'vcpus': 2, 'memory_mb': 3072, 'disk_gb': 20}},
-            {
-                'lease_id': 'lease-2',
-                'instance_reservations': {
-                    'vcpus': 3, 'memory_mb': 2048, 'disk_gb': 30}}
-            ]
-
-        mock_event_get = self.patch(db_api, 'event_get_all_sorted_by_filters')
-        mock_event_get.side_effect = fake_event_get
-
-        expected = (3, 3072, 30)
-        ret = plugin.max_usages('fake-host', reservations)
-
-        self.assertEqual(expected, ret)
-
-    def test_max_usage_with_parallel_reservation(self):
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['lease_id'] == 'lease-1':
-                return self.generate_basic_events('lease-1',
-                                                  '2030-01-01 08:00',
-                                                  '2030-01-01 10:00',
-                                                  '2030-01-01 11:00')
-            elif filters['lease_id'] == 'lease-2':
-                return self.generate_basic_events('lease-2',
-                                                  '2030-01-01 10:00',
-                                                  '2030-01-01 13:00',
-                                                  '2030-01-01 14:00')
-
+    def test_usage_timeline_with_serial_reservation(self):
+        events = (
+            self.generate_usage_events('lease-1', '2030-01-01 08:00',
+                                       '2030-01-01 10:00', '2030-01-01 11:00',
+                                       2, 3072, 20) +
+            self.generate_usage_events('lease-2', '2030-01-01 12:00',
+                                       '2030-01-01 13:00', '2030-01-01 14:00',
+                                       3, 2048, 30))
+
+        timeline = instance_plugin.UsageTimeline(events)
+
+        self.assertEqual((3, 3072, 30), timeline.peak())
+
+    def test_usage_timeline_with_parallel_reservation(self):
+        events = (
+            self.generate_usage_events('lease-1', '2030-01-01 08:00',
+                                       '2030-01-01 10:00', '2030-01-01 11:00',
+                                       2, 3072, 20) +
+            self.generate_usage_events('lease-2', '2030-01-01 10:00',
+                                       '2030-01-01 13:00', '2030-01-01 14:00',
+                                       3, 2048, 30))
+
+        timeline = instance_plugin.UsageTimeline(events)
+
+        self.assertEqual((5, 5120, 50), timeline.peak())
+
+    def test_usage_timeline_with_multi_reservation(self):
+        events = (
+            self.generate_usage_events('lease-1', '2030-01-01 08:00',
+                                       '2030-01-01 10:00', '2030-01-01 11:00',
+                                       2, 3072, 20) +
+            self.generate_usage_events('lease-1', '2030-01-01 08:00',
+                                       '2030-01-01 10:00', '2030-01-01 11:00',
+                                       3, 2048, 30))
+
+        timeline = instance_plugin.UsageTimeline(events)
+
+        self.assertEqual((5, 5120, 50), timeline.peak())
+
+    def test_usage_timeline_with_decrease_reservation(self):
+        events = (
+            self.generate_usage_events('lease-1', '2030-01-01 08:00',
+                                       '2030-01-01 10:00', '2030-01-01 11:00',
+                                       2, 3072, 20) +
+            self.generate_usage_events('lease-2', '2030-01-01 10:00',
+                                       '2030-01-01 13:00', '2030-01-01 14:00',
+                                       1, 1024, 10) +
+            self.generate_usage_events('lease-3', '2030-01-01 15:00',
+                                       '2030-01-01 16:00', '2030-01-01 17:00',
+                                       4, 2048, 40))
+
+        timeline = instance_plugin.UsageTimeline(events)
+
+        self.assertEqual((4, 4096, 40), timeline.peak())
+
+    def test_usage_timeline_peak_in_period(self):
+        events = (
+            self.generate_usage_events('lease-1', '2030-01-01 08:00',
+                                       '2030-01-01 10:00', '2030-01-01 11:00',
+                                       2, 3072, 20) +
+            self.generate_usage_events('lease-2', '2030-01-01 11:00',
+                                       '2030-01-01 13:00', '2030-01-01 14:00',
+                                       3, 2048, 30))
+
+        timeline = instance_plugin.UsageTimeline(events)
+
+        def date(value):
+            return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M')
+
+        self.assertEqual((2, 3072, 20),
+                         timeline.peak(date('2030-01-01 09:00'),
+                                       date('2030-01-01 11:00')))
+        self.assertEqual((3, 2048, 30),
+                         timeline.peak(date('2030-01-01 11:00'),
+                                       date('2030-01-01 15:00')))
+        self.assertEqual((0, 0, 0),
+                         timeline.peak(date('2030-01-01 14:00'),
+                                       date('2030-01-01 15:00')))
+        self.assertEqual((3, 2048, 30),
+                         timeline.usage_at(date('2030-01-01 11:00')))
+
+    def test_usage_timelines(self):
         plugin = instance_plugin.VirtualInstancePlugin()
-        reservations = [
-            {
-                'lease_id': 'lease-1',
-                'instance_reservations': {
-                    'vcpus': 2, 'memory_mb': 3072, 'disk_gb': 20}},
-            {
-                'lease_id': 'lease-2',
-                'instance_reservations': {
-                    'vcpus': 3, 'memory_mb': 2048, 'disk_gb': 30}},
-            ]
-
-        mock_event_get = self.patch(db_api, 'event_get_all_sorted_by_filters')
-        mock_event_get.side_effect = fake_event_get
-
-        expected = (5, 5120, 50)
-        ret = plugin.max_usages('fake-host', reservations)
-
-        self.assertEqual(expected, ret)
-
-    def test_max_usage_with_multi_reservation(self):
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['lease_id'] == 'lease-1':
-                return self.generate_basic_events('lease-1',
-                                                  '2030-01-01 08:00',
-                                                  '2030-01-01 10:00',
-                                                  '2030-01-01 11:00')
-
-        plugin = instance_plugin.VirtualInstancePlugin()
-        reservations = [
-            {
-                'lease_id': 'lease-1',
-                'instance_reservations': {
-                    'vcpus': 2, 'memory_mb': 3072, 'disk_gb': 20}},
-            {
-                'lease_id': 'lease-1',
-                'instance_reservations': {
-                    'vcpus': 3, 'memory_mb': 2048, 'disk_gb': 30}},
-            ]
-
-        mock_event_get = self.patch(db_api, 'event_get_all_sorted_by_filters')
-        mock_event_get.side_effect = fake_event_get
-
-        expected = (5, 5120, 50)
-        ret = plugin.max_usages('fake-host', reservations)
-
-        self.assertEqual(expected, ret)
-
-    def test_max_usage_with_decrease_reservation(self):
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['lease_id'] == 'lease-1':
-                return self.generate_basic_events('lease-1',
-                                                  '2030-01-01 08:00',
-                                                  '2030-01-01 10:00',
-                                                  '2030-01-01 11:00')
-            elif filters['lease_id'] == 'lease-2':
-                return self.generate_basic_events('lease-2',
-                                                  '2030-01-01 10:00',
-                                                  '2030-01-01 13:00',
-                                                  '2030-01-01 14:00')
-            elif filters['lease_id'] == 'lease-3':
-                return self.generate_basic_events('lease-3',
-                                                  '2030-01-01 15:00',
-                                                  '2030-01-01 16:00',
-                                                  '2030-01-01 17:00')
-
-        plugin = instance_plugin.VirtualInstancePlugin()
-        reservations = [
-            {
-                'lease_id': 'lease-1',
-                'instance_reservations': {
-                    'vcpus': 2, 'memory_mb': 3072, 'disk_gb': 20}},
-            {
-                'lease_id': 'lease-2',
-                'instance_reservations': {
-                    'vcpus': 1, 'memory_mb': 1024, 'disk_gb': 10}},
-            {
-                'lease_id': 'lease-3',
-                'instance_reservations': {
-                    'vcpus': 4, 'memory_mb': 2048, 'disk_gb': 40
-                    }},
-            ]
-
-        mock_event_get = self.patch(db_api, 'event_get_all_sorted_by_filters')
-        mock_event_get.side_effect = fake_event_get
-
-        expected = (4, 4096, 40)
-        ret = plugin.max_usages('fake-host', reservations)
-
-        self.assertEqual(expected, ret)
+        mock_events_get = self.patch(db_utils,
+                                     'get_instance_usage_events_by_host')
+        mock_events_get.return_value = {
+            'host-1': self.generate_usage_events(
+                'lease-1', '2030-01-01 08:00', '2030-01-01 10:00',
+                '2030-01-01 11:00', 2, 3072, 20)}
+
+        timelines = plugin.usage_timelines(['host-1', 'host-2'],
+                                           '2030-01-01 08:00',
+                                           '2030-01-01 12:00')
+
+        mock_events_get.assert_called_once_with(['host-1', 'host-2'],
+                                                '2030-01-01 08:00',
+                                                '2030-01-01 12:00')
+        self.assertEqual((2, 3072, 20), timelines['host-1'].peak())
+        self.assertEqual((0, 0, 0), timelines['host-2'].peak())
 
     def test_create_resources(self):
         instance_reservation = {
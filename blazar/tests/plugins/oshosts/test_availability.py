@@ -0,0 +1,295 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import os
+
+import fixtures
+from oslo_config import cfg
+
+from blazar.db import api as db_api
+from blazar.db import utils as db_utils
+from blazar.plugins import oshosts as plugin
+from blazar.plugins.oshosts import availability
+from blazar.plugins.oshosts import capabilities
+from blazar import tests
+
+
+def _dt(hour, minute=0):
+    return datetime.datetime(2030, 1, 1, hour, minute)
+
+
+class DBAvailabilityTestCase(tests.TestCase):
+
+    def setUp(self):
+        super(DBAvailabilityTestCase, self).setUp()
+        self.backend = availability.DBAvailability()
+
+    def test_get_free_hosts(self):
+        def host_allocation_get_all_by_values(**kwargs):
+            return kwargs['compute_host_id'] != 'host1'
+
+        def get_free_periods(host_id, start_date, end_date, duration):
+            if host_id == 'host2':
+                return [(start_date, end_date)]
+            return [(start_date, start_date + datetime.timedelta(hours=1))]
+
+        self.patch(db_api, 'host_allocation_get_all_by_values').side_effect = (
+            host_allocation_get_all_by_values)
+        self.patch(db_utils, 'get_free_periods').side_effect = (
+            get_free_periods)
+
+        result = self.backend.get_free_hosts(['host1', 'host2', 'host3'],
+                                             _dt(10), _dt(12))
+        self.assertEqual((['host1'], ['host2']), result)
+
+    def test_get_free_hosts_in_pool(self):
+        def host_allocation_get_all_by_values(**kwargs):
+            return kwargs['compute_host_id'] in ('host2', 'host4')
+
+        cfg.CONF.set_override('availability_pool_size', 3,
+                              group=plugin.RESOURCE_TYPE)
+        self.addCleanup(cfg.CONF.clear_override, 'availability_pool_size',
+                        group=plugin.RESOURCE_TYPE)
+        self.patch(db_api, 'host_allocation_get_all_by_values').side_effect = (
+            host_allocation_get_all_by_values)
+        self.patch(db_utils, 'get_free_periods').side_effect = (
+            lambda host_id, start_date, end_date, duration:
+            [(start_date, end_date)])
+
+        result = self.backend.get_free_hosts(
+            ['host1', 'host2', 'host3', 'host4', 'host5'], _dt(10), _dt(12))
+        self.assertEqual((['host1', 'host3', 'host5'], ['host2', 'host4']),
+                         result)
+
+    def test_find_free_hosts_with_capability_index(self):
+        match_hosts = self.patch(capabilities, 'match_hosts')
+        match_hosts.return_value = ['host1', 'host2']
+        free_in_window = self.patch(db_api, 'host_get_all_free_in_window')
+        free_in_window.return_value = [({'id': 'host2'}, True)]
+
+        result = self.backend.find_free_hosts(['vgpu > 2'], _dt(10), _dt(12))
+        self.assertEqual(([], ['host2']), result)
+        free_in_window.assert_called_once_with(
+            [], _dt(10), _dt(12), host_ids=['host1', 'host2'])
+
+        match_hosts.return_value = []
+        self.assertEqual(([], []), self.backend.find_free_hosts(
+            ['vgpu > 20'], _dt(10), _dt(12)))
+        self.assertEqual(1, free_in_window.call_count)
+
+    def test_get_busy_hosts(self):
+        get_full_periods = self.patch(db_utils, 'get_full_periods_by_host')
+        get_full_periods.return_value = {
+            # Only the reservation itself
+            'host1': [(_dt(10), _dt(11))],
+            'host2': [(_dt(9), _dt(11))],
+        }
+
+        result = self.backend.get_busy_hosts(['host1', 'host2'], 'r1',
+                                             _dt(10), _dt(11),
+                                             _dt(9), _dt(11))
+        self.assertEqual(['host2'], result)
+
+    def test_get_gaps(self):
+        get_adjacent = self.patch(db_utils,
+                                  'get_adjacent_allocations_by_host')
+        get_adjacent.return_value = {'host1': (_dt(9), None),
+                                     'host2': (None, _dt(13))}
+
+        result = self.backend.get_gaps(['host1', 'host2', 'host3'],
+                                       _dt(10), _dt(12))
+        self.assertEqual({'host1': (3600, None), 'host2': (None, 3600),
+                          'host3': (None, None)}, result)
+        get_adjacent.assert_called_once_with(['host1', 'host2', 'host3'],
+                                             _dt(10), _dt(12))
+
+
+class MemoryAvailabilityTestCase(tests.TestCase):
+
+    def setUp(self):
+        super(MemoryAvailabilityTestCase, self).setUp()
+        self.get_periods = self.patch(db_utils, 'get_host_allocation_periods')
+        self.get_periods.return_value = [
+            ('a1', 'host1', 'r1', _dt(9), _dt(10)),
+            ('a2', 'host1', 'r2', _dt(12), _dt(13)),
+            ('a3', 'host2', 'r3', _dt(8), _dt(20)),
+            ('a4', 'host3', 'r2', _dt(12), _dt(13)),
+        ]
+        self.backend = availability.MemoryAvailability()
+        self.backend.load()
+
+    def test_get_free_hosts(self):
+        result = self.backend.get_free_hosts(
+            ['host4', 'host3', 'host2', 'host1'], _dt(10), _dt(12))
+        self.assertEqual((['host4'], ['host3', 'host1']), result)
+
+    def test_get_free_hosts_overlap(self):
+        result = self.backend.get_free_hosts(['host1', 'host2', 'host3'],
+                                             _dt(9, 30), _dt(12, 30))
+        self.assertEqual(([], []), result)
+
+    def test_add_and_remove_allocation(self):
+        self.backend.add_allocation('a5', 'host4', 'r4', _dt(10), _dt(11))
+        self.assertEqual(([], []),
+                         self.backend.get_free_hosts(['host4'], _dt(10, 30),
+                                                     _dt(12)))
+
+        self.backend.remove_allocation('a5')
+        self.assertEqual((['host4'], []),
+                         self.backend.get_free_hosts(['host4'], _dt(10, 30),
+                                                     _dt(12)))
+        # Removing an unknown allocation is a no-op
+        self.backend.remove_allocation('a5')
+
+    def test_move_reservation(self):
+        self.backend.move_reservation('r2', _dt(10), _dt(11))
+        self.assertEqual(([], ['host1', 'host3']),
+                         self.backend.get_free_hosts(['host1', 'host3'],
+                                                     _dt(12), _dt(13)))
+        self.assertEqual(([], []),
+                         self.backend.get_free_hosts(['host1', 'host3'],
+                                                     _dt(10, 30), _dt(12)))
+
+    def test_get_gaps(self):
+        self.backend.add_allocation('a5', 'host1', 'r4', _dt(6), _dt(10, 30))
+        result = self.backend.get_gaps(['host1', 'host3', 'host4'],
+                                       _dt(11), _dt(11, 30))
+        self.assertEqual({'host1': (1800, 1800), 'host3': (None, 1800),
+                          'host4': (None, None)}, result)
+
+    def test_get_busy_hosts(self):
+        result = self.backend.get_busy_hosts(['host1', 'host3'], 'r2',
+                                             _dt(12), _dt(13),
+                                             _dt(9, 30), _dt(13))
+        self.assertEqual(['host1'], result)
+
+
+class GetBackendTestCase(tests.TestCase):
+
+    def setUp(self):
+        super(GetBackendTestCase, self).setUp()
+        self.patch(availability, '_BACKEND')
+        availability._BACKEND = None
+        self.patch(db_utils, 'get_host_allocation_periods').return_value = []
+
+    def test_get_backend(self):
+        self.assertIsInstance(availability.get_backend(),
+                              availability.DBAvailability)
+
+        cfg.CONF.set_override('availability_backend', 'memory',
+                              group=plugin.RESOURCE_TYPE)
+        self.addCleanup(cfg.CONF.clear_override, 'availability_backend',
+                        group=plugin.RESOURCE_TYPE)
+        backend = availability.get_backend()
+        self.assertIsInstance(backend, availability.MemoryAvailability)
+        self.assertIs(backend, availability.get_backend())
+
+
+class BitmapAvailabilityTestCase(tests.TestCase):
+
+    def setUp(self):
+        super(BitmapAvailabilityTestCase, self).setUp()
+        cfg.CONF.set_override('availability_slot_minutes', 30,
+                              group=plugin.RESOURCE_TYPE)
+        cfg.CONF.set_override('availability_horizon_days', 2,
+                              group=plugin.RESOURCE_TYPE)
+        self.addCleanup(cfg.CONF.clear_override, 'availability_slot_minutes',
+                        group=plugin.RESOURCE_TYPE)
+        self.addCleanup(cfg.CONF.clear_override, 'availability_horizon_days',
+                        group=plugin.RESOURCE_TYPE)
+        self.snapshot_file = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'availability.json')
+
+        self.get_periods = self.patch(db_utils, 'get_host_allocation_periods')
+        self.backend = availability.BitmapAvailability()
+        self.origin = self.backend._origin
+        self.get_periods.return_value = [
+            ('a1', 'host1', 'r1', self._dt(1), self._dt(2)),
+            ('a2', 'host1', 'r2', self._dt(4), self._dt(5)),
+            ('a3', 'host2', 'r3', self._dt(0), self._dt(10)),
+            ('a4', 'host3', 'r2', self._dt(4), self._dt(5)),
+        ]
+        self.backend.load()
+
+    def _dt(self, hours):
+        return self.origin + datetime.timedelta(hours=hours)
+
+    def test_mask(self):
+        self.assertEqual(0b1100, self.backend._mask(self._dt(1), self._dt(2)))
+        # Partially covered slots are included
+        self.assertEqual(0b1110, self.backend._mask(self._dt(0.75),
+                                                    self._dt(2)))
+        self.assertEqual(0, self.backend._mask(self._dt(-2), self._dt(-1)))
+
+    def test_get_free_hosts(self):
+        result = self.backend.get_free_hosts(
+            ['host4', 'host3', 'host2', 'host1'], self._dt(2), self._dt(4))
+        self.assertEqual((['host4'], ['host3', 'host1']), result)
+        self.assertEqual(
+            ([], []),
+            self.backend.get_free_hosts(['host1', 'host2', 'host3'],
+                                        self._dt(1.5), self._dt(4.5)))
+
+    def test_get_free_hosts_outside_horizon(self):
+        db_get_free_hosts = self.patch(availability.DBAvailability,
+                                       'get_free_hosts')
+        self.backend.get_free_hosts(['host1'], self._dt(47), self._dt(49))
+        db_get_free_hosts.assert_called_once_with(['host1'], self._dt(47),
+                                                  self._dt(49))
+
+    def test_add_remove_and_move(self):
+        self.backend.add_allocation('a5', 'host4', 'r4', self._dt(2),
+                                    self._dt(3))
+        self.assertEqual(['host4'], self.backend.filter_allocated_hosts(
+            ['host4'], self._dt(2.5), self._dt(4)))
+        self.backend.move_reservation('r4', self._dt(6), self._dt(7))
+        self.assertEqual([], self.backend.filter_allocated_hosts(
+            ['host4'], self._dt(2.5), self._dt(4)))
+        self.backend.remove_allocation('a5')
+        self.assertEqual([], self.backend.filter_allocated_hosts(
+            ['host4'], self._dt(6), self._dt(7)))
+
+    def test_get_busy_hosts(self):
+        result = self.backend.get_busy_hosts(['host1', 'host3'], 'r2',
+                                             self._dt(4), self._dt(5),
+                                             self._dt(1.5), self._dt(5))
+        self.assertEqual(['host1'], result)
+
+    def test_snapshot(self):
+        cfg.CONF.set_override('availability_snapshot_file', self.snapshot_file,
+                              group=plugin.RESOURCE_TYPE)
+        self.addCleanup(cfg.CONF.clear_override, 'availability_snapshot_file',
+                        group=plugin.RESOURCE_TYPE)
+        backend = availability.BitmapAvailability()
+        backend.load()
+        self.assertTrue(os.path.exists(self.snapshot_file))
+
+        self.get_periods.reset_mock()
+        get_changes = self.patch(db_utils, 'get_host_allocation_changes')
+        get_changes.return_value = [
+            ('a2', 'host1', 'r2', self._dt(4), self._dt(5), True),
+            ('a5', 'host4', 'r4', self._dt(2), self._dt(3), False),
+        ]
+        self.patch(db_utils, 'get_host_allocation_ids').return_value = [
+            'a1', 'a4', 'a5']
+
+        backend = availability.BitmapAvailability()
+        backend.load()
+
+        self.get_periods.assert_not_called()
+        self.assertEqual(['a1', 'a4', 'a5'], sorted(backend._allocations))
+        self.assertEqual(['host1', 'host4'], backend.filter_allocated_hosts(
+            ['host1', 'host3', 'host4'], self._dt(1), self._dt(3)))
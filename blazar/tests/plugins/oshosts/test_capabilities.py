@@ -0,0 +1,118 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from oslo_config import cfg
+
+from blazar.db import api as db_api
+from blazar.plugins import oshosts as plugin
+from blazar.plugins.oshosts import capabilities
+from blazar import tests
+from blazar.utils import plugins as plugins_utils
+
+
+class CapabilityIndexTestCase(tests.TestCase):
+
+    def setUp(self):
+        super(CapabilityIndexTestCase, self).setUp()
+        self.host_list = self.patch(db_api, 'host_list')
+        self.host_list.return_value = [
+            {'id': 'host1', 'memory_mb': 2048, 'cpu_info': 'Westmere',
+             'status': None},
+            {'id': 'host2', 'memory_mb': 8192, 'cpu_info': 'Haswell',
+             'status': None},
+            {'id': 'host3', 'memory_mb': 4096, 'cpu_info': 'Haswell',
+             'status': None},
+        ]
+        self.extra_capability_list = self.patch(db_api,
+                                                'host_extra_capability_list')
+        self.extra_capability_list.return_value = [
+            {'computehost_id': 'host1', 'capability_name': 'vgpu',
+             'capability_value': '9'},
+            {'computehost_id': 'host2', 'capability_name': 'vgpu',
+             'capability_value': '10.0'},
+            {'computehost_id': 'host3', 'capability_name': 'vgpu',
+             'capability_value': 'ten'},
+            {'computehost_id': 'host1', 'capability_name': 'gpu',
+             'capability_value': 'k80'},
+            # Host columns shadow extra capabilities
+            {'computehost_id': 'host1', 'capability_name': 'memory_mb',
+             'capability_value': '1'},
+        ]
+        self.index = capabilities.CapabilityIndex()
+        self.index.load()
+
+    def test_match_columns(self):
+        self.assertEqual(['host2', 'host3'],
+                         self.index.match(['memory_mb > 2048']))
+        self.assertEqual(['host1'], self.index.match(['memory_mb <= 2048']))
+        self.assertEqual(['host1', 'host3'],
+                         self.index.match(['memory_mb in 2048,4096']))
+        self.assertEqual(['host3'],
+                         self.index.match(['cpu_info == Haswell',
+                                           'memory_mb < 8192']))
+        self.assertEqual(['host1', 'host2', 'host3'], self.index.match([]))
+
+    def test_match_extra_capabilities(self):
+        # 'ten' is not a number and is compared as a string
+        self.assertEqual(['host2', 'host3'], self.index.match(['vgpu > 9']))
+        self.assertEqual(['host1', 'host2'],
+                         self.index.match(['vgpu <= 10']))
+        self.assertEqual(['host2'], self.index.match(['vgpu == 10']))
+        self.assertEqual(['host1', 'host3'], self.index.match(['vgpu != 10']))
+        self.assertEqual(['host3'], self.index.match(['vgpu >= t']))
+        self.assertEqual(['host1', 'host3'],
+                         self.index.match(['vgpu in 9,ten']))
+        # Hosts without the capability never match
+        self.assertEqual([], self.index.match(['gpu != k80']))
+
+    def test_match_grouped_queries(self):
+        queries = plugins_utils.convert_requirements(
+            '["or", ["=", "$gpu", "k80"], ["and", [">", "$memory_mb", "2048"],'
+            ' ["<", "$memory_mb", "8192"]]]')
+        self.assertEqual(['host1', 'host3'], self.index.match(queries))
+        self.assertIsNone(self.index.match(plugins_utils.convert_requirements(
+            '["or", ["=", "$gpu", "k80"], ["=", "$apples", "2"]]')))
+
+    def test_match_unsupported(self):
+        self.assertIsNone(self.index.match(['cpu_info like %Haswell%']))
+        self.assertIsNone(self.index.match(['status == null']))
+        self.assertIsNone(self.index.match(['apples < 2048']))
+        self.assertIsNone(self.index.match(['memory_mb <']))
+
+
+class GetIndexTestCase(tests.TestCase):
+
+    def setUp(self):
+        super(GetIndexTestCase, self).setUp()
+        self.patch(capabilities, '_INDEX')
+        capabilities._INDEX = None
+        self.patch(db_api, 'host_list').return_value = [{'id': 'host1'}]
+        self.patch(db_api, 'host_extra_capability_list').return_value = []
+
+    def test_disabled(self):
+        self.assertIsNone(capabilities.get_index())
+        self.assertIsNone(capabilities.match_hosts(['id == host1']))
+
+    def test_get_index_and_invalidate(self):
+        cfg.CONF.set_override('capability_index', True,
+                              group=plugin.RESOURCE_TYPE)
+        self.addCleanup(cfg.CONF.clear_override, 'capability_index',
+                        group=plugin.RESOURCE_TYPE)
+        index = capabilities.get_index()
+        self.assertIs(index, capabilities.get_index())
+        self.assertEqual(['host1'], capabilities.match_hosts(['id == host1']))
+
+        capabilities.invalidate()
+        self.assertIsNot(index, capabilities.get_index())
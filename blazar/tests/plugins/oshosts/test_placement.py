@@ -0,0 +1,65 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from oslo_config import cfg
+
+from blazar.plugins import oshosts as plugin
+from blazar.plugins.oshosts import placement
+from blazar import tests
+
+GAPS = {
+    'host1': (3600, 7200),
+    'host2': (600, None),
+    'host3': (None, 60),
+    'host4': (86400, 86400),
+}
+
+
+class PlacementTestCase(tests.TestCase):
+
+    def test_first_fit(self):
+        strategy = placement.FirstFit()
+        self.assertEqual(['host5', 'host6'], strategy.select(
+            ['host5', 'host6', 'host7'], ['host1'], {}, 2, 2))
+        self.assertEqual(['host1', 'host2'], strategy.select(
+            ['host5'], ['host1', 'host2'], {}, 2, 2))
+        self.assertEqual([], strategy.select(['host5'], ['host1'], {}, 3, 3))
+
+    def test_best_fit_by_gap(self):
+        strategy = placement.BestFitByGap()
+        self.assertEqual(['host3', 'host2', 'host1'], strategy.select(
+            ['host5'], ['host1', 'host2', 'host3', 'host4'], GAPS, 2, 3))
+        # Hosts without allocations leave infinite gaps
+        self.assertEqual(['host4', 'host5'], strategy.select(
+            ['host5'], ['host4'], GAPS, 1, 2))
+        self.assertEqual([], strategy.select(['host5'], [], GAPS, 2, 2))
+
+    def test_spread(self):
+        strategy = placement.Spread()
+        self.assertEqual(['host5', 'host4', 'host1'], strategy.select(
+            ['host5'], ['host1', 'host2', 'host3', 'host4'], GAPS, 2, 3))
+
+    def test_get_strategy(self):
+        self.patch(placement, '_STRATEGY')
+        placement._STRATEGY = None
+        self.assertIsInstance(placement.get_strategy(), placement.FirstFit)
+
+        cfg.CONF.set_override('placement_strategy', 'best_fit_by_gap',
+                              group=plugin.RESOURCE_TYPE)
+        self.addCleanup(cfg.CONF.clear_override, 'placement_strategy',
+                        group=plugin.RESOURCE_TYPE)
+        strategy = placement.get_strategy()
+        self.assertIsInstance(strategy, placement.BestFitByGap)
+        self.assertIs(strategy, placement.get_strategy())
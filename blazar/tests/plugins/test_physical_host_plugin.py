@@ -30,6 +30,9 @@ from blazar.db import utils as db_utils
 from blazar.manager import exceptions as manager_exceptions
 from blazar.manager import service
 from blazar.plugins import oshosts as plugin
+from blazar.plugins.oshosts import availability
+from blazar.plugins.oshosts import billrate
+from blazar.plugins.oshosts import capabilities
 from blazar.plugins.oshosts import host_plugin
 from blazar import tests
 from blazar.utils.openstack import base
@@ -250,6 +253,7 @@ class PhysicalHostPluginTestCase(tests.TestCase):
 
     def test_update_host(self):
         host_values = {'foo': 'baz'}
+        invalidate = self.patch(capabilities, 'invalidate')
 
         self.db_host_extra_capability_get_all_per_name.return_value = [
             {'id': '1',
@@ -261,6 +265,7 @@ class PhysicalHostPluginTestCase(tests.TestCase):
                                                  host_values)
         self.db_host_extra_capability_update.assert_called_once_with(
             '1', {'capability_name': 'foo', 'capability_value': 'baz'})
+        invalidate.assert_called_once_with()
 
     def test_update_host_having_issue_when_storing_extra_capability(self):
         def fake_db_host_extra_capability_update(*args, **kwargs):
@@ -358,9 +363,13 @@ class PhysicalHostPluginTestCase(tests.TestCase):
                                              'host_reservation_create')
         matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
         matching_hosts.return_value = ['host1', 'host2']
-        host_allocation_create = self.patch(
+        host_allocation_claim = self.patch(
             self.db_api,
-            'host_allocation_create')
+            'host_allocation_claim')
+        host_allocation_claim.side_effect = [
+            {'id': '1', 'compute_host_id': 'host1'},
+            {'id': '2', 'compute_host_id': 'host2'},
+        ]
         self.fake_phys_plugin.reserve_resource(
             u'441c1476-9f8f-4700-9f30-cd9b6fef3509',
             values)
@@ -378,13 +387,316 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             mock.call(
                 {'compute_host_id': 'host1',
                  'reservation_id': u'441c1476-9f8f-4700-9f30-cd9b6fef3509',
-                 }),
+                 },
+                values['start_date'], values['end_date']),
             mock.call(
                 {'compute_host_id': 'host2',
                  'reservation_id': u'441c1476-9f8f-4700-9f30-cd9b6fef3509',
-                 }),
+                 },
+                values['start_date'], values['end_date']),
         ]
-        host_allocation_create.assert_has_calls(calls)
+        host_allocation_claim.assert_has_calls(calls)
+
+    def test_reserve_resource_rows(self):
+        values = {
+            'lease_id': u'018c1b43-e69e-4aef-a543-09681539cf4c',
+            'min': u'1',
+            'max': u'1',
+            'hypervisor_properties': '["=", "$memory_mb", "256"]',
+            'resource_properties': '',
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 00),
+            'resource_type': plugin.RESOURCE_TYPE,
+        }
+        self.rp_create.return_value = mock.MagicMock(id=1)
+        host_reservation_create = self.patch(self.db_api,
+                                             'host_reservation_create')
+        host_allocation_claim = self.patch(self.db_api,
+                                           'host_allocation_claim')
+        matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
+        matching_hosts.return_value = ['host1', 'host2']
+
+        resource_id, rows, encumbered = (
+            self.fake_phys_plugin.reserve_resource_rows(
+                u'441c1476-9f8f-4700-9f30-cd9b6fef3509', values))
+
+        host_reservation_create.assert_not_called()
+        host_allocation_claim.assert_not_called()
+        self.assertEqual([{
+            'id': resource_id,
+            'reservation_id': u'441c1476-9f8f-4700-9f30-cd9b6fef3509',
+            'aggregate_id': 1,
+            'resource_properties': '',
+            'hypervisor_properties': '["=", "$memory_mb", "256"]',
+            'count_range': '1-1',
+            'status': 'pending',
+            'before_end': 'default'
+        }], rows['computehost_reservations'])
+        self.assertEqual(
+            [('host1', u'441c1476-9f8f-4700-9f30-cd9b6fef3509'),
+             ('host2', u'441c1476-9f8f-4700-9f30-cd9b6fef3509')],
+            [(allocation['compute_host_id'], allocation['reservation_id'])
+             for allocation in rows['computehost_allocations']])
+        self.assertFalse(encumbered)
+
+    def test_reserve_resource_rows_usage_db_unavailable(self):
+        values = {
+            'lease_id': u'018c1b43-e69e-4aef-a543-09681539cf4c',
+            'min': u'1',
+            'max': u'1',
+            'hypervisor_properties': '',
+            'resource_properties': '',
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 00),
+            'resource_type': plugin.RESOURCE_TYPE,
+        }
+        self.rp_create.return_value = mock.MagicMock(id=1)
+        self.patch(self.fake_phys_plugin, '_matching_hosts').return_value = [
+            'host1']
+        self.patch(billrate, 'computehost_billrate').return_value = 1.0
+        r = mock.MagicMock()
+        r.hget.side_effect = redis.exceptions.ConnectionError
+        self.patch(self.fake_phys_plugin, '_setup_redis').return_value = r
+
+        _resource_id, _rows, encumbered = (
+            self.fake_phys_plugin.reserve_resource_rows(
+                u'441c1476-9f8f-4700-9f30-cd9b6fef3509', values,
+                usage_enforcement=True, project_name='project'))
+
+        self.assertFalse(encumbered)
+        r.hincrbyfloat.assert_not_called()
+
+    def test_reserve_resource_rows_two_reservations(self):
+        values = {
+            'lease_id': u'018c1b43-e69e-4aef-a543-09681539cf4c',
+            'min': u'1',
+            'max': u'2',
+            'hypervisor_properties': '',
+            'resource_properties': '',
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 00),
+            'resource_type': plugin.RESOURCE_TYPE,
+        }
+        self.rp_create.return_value = mock.MagicMock(id=1)
+        matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
+        matching_hosts.side_effect = [['host1', 'host2'], ['host3']]
+
+        _resource_id, rows, _encumbered = (
+            self.fake_phys_plugin.reserve_resource_rows(
+                u'441c1476-9f8f-4700-9f30-cd9b6fef3509', values))
+        _resource_id, rows, _encumbered = (
+            self.fake_phys_plugin.reserve_resource_rows(
+                u'593e7028-c0d1-4d76-8642-2ffd890b324c', values,
+                batch_rows=rows))
+
+        self.assertEqual(['host3'],
+                         [allocation['compute_host_id']
+                          for allocation in rows['computehost_allocations']])
+        matching_hosts.assert_has_calls([
+            mock.call('', '', '1-2', values['start_date'],
+                      values['end_date'], exclude=set()),
+            mock.call('', '', '1-2', values['start_date'],
+                      values['end_date'], exclude=set(['host1', 'host2']))])
+
+    def test_release_resource_rows(self):
+        pool_delete = self.patch(self.nova.ReservationPool, 'delete')
+        remove_allocation = self.patch(availability.BaseAvailability,
+                                       'remove_allocation')
+        rows = {'computehost_reservations': [{'id': '1',
+                                              'aggregate_id': 1}],
+                'computehost_allocations': [{'id': '2',
+                                             'compute_host_id': 'host1'}]}
+
+        release_usage = self.patch(self.fake_phys_plugin, '_release_usage')
+
+        self.fake_phys_plugin.release_resource_rows(
+            u'441c1476-9f8f-4700-9f30-cd9b6fef3509', {}, rows,
+            usage_enforcement=True)
+
+        pool_delete.assert_called_once_with(1)
+        remove_allocation.assert_called_once_with('2')
+        release_usage.assert_not_called()
+
+    def test_release_resource_rows_encumbered(self):
+        self.patch(self.nova.ReservationPool, 'delete')
+        self.patch(availability.BaseAvailability, 'remove_allocation')
+        setup_redis = self.patch(self.fake_phys_plugin, '_setup_redis')
+        release_usage = self.patch(self.fake_phys_plugin, '_release_usage')
+        rows = {'computehost_reservations': [{'id': '1',
+                                              'aggregate_id': 1}],
+                'computehost_allocations': [{'id': '2',
+                                             'compute_host_id': 'host1'}]}
+
+        self.fake_phys_plugin.release_resource_rows(
+            u'441c1476-9f8f-4700-9f30-cd9b6fef3509', {}, rows,
+            encumbered=True, usage_enforcement=True, usage_db_host='db',
+            project_name='project')
+
+        setup_redis.assert_called_once_with('db')
+        release_usage.assert_called_once_with(
+            setup_redis.return_value, {}, ['host1'], 'project')
+
+    def test_create_reservation_host_allocated_concurrently(self):
+        values = {
+            'lease_id': u'018c1b43-e69e-4aef-a543-09681539cf4c',
+            'min': u'2',
+            'max': u'2',
+            'hypervisor_properties': '["=", "$memory_mb", "256"]',
+            'resource_properties': '',
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 00),
+            'resource_type': plugin.RESOURCE_TYPE,
+        }
+        self.rp_create.return_value = mock.MagicMock(id=1)
+        self.patch(self.db_api, 'host_reservation_create')
+        matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
+        matching_hosts.side_effect = [['host1', 'host2'], ['host3']]
+
+        def fake_claim(values, start_date, end_date):
+            if values['compute_host_id'] == 'host2':
+                raise db_exceptions.BlazarDBHostNotFree(host='host2')
+            return {'id': values['compute_host_id'] + '-allocation',
+                    'compute_host_id': values['compute_host_id']}
+
+        host_allocation_claim = self.patch(self.db_api,
+                                           'host_allocation_claim')
+        host_allocation_claim.side_effect = fake_claim
+        backend = self.patch(availability, 'get_backend').return_value
+
+        self.fake_phys_plugin.reserve_resource(
+            u'441c1476-9f8f-4700-9f30-cd9b6fef3509', values)
+
+        matching_hosts.assert_called_with(
+            '["=", "$memory_mb", "256"]', '', '1-1',
+            values['start_date'], values['end_date'],
+            exclude=set(['host1', 'host2']))
+        self.assertEqual(['host1', 'host3'],
+                         [call[0][1] for call
+                          in backend.add_allocation.call_args_list])
+
+    def test_create_reservation_not_enough_hosts_after_retries(self):
+        values = {
+            'lease_id': u'018c1b43-e69e-4aef-a543-09681539cf4c',
+            'min': u'2',
+            'max': u'2',
+            'hypervisor_properties': '["=", "$memory_mb", "256"]',
+            'resource_properties': '',
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 00),
+            'resource_type': plugin.RESOURCE_TYPE,
+        }
+        host_reservation_create = self.patch(self.db_api,
+                                             'host_reservation_create')
+        matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
+        matching_hosts.side_effect = [['host1', 'host2'], []]
+
+        def fake_claim(values, start_date, end_date):
+            if values['compute_host_id'] == 'host2':
+                raise db_exceptions.BlazarDBHostNotFree(host='host2')
+            return {'id': 'allocation1', 'compute_host_id': 'host1'}
+
+        self.patch(self.db_api,
+                   'host_allocation_claim').side_effect = fake_claim
+        host_allocation_destroy = self.patch(self.db_api,
+                                             'host_allocation_destroy')
+
+        self.assertRaises(manager_exceptions.NotEnoughHostsAvailable,
+                          self.fake_phys_plugin.reserve_resource,
+                          u'441c1476-9f8f-4700-9f30-cd9b6fef3509', values)
+        host_allocation_destroy.assert_called_once_with('allocation1',
+                                                        soft_delete=False)
+        self.rp_create.assert_not_called()
+        host_reservation_create.assert_not_called()
+
+    def test_check_reservation(self):
+        values = {
+            'min': u'1',
+            'max': u'2',
+            'hypervisor_properties': '["=", "$memory_mb", "256"]',
+            'resource_properties': '',
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 22, 00),
+            'resource_type': plugin.RESOURCE_TYPE,
+        }
+        host_reservation_create = self.patch(self.db_api,
+                                             'host_reservation_create')
+        host_allocation_create = self.patch(self.db_api,
+                                            'host_allocation_create')
+        matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
+        matching_hosts.return_value = ['host1', 'host2']
+        self.patch(billrate, 'computehost_billrate').return_value = 1.5
+
+        result = self.fake_phys_plugin.check_reservation(values)
+
+        self.assertEqual({'resource_type': plugin.RESOURCE_TYPE,
+                          'hosts': ['host1', 'host2'],
+                          'cost': 6.0}, result)
+        self.rp_create.assert_not_called()
+        host_reservation_create.assert_not_called()
+        host_allocation_create.assert_not_called()
+
+    def test_check_reservation_no_hosts_available(self):
+        values = {
+            'min': u'1',
+            'max': u'1',
+            'hypervisor_properties': '["=", "$memory_mb", "256"]',
+            'resource_properties': '',
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 00),
+            'resource_type': plugin.RESOURCE_TYPE,
+        }
+        matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
+        matching_hosts.return_value = []
+
+        self.assertRaises(manager_exceptions.NotEnoughHostsAvailable,
+                          self.fake_phys_plugin.check_reservation, values)
+
+    def test_check_reservation_update_replaces_busy_hosts(self):
+        values = {
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 23, 00)
+        }
+        self.patch(self.db_api, 'reservation_get').return_value = {
+            'lease_id': u'10870923-6d56-45c9-b592-f788053f5baa',
+            'resource_id': u'91253650-cc34-4c4f-bbe8-c943aa7d0c9b',
+            'status': 'pending',
+        }
+        self.patch(self.db_api, 'lease_get').return_value = {
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 00)
+        }
+        self.patch(self.db_api, 'host_reservation_get').return_value = {
+            'hypervisor_properties': '',
+            'resource_properties': '',
+        }
+        self.patch(
+            self.db_api, 'host_allocation_get_all_by_values').return_value = [
+                {'id': 'allocation1', 'compute_host_id': 'host1'},
+                {'id': 'allocation2', 'compute_host_id': 'host2'}]
+        backend = self.patch(availability, 'get_backend').return_value
+        backend.get_busy_hosts.return_value = ['host2']
+        matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
+        matching_hosts.return_value = ['host3']
+        self.patch(billrate, 'computehost_billrate').return_value = 1.0
+        host_allocation_create = self.patch(self.db_api,
+                                            'host_allocation_create')
+        host_allocation_destroy = self.patch(self.db_api,
+                                             'host_allocation_destroy')
+
+        result = self.fake_phys_plugin.check_reservation_update(
+            u'441c1476-9f8f-4700-9f30-cd9b6fef3509', values)
+
+        self.assertEqual({'resource_type': plugin.RESOURCE_TYPE,
+                          'hosts': ['host1', 'host3'],
+                          'cost': 6.0}, result)
+        matching_hosts.assert_called_once_with(
+            '', '', '1-1',
+            datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 23, 00))
+        host_allocation_create.assert_not_called()
+        host_allocation_destroy.assert_not_called()
+        backend.remove_allocation.assert_not_called()
+        backend.move_reservation.assert_not_called()
 
     def test_create_reservation_with_missing_param_min(self):
         values = {
@@ -639,10 +951,13 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         host_allocation_get_all = self.patch(
             self.db_api,
             'host_allocation_get_all_by_values')
+        self.fake_phys_plugin._hypervisor_hostnames[
+            '706eb3bc-07ed-4383-be93-b32845ece672'] = {'host1': 'host1'}
         self.fake_phys_plugin.update_reservation(
             '706eb3bc-07ed-4383-be93-b32845ece672',
             values)
         host_allocation_get_all.assert_not_called()
+        self.assertEqual({}, self.fake_phys_plugin._hypervisor_hostnames)
 
     def test_update_reservation_shorten_with_usage_enforcement(self):
         project_id = '555'
@@ -716,11 +1031,14 @@ class PhysicalHostPluginTestCase(tests.TestCase):
                 'compute_host_id': 'host1'
             }
         ]
-        get_full_periods = self.patch(self.db_utils, 'get_full_periods')
-        get_full_periods.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 00),
-             datetime.datetime(2013, 12, 19, 21, 00))
-        ]
+        get_full_periods = self.patch(self.db_utils,
+                                      'get_full_periods_by_host')
+        get_full_periods.return_value = {
+            'host1': [
+                (datetime.datetime(2013, 12, 19, 20, 00),
+                 datetime.datetime(2013, 12, 19, 21, 00))
+            ]
+        }
         self.fake_phys_plugin.update_reservation(
             '706eb3bc-07ed-4383-be93-b32845ece672',
             values)
@@ -765,11 +1083,14 @@ class PhysicalHostPluginTestCase(tests.TestCase):
                 'compute_host_id': 'host1'
             }
         ]
-        get_full_periods = self.patch(self.db_utils, 'get_full_periods')
-        get_full_periods.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 00),
-             datetime.datetime(2013, 12, 19, 21, 00))
-        ]
+        get_full_periods = self.patch(self.db_utils,
+                                      'get_full_periods_by_host')
+        get_full_periods.return_value = {
+            'host1': [
+                (datetime.datetime(2013, 12, 19, 20, 00),
+                 datetime.datetime(2013, 12, 19, 21, 00))
+            ]
+        }
         get_computehosts = self.patch(self.rp.ReservationPool,
                                       'get_computehosts')
         get_computehosts.return_value = ['host1']
@@ -825,11 +1146,14 @@ class PhysicalHostPluginTestCase(tests.TestCase):
                 'compute_host_id': 'host1'
             }
         ]
-        get_full_periods = self.patch(self.db_utils, 'get_full_periods')
-        get_full_periods.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 00),
-             datetime.datetime(2013, 12, 19, 21, 00))
-        ]
+        get_full_periods = self.patch(self.db_utils,
+                                      'get_full_periods_by_host')
+        get_full_periods.return_value = {
+            'host1': [
+                (datetime.datetime(2013, 12, 19, 20, 00),
+                 datetime.datetime(2013, 12, 19, 21, 00))
+            ]
+        }
         get_computehosts = self.patch(self.rp.ReservationPool,
                                       'get_computehosts')
         get_computehosts.return_value = ['host1']
@@ -880,11 +1204,14 @@ class PhysicalHostPluginTestCase(tests.TestCase):
                 'compute_host_id': 'host1'
             }
         ]
-        get_full_periods = self.patch(self.db_utils, 'get_full_periods')
-        get_full_periods.return_value = [
-            (datetime.datetime(2013, 12, 20, 20, 30),
-             datetime.datetime(2013, 12, 20, 21, 00))
-        ]
+        get_full_periods = self.patch(self.db_utils,
+                                      'get_full_periods_by_host')
+        get_full_periods.return_value = {
+            'host1': [
+                (datetime.datetime(2013, 12, 20, 20, 30),
+                 datetime.datetime(2013, 12, 20, 21, 00))
+            ]
+        }
         get_computehosts = self.patch(self.nova.ReservationPool,
                                       'get_computehosts')
         get_computehosts.return_value = ['host1']
@@ -925,11 +1252,14 @@ class PhysicalHostPluginTestCase(tests.TestCase):
                 'compute_host_id': 'host1'
             }
         ]
-        get_full_periods = self.patch(self.db_utils, 'get_full_periods')
-        get_full_periods.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 30),
-             datetime.datetime(2013, 12, 19, 21, 00))
-        ]
+        get_full_periods = self.patch(self.db_utils,
+                                      'get_full_periods_by_host')
+        get_full_periods.return_value = {
+            'host1': [
+                (datetime.datetime(2013, 12, 19, 20, 30),
+                 datetime.datetime(2013, 12, 19, 21, 00))
+            ]
+        }
         get_computehosts = self.patch(self.nova.ReservationPool,
                                       'get_computehosts')
         get_computehosts.return_value = []
@@ -974,17 +1304,24 @@ class PhysicalHostPluginTestCase(tests.TestCase):
                 'compute_host_id': 'host1'
             }
         ]
-        host_allocation_create = self.patch(
+        host_allocation_claim = self.patch(
             self.db_api,
-            'host_allocation_create')
+            'host_allocation_claim')
+        host_allocation_claim.return_value = {
+            'id': u'b3b4e6a3-0f4f-4f1f-9d44-b1e8d2f4b3c5',
+            'compute_host_id': 'host2'
+        }
         host_allocation_destroy = self.patch(
             self.db_api,
             'host_allocation_destroy')
-        get_full_periods = self.patch(self.db_utils, 'get_full_periods')
-        get_full_periods.return_value = [
-            (datetime.datetime(2013, 12, 20, 20, 30),
-             datetime.datetime(2013, 12, 20, 21, 00))
-        ]
+        get_full_periods = self.patch(self.db_utils,
+                                      'get_full_periods_by_host')
+        get_full_periods.return_value = {
+            'host1': [
+                (datetime.datetime(2013, 12, 20, 20, 30),
+                 datetime.datetime(2013, 12, 20, 21, 00))
+            ]
+        }
         get_computehosts = self.patch(self.nova.ReservationPool,
                                       'get_computehosts')
         get_computehosts.return_value = ['host1']
@@ -997,11 +1334,13 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             u'91253650-cc34-4c4f-bbe8-c943aa7d0c9b')
         host_allocation_destroy.assert_called_with(
             'dd305477-4df8-4547-87f6-69069ee546a6')
-        host_allocation_create.assert_called_with(
+        host_allocation_claim.assert_called_with(
             {
                 'compute_host_id': 'host2',
                 'reservation_id': '706eb3bc-07ed-4383-be93-b32845ece672'
-            }
+            },
+            datetime.datetime(2013, 12, 20, 20, 00),
+            datetime.datetime(2013, 12, 20, 21, 30)
         )
         self.remove_compute_host.assert_called_with(
             1,
@@ -1024,7 +1363,9 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             {'compute_host_id': 'host1'},
         ]
         host_get = self.patch(self.db_api, 'host_get')
-        host_get.return_value = {'service_name': 'host1_hostname'}
+        host_get.return_value = {'hypervisor_hostname': 'host1_hostname'}
+        self.patch(self.nova.ReservationPool,
+                   'get_computehosts').return_value = []
         add_computehost = self.patch(
             self.nova.ReservationPool, 'add_computehost')
 
@@ -1033,6 +1374,88 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         add_computehost.assert_called_with(
             1, 'host1_hostname')
 
+    def test_on_start_hosts_already_added(self):
+        host_reservation_get = self.patch(self.db_api, 'host_reservation_get')
+        host_reservation_get.return_value = {
+            'reservation_id': u'593e7028-c0d1-4d76-8642-2ffd890b324c',
+            'aggregate_id': 1,
+        }
+        host_allocation_get_all_by_values = self.patch(
+            self.db_api, 'host_allocation_get_all_by_values')
+        host_allocation_get_all_by_values.return_value = [
+            {'compute_host_id': 'host1'},
+            {'compute_host_id': 'host2'},
+            {'compute_host_id': 'host3'},
+        ]
+        host_get = self.patch(self.db_api, 'host_get')
+        host_get.side_effect = lambda host_id: {
+            'hypervisor_hostname': host_id + '_hostname'}
+        self.patch(self.nova.ReservationPool,
+                   'get_computehosts').return_value = ['host1_hostname']
+        add_computehost = self.patch(
+            self.nova.ReservationPool, 'add_computehost')
+        add_computehost.side_effect = [
+            manager_exceptions.AggregateAlreadyHasHost(pool=1,
+                                                       host='host2_hostname'),
+            None]
+        remove_computehost = self.patch(
+            self.nova.ReservationPool, 'remove_computehost')
+
+        self.fake_phys_plugin.on_start(u'04de74e8-193a-49d2-9ab8-cba7b49e45e8')
+
+        add_computehost.assert_has_calls([mock.call(1, 'host2_hostname'),
+                                          mock.call(1, 'host3_hostname')])
+        remove_computehost.assert_not_called()
+
+    def test_prepare_start(self):
+        host_reservation_get = self.patch(self.db_api, 'host_reservation_get')
+        host_reservation_get.return_value = {
+            'reservation_id': u'593e7028-c0d1-4d76-8642-2ffd890b324c',
+            'aggregate_id': 1,
+        }
+        host_allocation_get_all_by_values = self.patch(
+            self.db_api, 'host_allocation_get_all_by_values')
+        host_allocation_get_all_by_values.return_value = [
+            {'compute_host_id': 'host1'},
+        ]
+        host_get = self.patch(self.db_api, 'host_get')
+        host_get.return_value = {'id': 'host1',
+                                 'hypervisor_hostname': 'host1_hostname'}
+        get_aggregate = self.patch(self.nova.ReservationPool,
+                                   'get_aggregate_from_name_or_id')
+        get_computehosts = self.patch(self.nova.ReservationPool,
+                                      'get_computehosts')
+        get_computehosts.side_effect = lambda pool: (
+            [] if pool == 1 else ['host1_hostname'])
+        add_computehost = self.patch(
+            self.nova.ReservationPool, 'add_computehost')
+
+        self.fake_phys_plugin.prepare_start(
+            u'04de74e8-193a-49d2-9ab8-cba7b49e45e8')
+        get_aggregate.assert_called_once_with(1)
+
+        host_get.reset_mock()
+        self.fake_phys_plugin.on_start(u'04de74e8-193a-49d2-9ab8-cba7b49e45e8')
+
+        host_get.assert_not_called()
+        add_computehost.assert_called_once_with(1, 'host1_hostname')
+        self.assertEqual({}, self.fake_phys_plugin._hypervisor_hostnames)
+
+    def test_prepare_start_aggregate_not_found(self):
+        host_reservation_get = self.patch(self.db_api, 'host_reservation_get')
+        host_reservation_get.return_value = {
+            'reservation_id': u'593e7028-c0d1-4d76-8642-2ffd890b324c',
+            'aggregate_id': 1,
+        }
+        get_aggregate = self.patch(self.nova.ReservationPool,
+                                   'get_aggregate_from_name_or_id')
+        get_aggregate.side_effect = manager_exceptions.AggregateNotFound(
+            pool=1)
+
+        self.assertRaises(manager_exceptions.AggregateNotFound,
+                          self.fake_phys_plugin.prepare_start,
+                          u'04de74e8-193a-49d2-9ab8-cba7b49e45e8')
+
     def test_before_end_with_no_action(self):
         host_reservation_get = self.patch(self.db_api, 'host_reservation_get')
         host_reservation_get.return_value = {'before_end': ''}
@@ -1130,6 +1553,9 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         list_servers.return_value = []
         delete_server = self.patch(self.ServerManager, 'delete')
         delete_pool = self.patch(self.nova.ReservationPool, 'delete')
+        self.fake_phys_plugin._hypervisor_hostnames[
+            u'593e7028-c0d1-4d76-8642-2ffd890b324c'] = {
+                u'cdae2a65-236f-475a-977d-f6ad82f828b7': 'host'}
         self.fake_phys_plugin.on_end(u'04de74e8-193a-49d2-9ab8-cba7b49e45e8')
         host_reservation_update.assert_called_with(
             u'04de74e8-193a-49d2-9ab8-cba7b49e45e8', {'status': 'completed'})
@@ -1137,6 +1563,7 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             u'bfa9aa0b-8042-43eb-a4e6-4555838bf64f')
         delete_server.assert_not_called()
         delete_pool.assert_called_with(1)
+        self.assertEqual({}, self.fake_phys_plugin._hypervisor_hostnames)
 
     def test_on_end_with_usage_enforcement(self):
         project_id = '555'
@@ -1220,56 +1647,32 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         self.assertEqual(0.5, float(r.hget('encumbered', project_id)))
 
     def test_matching_hosts_not_allocated_hosts(self):
-        def host_allocation_get_all_by_values(**kwargs):
-            if kwargs['compute_host_id'] == 'host1':
-                return True
         host_get = self.patch(
             self.db_api,
-            'host_get_all_by_queries')
+            'host_get_all_free_in_window')
         host_get.return_value = [
-            {'id': 'host1'},
-            {'id': 'host2'},
-            {'id': 'host3'},
-        ]
-        host_get = self.patch(
-            self.db_api,
-            'host_allocation_get_all_by_values')
-        host_get.side_effect = host_allocation_get_all_by_values
-        host_get = self.patch(
-            self.db_utils,
-            'get_free_periods')
-        host_get.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 00),
-             datetime.datetime(2013, 12, 19, 21, 00)),
+            ({'id': 'host1'}, True),
+            ({'id': 'host2'}, False),
+            ({'id': 'host3'}, False),
         ]
         result = self.fake_phys_plugin._matching_hosts(
             '[]', '[]', '1-3',
             datetime.datetime(2013, 12, 19, 20, 00),
             datetime.datetime(2013, 12, 19, 21, 00))
+        host_get.assert_called_once_with(
+            [],
+            datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00))
         self.assertEqual(['host2', 'host3'], result)
 
     def test_matching_hosts_allocated_hosts(self):
-        def host_allocation_get_all_by_values(**kwargs):
-            if kwargs['compute_host_id'] == 'host1':
-                return True
         host_get = self.patch(
             self.db_api,
-            'host_get_all_by_queries')
+            'host_get_all_free_in_window')
         host_get.return_value = [
-            {'id': 'host1'},
-            {'id': 'host2'},
-            {'id': 'host3'},
-        ]
-        host_get = self.patch(
-            self.db_api,
-            'host_allocation_get_all_by_values')
-        host_get.side_effect = host_allocation_get_all_by_values
-        host_get = self.patch(
-            self.db_utils,
-            'get_free_periods')
-        host_get.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 00),
-             datetime.datetime(2013, 12, 19, 21, 00)),
+            ({'id': 'host1'}, True),
+            ({'id': 'host2'}, False),
+            ({'id': 'host3'}, False),
         ]
         result = self.fake_phys_plugin._matching_hosts(
             '[]', '[]', '3-3',
@@ -1280,7 +1683,7 @@ class PhysicalHostPluginTestCase(tests.TestCase):
     def test_matching_hosts_not_matching(self):
         host_get = self.patch(
             self.db_api,
-            'host_get_all_by_queries')
+            'host_get_all_free_in_window')
         host_get.return_value = []
         result = self.fake_phys_plugin._matching_hosts(
             '["=", "$memory_mb", "2048"]', '[]', '1-1',
@@ -1288,6 +1691,157 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             datetime.datetime(2013, 12, 19, 21, 00))
         self.assertEqual([], result)
 
+    def test_matching_hosts_with_placement_strategy(self):
+        cfg.CONF.set_override('placement_strategy', 'best_fit_by_gap',
+                              group=plugin.RESOURCE_TYPE)
+        self.addCleanup(cfg.CONF.clear_override, 'placement_strategy',
+                        group=plugin.RESOURCE_TYPE)
+        host_get = self.patch(
+            self.db_api,
+            'host_get_all_free_in_window')
+        host_get.return_value = [
+            ({'id': 'host1'}, True),
+            ({'id': 'host2'}, False),
+            ({'id': 'host3'}, True),
+        ]
+        get_adjacent = self.patch(self.db_utils,
+                                  'get_adjacent_allocations_by_host')
+        get_adjacent.return_value = {
+            'host1': (datetime.datetime(2013, 12, 19, 18, 00), None),
+            'host3': (datetime.datetime(2013, 12, 19, 20, 00), None),
+        }
+        result = self.fake_phys_plugin._matching_hosts(
+            '[]', '[]', '1-2',
+            datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00))
+        get_adjacent.assert_called_once_with(
+            ['host1', 'host3'],
+            datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00))
+        self.assertEqual(['host3', 'host1'], result)
+
+    def test_find_earliest_window(self):
+        host_get = self.patch(self.db_api, 'host_get_all_by_queries')
+        host_get.return_value = [{'id': 'host1'}, {'id': 'host2'},
+                                 {'id': 'host3'}]
+        get_free_periods = self.patch(self.db_utils,
+                                      'get_free_periods_by_host')
+        get_free_periods.return_value = {
+            'host1': [(datetime.datetime(2030, 1, 1, 10, 0),
+                       datetime.datetime(2030, 1, 1, 11, 0)),
+                      (datetime.datetime(2030, 1, 1, 14, 0),
+                       datetime.datetime(2030, 1, 2, 0, 0))],
+            'host2': [(datetime.datetime(2030, 1, 1, 10, 30),
+                       datetime.datetime(2030, 1, 2, 0, 0))],
+            'host3': [(datetime.datetime(2030, 1, 1, 12, 0),
+                       datetime.datetime(2030, 1, 2, 0, 0))],
+        }
+        values = {
+            'min': 2,
+            'max': 3,
+            'duration': 60,
+            'hypervisor_properties': '["=", "$memory_mb", "2048"]',
+            'resource_properties': '',
+            'start_date': '2030-01-01 10:00',
+            'end_date': '2030-01-02 00:00',
+        }
+
+        result = self.fake_phys_plugin.find_earliest_window(values)
+
+        host_get.assert_called_once_with(['memory_mb == 2048'])
+        get_free_periods.assert_called_once_with(
+            ['host1', 'host2', 'host3'],
+            datetime.datetime(2030, 1, 1, 10, 0),
+            datetime.datetime(2030, 1, 2, 0, 0),
+            datetime.timedelta(minutes=60))
+        self.assertEqual({'start_date': '2030-01-01 12:00',
+                          'end_date': '2030-01-01 13:00',
+                          'hosts': ['host2', 'host3']}, result)
+
+    def test_find_earliest_window_up_to_max_hosts(self):
+        host_get = self.patch(self.db_api, 'host_get_all_by_queries')
+        host_get.return_value = [{'id': 'host1'}, {'id': 'host2'},
+                                 {'id': 'host3'}, {'id': 'host4'}]
+        get_free_periods = self.patch(self.db_utils,
+                                      'get_free_periods_by_host')
+        get_free_periods.return_value = {
+            'host1': [(datetime.datetime(2030, 1, 1, 10, 0),
+                       datetime.datetime(2030, 1, 2, 0, 0))],
+            'host2': [(datetime.datetime(2030, 1, 1, 12, 0),
+                       datetime.datetime(2030, 1, 2, 0, 0))],
+            'host3': [(datetime.datetime(2030, 1, 1, 12, 0),
+                       datetime.datetime(2030, 1, 2, 0, 0))],
+            'host4': [(datetime.datetime(2030, 1, 1, 12, 0),
+                       datetime.datetime(2030, 1, 2, 0, 0))],
+        }
+        values = {
+            'min': 2,
+            'max': 3,
+            'duration': 60,
+            'hypervisor_properties': '',
+            'resource_properties': '',
+            'start_date': '2030-01-01 10:00',
+            'end_date': '2030-01-02 00:00',
+        }
+
+        result = self.fake_phys_plugin.find_earliest_window(values)
+
+        self.assertEqual({'start_date': '2030-01-01 12:00',
+                          'end_date': '2030-01-01 13:00',
+                          'hosts': ['host1', 'host2', 'host3']}, result)
+
+    def test_find_earliest_window_not_enough_hosts(self):
+        host_get = self.patch(self.db_api, 'host_get_all_by_queries')
+        host_get.return_value = [{'id': 'host1'}]
+        get_free_periods = self.patch(self.db_utils,
+                                      'get_free_periods_by_host')
+        get_free_periods.return_value = {
+            'host1': [(datetime.datetime(2030, 1, 1, 10, 0),
+                       datetime.datetime(2030, 1, 1, 11, 0))]}
+        values = {
+            'min': 1,
+            'max': 1,
+            'duration': 120,
+            'hypervisor_properties': '',
+            'resource_properties': '',
+            'start_date': '2030-01-01 10:00',
+        }
+
+        self.assertRaises(manager_exceptions.NotEnoughHostsAvailable,
+                          self.fake_phys_plugin.find_earliest_window, values)
+        get_free_periods.assert_called_once_with(
+            ['host1'],
+            datetime.datetime(2030, 1, 1, 10, 0),
+            datetime.datetime(2030, 1, 31, 10, 0),
+            datetime.timedelta(minutes=120))
+
+    def test_find_earliest_window_invalid_duration(self):
+        values = {'min': 1, 'max': 1, 'duration': 0}
+        self.assertRaises(manager_exceptions.MalformedParameter,
+                          self.fake_phys_plugin.find_earliest_window, values)
+
+    def test_get_utilization_report(self):
+        get_utilization = self.patch(self.db_utils, 'get_host_utilization')
+        get_utilization.return_value = iter([{'host_id': 'host1'}])
+
+        result = self.fake_phys_plugin.get_utilization_report(
+            {'start_date': '2030-01-01 00:00',
+             'end_date': '2030-02-01 00:00'})
+
+        get_utilization.assert_called_once_with(
+            None, datetime.datetime(2030, 1, 1, 0, 0),
+            datetime.datetime(2030, 2, 1, 0, 0))
+        self.assertEqual([{'host_id': 'host1'}], result)
+
+    def test_get_utilization_report_invalid_period(self):
+        self.assertRaises(manager_exceptions.MissingParameter,
+                          self.fake_phys_plugin.get_utilization_report,
+                          {'start_date': '2030-01-01 00:00'})
+        self.assertRaises(manager_exceptions.InvalidPeriod,
+                          self.fake_phys_plugin.get_utilization_report,
+                          {'start_date': '2030-01-01 00:00',
+                           'end_date': '2030-01-01 00:00'})
+
     def test_check_params_with_valid_before_end(self):
         values = {
             'min': 1,
@@ -13,6 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import json
+
+import fixtures
 
 from blazar.manager import exceptions as manager_exceptions
 from blazar import tests
@@ -70,3 +74,45 @@ class TestPluginsUtils(tests.TestCase):
         self.assertRaises(
             manager_exceptions.MalformedRequirements,
             plugins_utils.convert_requirements, 'something')
+
+    def test_convert_requirements_with_or(self):
+        request = ('["or", [">", "$memory", "4096"], '
+                   '["and", ["=", "$disk", "40"], ["<", "$vcpus", "8"]]]')
+        result = plugins_utils.convert_requirements(request)
+        self.assertEqual(
+            [plugins_utils.Requirements('or', [
+                'memory > 4096',
+                plugins_utils.Requirements('and', ['disk == 40',
+                                                   'vcpus < 8'])])],
+            result)
+        requirement = result[0].children[1].children[0]
+        self.assertEqual(('disk', '==', '40'),
+                         (requirement.key, requirement.op, requirement.value))
+
+    def test_convert_requirements_with_incorrect_nested_syntax(self):
+        self.assertRaises(
+            manager_exceptions.MalformedRequirements,
+            plugins_utils.convert_requirements,
+            '["or", [">", "$memory", "4096"], ["and", []]]')
+
+    def test_compile_requirements_cache(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'blazar.utils.plugins._requirements_cache',
+            collections.OrderedDict()))
+        self.useFixture(fixtures.MonkeyPatch(
+            'blazar.utils.plugins.REQUIREMENTS_CACHE_SIZE', 2))
+        loads = self.patch(json, 'loads')
+        loads.side_effect = json.JSONDecoder().decode
+
+        first = plugins_utils.compile_requirements('["=", "$a", "1"]')
+        self.assertIs(first,
+                      plugins_utils.compile_requirements('["=", "$a", "1"] '))
+        self.assertEqual(1, loads.call_count)
+
+        plugins_utils.compile_requirements('["=", "$b", "1"]')
+        plugins_utils.compile_requirements('["=", "$a", "1"]')
+        plugins_utils.compile_requirements('["=", "$c", "1"]')
+        self.assertEqual(3, loads.call_count)
+        # The least recently used requirements have been evicted
+        self.assertEqual(['["=", "$a", "1"]', '["=", "$c", "1"]'],
+                         list(plugins_utils._requirements_cache))
@@ -0,0 +1,73 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import eventlet
+
+from blazar import tests
+from blazar.utils import pool
+
+
+class TestPool(tests.TestCase):
+
+    def test_evaluate_sequential(self):
+        result = pool.evaluate(lambda x: x * 2, [1, 2, 3])
+        self.assertEqual([(1, 2), (2, 4), (3, 6)], result)
+
+    def test_evaluate_keeps_order(self):
+        def double(x):
+            # The first items finish last
+            eventlet.sleep(0.01 * (4 - x))
+            return x * 2
+
+        result = pool.evaluate(double, [1, 2, 3], pool_size=3)
+        self.assertEqual([(1, 2), (2, 4), (3, 6)], result)
+
+    def test_evaluate_raises(self):
+        def fail(x):
+            raise ValueError(x)
+
+        self.assertRaises(ValueError, pool.evaluate, fail, [1, 2],
+                          pool_size=2)
+
+    def test_run_with_dependencies(self):
+        done = []
+
+        def run(x):
+            # Independent items finish in the reverse order
+            eventlet.sleep(0.01 * (3 - x))
+            done.append(x)
+
+        pool.run_with_dependencies(run, [0, 1, 2],
+                                   [set(), set([2]), set()], 3)
+        self.assertEqual(3, len(done))
+        self.assertTrue(done.index(2) < done.index(1))
+
+    def test_run_with_dependencies_after_error(self):
+        done = []
+
+        def run(x):
+            if x == 0:
+                raise ValueError(x)
+            done.append(x)
+
+        pool.run_with_dependencies(run, [0, 1], [set(), set([0])], 1)
+        self.assertEqual([1], done)
+
+    def test_run_with_cyclic_dependencies(self):
+        done = []
+
+        pool.run_with_dependencies(done.append, [0, 1],
+                                   [set([1]), set([0])], 2)
+        self.assertEqual(set([0, 1]), set(done))
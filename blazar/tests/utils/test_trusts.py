@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+
 import mock
 
 from blazar import context
@@ -62,6 +64,27 @@ class TestTrusts(tests.TestCase):
 
         self.assertEqual(fake_ctx_dict, ctx.__dict__)
 
+    def test_create_ctx_from_prefetched_trust(self):
+        self.addCleanup(self.trusts._prefetched_auth.clear)
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+        self.trusts.prefetch_ctx_from_trust('1', expires_at)
+        self.client.reset_mock()
+        ctx = self.trusts.create_ctx_from_trust('1')
+
+        self.client.assert_not_called()
+        self.assertEqual(self.client().auth_token, ctx.auth_token)
+
+    def test_create_ctx_from_expired_prefetched_trust(self):
+        self.addCleanup(self.trusts._prefetched_auth.clear)
+        expires_at = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+
+        self.trusts.prefetch_ctx_from_trust('1', expires_at)
+        self.client.reset_mock()
+        self.trusts.create_ctx_from_trust('1')
+
+        self.assertEqual(1, self.client.call_count)
+
     def test_use_trust_auth_dict(self):
         def to_wrap(self, arg_to_update):
             return arg_to_update
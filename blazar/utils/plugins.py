@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import json
 
 import six
@@ -20,13 +21,90 @@ import six
 from blazar.manager import exceptions as manager_ex
 
 
-def convert_requirements(requirements):
-    """Convert the requirements to an array of strings
+# Number of compiled requirements kept in memory
+REQUIREMENTS_CACHE_SIZE = 256
 
-    Convert the requirements to an array of strings.
-    ["key op value", "key op value", ...]
+_requirements_cache = collections.OrderedDict()
+
+
+class Requirement(six.text_type):
+    """A single requirement, like "memory_mb >= 4096".
+
+    It is the "key op value" query accepted by host_get_all_by_queries, with
+    its three parts available as attributes.
+    """
+
+    def __new__(cls, key, op, value):
+        requirement = super(Requirement, cls).__new__(
+            cls, u' '.join((key, op, value)))
+        requirement.key = key
+        requirement.op = op
+        requirement.value = value
+        return requirement
+
+
+class Requirements(object):
+    """A group of requirements combined with "and" or "or".
+
+    The children are Requirement or nested Requirements objects. Compiled
+    requirements are shared between callers and must not be modified.
+    """
+
+    def __init__(self, operator, children):
+        self.operator = operator
+        self.children = tuple(children)
+
+    def __eq__(self, other):
+        return (isinstance(other, Requirements) and
+                (self.operator, self.children) ==
+                (other.operator, other.children))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Requirements(%r, %r)' % (self.operator, list(self.children))
+
+    def queries(self):
+        """Return the requirements as an array of queries.
+
+        The queries of the array are all to be satisfied, as expected by
+        host_get_all_by_queries. A conjunction of single requirements is
+        flattened, anything else is kept as a single query object.
+        """
+        if self.operator == 'and' and all(
+                isinstance(child, Requirement) for child in self.children):
+            return list(self.children)
+        return [self]
+
+
+def compile_requirements(requirements):
+    """Compile requirements to a Requirements object.
+
+    The requirements are a JSON list, or its text, like
+    ["and", [">=", "$memory_mb", "4096"], ["or", ...]]. The result of the
+    compilation of a text is cached, so that identical requirements are only
+    parsed once.
     """
-    # TODO(frossigneux) Support the "or" operator
+    if isinstance(requirements, six.string_types):
+        key = requirements.strip()
+    else:
+        try:
+            key = json.dumps(requirements, sort_keys=True)
+        except (TypeError, ValueError):
+            raise manager_ex.MalformedRequirements(rqrms=requirements)
+
+    try:
+        compiled = _requirements_cache.pop(key)
+    except KeyError:
+        compiled = _compile(requirements)
+        if len(_requirements_cache) >= REQUIREMENTS_CACHE_SIZE:
+            _requirements_cache.popitem(last=False)
+    _requirements_cache[key] = compiled
+    return compiled
+
+
+def _compile(requirements):
     # Convert text to json
     if isinstance(requirements, six.string_types):
         try:
@@ -34,24 +112,41 @@ def convert_requirements(requirements):
         except ValueError:
             raise manager_ex.MalformedRequirements(rqrms=requirements)
 
+    # Empty requirement list
+    if isinstance(requirements, list) and not requirements:
+        return Requirements('and', [])
+    node = _compile_node(requirements)
+    if node is None:
+        raise manager_ex.MalformedRequirements(rqrms=requirements)
+    if isinstance(node, Requirement):
+        node = Requirements('and', [node])
+    return node
+
+
+def _compile_node(requirements):
+    """Return the compiled requirements, or None if malformed."""
     # Requirement list looks like ['<', '$ram', '1024']
     if _requirements_with_three_elements(requirements):
-        result = []
-        if requirements[0] == '=':
-            requirements[0] = '=='
-        string = (requirements[1][1:] + " " + requirements[0] + " " +
-                  requirements[2])
-        result.append(string)
-        return result
-    # Remove the 'and' element at the head of the requirement list
-    elif _requirements_with_and_keyword(requirements):
-        return [convert_requirements(x)[0] for x in requirements[1:]]
-
-    # Empty requirement list0
-    elif isinstance(requirements, list) and not requirements:
-        return requirements
-    else:
-        raise manager_ex.MalformedRequirements(rqrms=requirements)
+        op = '==' if requirements[0] == '=' else requirements[0]
+        return Requirement(requirements[1][1:], op, requirements[2])
+    # Requirement list looks like ['and', [...], [...]]
+    elif _requirements_with_keyword(requirements):
+        children = [_compile_node(x) for x in requirements[1:]]
+        if None in children:
+            return None
+        return Requirements(requirements[0], children)
+    return None
+
+
+def convert_requirements(requirements):
+    """Convert the requirements to an array of queries
+
+    Convert the requirements to an array of queries which must all be
+    satisfied, as accepted by host_get_all_by_queries:
+    ["key op value", "key op value", ...]
+    Requirements using "or" are converted to a single query object.
+    """
+    return compile_requirements(requirements).queries()
 
 
 def _requirements_with_three_elements(requirements):
@@ -66,8 +161,9 @@ def _requirements_with_three_elements(requirements):
             len(requirements[2]) > 0)
 
 
-def _requirements_with_and_keyword(requirements):
-    return (len(requirements) > 1 and
+def _requirements_with_keyword(requirements):
+    """Return true if requirement list looks like ['and', [...], ...]."""
+    return (isinstance(requirements, list) and
+            len(requirements) > 1 and
             isinstance(requirements[0], six.string_types) and
-            requirements[0] == 'and' and
-            all(convert_requirements(x) for x in requirements[1:]))
+            requirements[0] in ['and', 'or'])
@@ -0,0 +1,92 @@
+# Copyright (c) 2026 University of Chicago.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+import eventlet
+from eventlet import queue
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def evaluate(func, items, pool_size=1):
+    """Call func on every item, at most pool_size calls running at a time.
+
+    Returns the list of the (item, result) pairs in the order of items, so
+    that the outcome does not depend on which call finishes first.
+
+    Green threads only overlap when func yields to the hub while waiting,
+    e.g. queries sent with a pure Python database driver.
+    """
+    items = list(items)
+    if pool_size <= 1:
+        return [(item, func(item)) for item in items]
+
+    pool = eventlet.GreenPool(pool_size)
+    return list(zip(items, pool.imap(func, items)))
+
+
+def run_with_dependencies(func, items, dependencies, pool_size):
+    """Call func on every item once the items it depends on are done.
+
+    At most pool_size calls run at a time, in green threads. func should
+    handle its errors: an exception is logged and the items depending on
+    the item are run anyway.
+
+    :param dependencies: list of sets, the indexes of the items which must
+        be done before the item at the same index.
+    """
+    waiting = [len(deps) for deps in dependencies]
+    dependents = [[] for _item in items]
+    for index, deps in enumerate(dependencies):
+        for dep in deps:
+            dependents[dep].append(index)
+
+    pool = eventlet.GreenPool(pool_size)
+    done = queue.LightQueue()
+
+    def run(index):
+        try:
+            func(items[index])
+        except Exception:
+            LOG.exception('Error occurred while running %s.', items[index])
+        finally:
+            done.put(index)
+
+    ready = collections.deque(index for index, count in enumerate(waiting)
+                              if count == 0)
+    remaining = len(items)
+    running = 0
+    while remaining:
+        if not ready and not running:
+            # Only a cycle in the dependencies can lead here: break it by
+            # running the first waiting item.
+            index = next(index for index, count in enumerate(waiting)
+                         if count > 0)
+            LOG.warning('Cyclic dependencies, running %s first.',
+                        items[index])
+            waiting[index] = 0
+            ready.append(index)
+        while ready:
+            pool.spawn_n(run, ready.popleft())
+            running += 1
+        index = done.get()
+        running -= 1
+        remaining -= 1
+        for dependent in dependents[index]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                ready.append(dependent)
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
 import functools
 
 from oslo_config import cfg
@@ -22,6 +23,10 @@ from blazar.utils.openstack import keystone
 
 CONF = cfg.CONF
 
+# Authentication prefetched for upcoming events: trust ID -> (expiry date,
+# context values)
+_prefetched_auth = {}
+
 
 def create_trust():
     """Creates trust via Keystone API v3 to use in plugins."""
@@ -48,12 +53,14 @@ def delete_trust(lease):
         client.trusts.delete(lease.trust_id)
 
 
-def create_ctx_from_trust(trust_id):
-    """Return context built from given trust."""
-    ctx = context.BlazarContext(
+def _admin_ctx():
+    return context.BlazarContext(
         user_name=CONF.os_admin_username,
         project_name=CONF.os_admin_project_name,
     )
+
+
+def _authenticate_trust(trust_id, ctx):
     auth_url = "%s://%s:%s/%s" % (CONF.os_auth_protocol,
                                   CONF.os_auth_host,
                                   CONF.os_auth_port,
@@ -64,14 +71,36 @@ def create_ctx_from_trust(trust_id):
         auth_url=auth_url,
         ctx=ctx,
     )
+    return {
+        'auth_token': client.auth_token,
+        'service_catalog': client.service_catalog.catalog['catalog'],
+        'project_id': client.tenant_id,
+    }
+
+
+def prefetch_ctx_from_trust(trust_id, expires_at):
+    """Authenticate with a trust now, for contexts created until expires_at.
+
+    Used to prepare the events due soon, so that they do not wait for
+    Keystone. expires_at must be earlier than the expiry of the token.
+    """
+    now = datetime.datetime.utcnow()
+    for expired in [key for key, (expiry, _auth) in _prefetched_auth.items()
+                    if expiry <= now]:
+        del _prefetched_auth[expired]
+    _prefetched_auth[trust_id] = (expires_at,
+                                  _authenticate_trust(trust_id, _admin_ctx()))
+
+
+def create_ctx_from_trust(trust_id):
+    """Return context built from given trust."""
+    ctx = _admin_ctx()
+    expires_at, auth = _prefetched_auth.get(trust_id, (None, None))
+    if expires_at is None or expires_at <= datetime.datetime.utcnow():
+        auth = _authenticate_trust(trust_id, ctx)
 
     # use 'with ctx' statement in the place you need context from trust
-    return context.BlazarContext(
-        ctx,
-        auth_token=client.auth_token,
-        service_catalog=client.service_catalog.catalog['catalog'],
-        project_id=client.tenant_id,
-    )
+    return context.BlazarContext(ctx, **auth)
 
 
 def use_trust_auth():